@@ -5,12 +5,17 @@ import asyncio
 import logging
 import os
 import re
+import time
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple
 
 import httpx
 
-from database import AFFILIATE_PRODUCTS, PRODUCTS, db
+from change_detection import WriteTracker, set_if_changed
+import repository
+from database import AFFILIATE_PRODUCTS, PRODUCTS
+from deal_service import get_deal_service
+from metrics import record_sync, track_integration
 
 logger = logging.getLogger(__name__)
 
@@ -42,11 +47,15 @@ class AffiliateService:
         self.amazon_host = os.getenv(
             "RAPIDAPI_AMAZON_HOST", "amazon-data-scraper126.p.rapidapi.com"
         )
+        self.amazon_base_url = os.getenv(
+            "RAPIDAPI_AMAZON_BASE_URL", f"https://{self.amazon_host}"
+        ).rstrip("/")
         self.amazon_min_rating = float(os.getenv("AMAZON_MIN_RATING", "4.0"))
         self.amazon_min_reviews = int(os.getenv("AMAZON_MIN_REVIEWS", "50"))
         self.amazon_sync_interval = int(os.getenv("AMAZON_SYNC_INTERVAL_SECONDS", "86400"))
         self.amazon_sync_interval = int(os.getenv("AMAZON_SYNC_INTERVAL_SECONDS", "86400"))
         self.amazon_sync_enabled = bool(self.amazon_api_key)
+        self.deal_service = get_deal_service()
         
         # Vetted Vendors (Can be moved to DB/Env later)
         self.vetted_vendors = [
@@ -67,7 +76,7 @@ class AffiliateService:
         if not self.amazon_api_key:
             return []
 
-        url = f"https://{self.amazon_host}/search"
+        url = f"{self.amazon_base_url}/search"
         headers = {
             "X-RapidAPI-Key": self.amazon_api_key,
             "X-RapidAPI-Host": self.amazon_host,
@@ -76,7 +85,9 @@ class AffiliateService:
 
         try:
             async with httpx.AsyncClient(timeout=20) as client:
-                response = await client.get(url, headers=headers, params=params)
+                with track_integration("rapidapi", "search") as call:
+                    response = await client.get(url, headers=headers, params=params)
+                    call.status = response.status_code
                 if response.status_code == 200:
                     data = response.json()
                     return data.get("results", data.get("items", []))
@@ -88,7 +99,7 @@ class AffiliateService:
     async def get_amazon_product_details(self, asin: str) -> Optional[Dict[str, Any]]:
         if not self.amazon_api_key:
             return None
-        url = f"https://{self.amazon_host}/product/{asin}"
+        url = f"{self.amazon_base_url}/product/{asin}"
         headers = {
             "X-RapidAPI-Key": self.amazon_api_key,
             "X-RapidAPI-Host": self.amazon_host,
@@ -96,7 +107,9 @@ class AffiliateService:
         params = {"country": "CA"}
         try:
             async with httpx.AsyncClient(timeout=20) as client:
-                response = await client.get(url, headers=headers, params=params)
+                with track_integration("rapidapi", "product") as call:
+                    response = await client.get(url, headers=headers, params=params)
+                    call.status = response.status_code
                 if response.status_code == 200:
                     return response.json()
         except Exception as exc:
@@ -111,17 +124,30 @@ class AffiliateService:
         if not self.amazon_sync_enabled:
             return 0
 
+        started = time.perf_counter()
         total = 0
+        tracker = WriteTracker()
         for query, game in AMAZON_TCG_QUERIES:
             results = await self.search_amazon_product(query)
             for result in results:
                 normalized = self._normalize_amazon_result(result, game)
                 if not normalized:
                     continue
-                product_id = self._upsert_product(normalized)
-                self._upsert_amazon_listing(product_id, normalized)
+                product_id = await self._upsert_product(normalized)
+                await self._upsert_amazon_listing(product_id, normalized, tracker)
                 total += 1
-        logger.info("Amazon sync completed with %s listings", total)
+        logger.info(
+            "Amazon sync completed with %s listings (%s written, %s unchanged)",
+            total,
+            tracker.written,
+            tracker.skipped,
+        )
+        record_sync(
+            "amazon",
+            "full",
+            time.perf_counter() - started,
+            {"written": tracker.written, "skipped": tracker.skipped},
+        )
         return total
 
     def _normalize_amazon_result(
@@ -229,41 +255,22 @@ class AffiliateService:
         return "available"
 
     async def _upsert_product(self, normalized: Dict[str, Any]) -> str:
-        # Note: stream() returns an async iterator in our Mock DB, so we use async for
-        # But for real Firestore Sync client, it's sync.
-        # Since we are moving to Async, we should treat db as AsyncClient.
-        # However, database.py creates a Sync client by default.
-        # We need to ensure we are using the Async compatible methods.
-        
-        query = (
-            db.collection(PRODUCTS)
-            .where("name", "==", normalized["title"])
-            .limit(1)
-        )
-        
-        product_id = None
-        # Handle both async stream (Mock) and sync stream (Real Sync Client)
-        # This is tricky. If db is Sync, we can't await.
-        # But main.py injects AsyncClient. 
-        # database.py 'db' object is a Proxy.
-        # Let's assume we are fully Async now for this flow.
-        
-        # In Mock DB, stream() returns self (AsyncIterator).
-        async for doc in query.stream():
-            product_id = doc.id
-            await doc.reference.update(
+        existing = await repository.find_one(PRODUCTS, [("name", "==", normalized["title"])])
+        if existing:
+            product_id = existing["id"]
+            await repository.update_doc(
+                PRODUCTS,
+                product_id,
                 {
                     "updated_at": datetime.utcnow(),
                     "image_url": normalized["image"],
                     "category": normalized["game"],
                     "segment": "sealed",
-                }
+                },
             )
-            break
-
-        if not product_id:
-            ref = db.collection(PRODUCTS).document()
-            await ref.set(
+        else:
+            product_id = await repository.add_doc(
+                PRODUCTS,
                 {
                     "name": normalized["title"],
                     "description": normalized["description"],
@@ -273,13 +280,17 @@ class AffiliateService:
                     "created_at": datetime.utcnow(),
                     "updated_at": datetime.utcnow(),
                     "total_sales": 0,
-                }
+                },
             )
-            product_id = ref.id
 
         return product_id
 
-    async def _upsert_amazon_listing(self, product_id: str, normalized: Dict[str, Any]):
+    async def _upsert_amazon_listing(
+        self,
+        product_id: str,
+        normalized: Dict[str, Any],
+        tracker: Optional[WriteTracker] = None,
+    ) -> bool:
         doc_id = f"amazon_{normalized['asin']}"
         affiliate_url = self.build_amazon_affiliate_url(normalized["asin"])
         data = {
@@ -302,26 +313,23 @@ class AffiliateService:
             "images": [normalized["image"]] if normalized["image"] else [],
             "description": normalized["description"],
             "status": "active",
-            "updated_at": datetime.utcnow(),
         }
-        listing_ref = db.collection(AFFILIATE_PRODUCTS).document(doc_id)
-        existing = await listing_ref.get()
-        if existing.exists:
-            data["created_at"] = existing.to_dict().get("created_at")
-        else:
-            data["created_at"] = datetime.utcnow()
-        await listing_ref.set(data)
+        if not await set_if_changed(AFFILIATE_PRODUCTS, doc_id, data, tracker):
+            return False
+        await self.deal_service.observe_listing(
+            product_id, doc_id, data["price"], data["in_stock"], data
+        )
+        return True
 
     # ------------------------------------------------------------------
     # Price refresh
     # ------------------------------------------------------------------
     async def update_affiliate_prices(self):
         """Lightweight price refresh for Amazon listings."""
-        amazon_docs = db.collection(AFFILIATE_PRODUCTS).where(
-            "affiliate_name", "==", "Amazon.ca"
-        ).stream()
-        for doc in amazon_docs:
-            listing = doc.to_dict()
+        amazon_listings = repository.stream(
+            AFFILIATE_PRODUCTS, [("affiliate_name", "==", "Amazon.ca")]
+        )
+        async for listing in amazon_listings:
             asin = listing.get("asin")
             if not asin:
                 continue
@@ -329,12 +337,22 @@ class AffiliateService:
             if details:
                 price = self._parse_price(details.get("price") or "")
                 stock = details.get("in_stock", True)
-                doc.reference.update(
+                await repository.update_doc(
+                    AFFILIATE_PRODUCTS,
+                    listing["id"],
                     {
                         "price": price or listing.get("price", 0),
                         "in_stock": bool(stock),
+                        "content_hash": None,
                         "updated_at": datetime.utcnow(),
-                    }
+                    },
+                )
+                await self.deal_service.observe_listing(
+                    listing.get("product_id"),
+                    listing["id"],
+                    price or listing.get("price", 0),
+                    bool(stock),
+                    listing,
                 )
 
     # ------------------------------------------------------------------
@@ -474,7 +492,10 @@ class AffiliateService:
             "created_at": datetime.utcnow()
         }
         
-        await db.collection(AFFILIATE_PRODUCTS).document(doc_id).set(data)
+        await repository.set_doc(AFFILIATE_PRODUCTS, doc_id, data)
+        await self.deal_service.observe_listing(
+            product_id, doc_id, data["price"], data["in_stock"], data
+        )
         
         return {**normalized, "id": product_id}
 
@@ -2,6 +2,7 @@ import logging
 from typing import Dict, Any, List, Optional
 from analytics_service import AnalyticsService
 from google.cloud import firestore
+from user_cache import get_user_cache
 
 logger = logging.getLogger(__name__)
 
@@ -96,6 +97,7 @@ class AgentService:
                     await user_ref.update({
                         "preferences.intent_tags": firestore.ArrayUnion(["investor"])
                     })
+                    get_user_cache().invalidate(context["user_id"])
                 except Exception as e:
                     logger.error(f"Failed to update user preferences: {e}")
             
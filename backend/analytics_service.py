@@ -1,27 +1,43 @@
 import logging
-from typing import Dict, Any
+from functools import lru_cache
+from typing import Dict, Any, List
 from datetime import datetime
 
+from event_sink import EventSink
+
 logger = logging.getLogger(__name__)
 
 class AnalyticsService:
-    def __init__(self):
-        # In production, initialize BigQuery client here
-        # self.client = bigquery.Client()
-        pass
+    def __init__(self, sink: EventSink = None):
+        # Events are buffered and streamed to BigQuery in batches by the sink
+        self.sink = sink or get_event_sink()
 
     async def log_event(self, dataset: str, table: str, data: Dict[str, Any]):
         """
-        Stream an event to BigQuery.
+        Queue an event for BigQuery. Never waits on the network.
         """
         try:
             # Ensure timestamp exists
             if "timestamp" not in data:
                 data["timestamp"] = datetime.utcnow().isoformat()
-            
-            logger.info(f"ANALYTICS: Streaming to {dataset}.{table}: {data}")
-            # errors = self.client.insert_rows_json(f"{dataset}.{table}", [data])
-            # if errors:
-            #     logger.error(f"ANALYTICS: BigQuery errors: {errors}")
+            self.sink.emit(dataset, table, data)
         except Exception as e:
             logger.error(f"ANALYTICS: Failed to log event: {e}")
+
+    @staticmethod
+    async def insert_rows(dataset: str, table: str, rows: List[Dict[str, Any]]):
+        """
+        Stream a batch of rows to BigQuery (called by the event sink worker).
+        """
+        # In production, initialize BigQuery client here
+        # client = bigquery.Client()
+        logger.info("ANALYTICS: Streaming %s rows to %s.%s", len(rows), dataset, table)
+        # errors = await asyncio.to_thread(client.insert_rows_json, f"{dataset}.{table}", rows)
+        # if errors:
+        #     raise RuntimeError(f"BigQuery errors: {errors}")
+
+
+@lru_cache(maxsize=1)
+def get_event_sink() -> EventSink:
+    """Shared sink so audit and chat events share one buffer and flush worker."""
+    return EventSink(writer=AnalyticsService.insert_rows)
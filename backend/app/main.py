@@ -5,13 +5,14 @@ TCG Marketplace with Shopify OAuth, Cart Optimization, and Split Checkout
 import asyncio
 from fastapi import FastAPI, HTTPException, Request, Depends, BackgroundTasks, status, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, JSONResponse, Response, FileResponse
 from datetime import datetime, timedelta
 from decimal import Decimal
 from typing import List, Optional, Dict, Any
 import logging
 import os
 import json
+import re
 import httpx
 import hmac
 import hashlib
@@ -37,7 +38,26 @@ from email_service import EmailService
 from niche_config import get_niche_config, NicheSettings
 from agent_service import AgentService
 from market_data_service import MarketDataService
-from security import verify_password, get_password_hash, create_access_token
+from deal_service import get_deal_service
+from user_cache import get_user_cache
+from stripe_client import get_stripe_client
+from change_detection import set_if_changed
+import repository
+from middleware.audit import AuditMiddleware
+import metrics
+from profiler import StackSampler, get_profile_store
+from trace_capture import get_trace_recorder
+from fast_json import FastJSONResponse, trusted_json
+from catalog_cache import PRODUCT_DETAIL_CACHE_CONTROL, PRODUCTS_CACHE_CONTROL, get_catalog_etags
+from loop_monitor import LoopLagMonitor
+from webhook_queue import WebhookQueue
+from analytics_service import get_event_sink
+from sync_orchestrator import SyncOrchestrator, nightly_sync_loop
+from security import (
+    create_access_token,
+    get_password_hash_async,
+    verify_and_update_password_async,
+)
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 
@@ -67,7 +87,8 @@ _storage_client: Optional[storage.Client] = None
 _firestore_client: Optional[firestore.AsyncClient] = None
 
 
-app = FastAPI(title="GeoCheapest v2 API", version="2.0.0")
+# orjson rendering for every route; see fast_json for the opt-in that also skips re-encoding
+app = FastAPI(title="GeoCheapest v2 API", version="2.0.0", default_response_class=FastJSONResponse)
 
 # CORS Configuration
 app.add_middleware(
@@ -82,22 +103,8 @@ app.add_middleware(
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-# Logging Middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = datetime.utcnow()
-    response = await call_next(request)
-    duration = (datetime.utcnow() - start_time).total_seconds()
-    
-    log_data = {
-        "method": request.method,
-        "path": request.url.path,
-        "status_code": response.status_code,
-        "duration": duration,
-        "ip": request.client.host
-    }
-    logger.info(json.dumps(log_data))
-    return response
+# Access logging, audit trail and request timing
+app.add_middleware(AuditMiddleware)
 
 # Environment Variables
 SHOPIFY_API_KEY = os.getenv("SHOPIFY_API_KEY")
@@ -121,13 +128,22 @@ affiliate_service = AffiliateService()
 email_service = EmailService()
 agent_service = AgentService()
 market_service = MarketDataService()
+deal_service = get_deal_service()
+user_cache = get_user_cache()
+stripe_client = get_stripe_client()
+webhook_queue = WebhookQueue()
+event_sink = get_event_sink()
+loop_monitor = LoopLagMonitor()
+sync_orchestrator = SyncOrchestrator(shopify_service)
 
 _amazon_task: Optional[asyncio.Task] = None
+_profile_lock = asyncio.Lock()
+_nightly_sync_task: Optional[asyncio.Task] = None
 
 
 @app.on_event("startup")
 async def on_startup():
-    global _storage_client, _firestore_client, _amazon_task
+    global _storage_client, _firestore_client, _amazon_task, _nightly_sync_task
     try:
         # We don't need to init firestore here anymore as we use database.py
         # But we might need storage client
@@ -143,11 +159,23 @@ async def on_startup():
         _amazon_task = asyncio.create_task(
             amazon_sync_loop(affiliate_service)
         )
+    if os.getenv("SHOPIFY_NIGHTLY_SYNC_ENABLED", "true").lower() == "true":
+        _nightly_sync_task = asyncio.create_task(
+            nightly_sync_loop(sync_orchestrator)
+        )
+    webhook_queue.register("shopify", process_shopify_webhook)
+    webhook_queue.register("stripe", process_stripe_event)
+    await webhook_queue.start()
+    await event_sink.start()
+    if os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true":
+        await loop_monitor.start()
+    if os.getenv("TRACE_CAPTURE_ENABLED", "false").lower() == "true":
+        get_trace_recorder().start(seconds=float(os.getenv("TRACE_CAPTURE_SECONDS", "0")) or None)
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    global _firestore_client, _amazon_task
+    global _firestore_client, _amazon_task, _nightly_sync_task
     if _firestore_client is not None:
         try:
             await _firestore_client.close()
@@ -163,6 +191,18 @@ async def on_shutdown():
             pass
         finally:
             _amazon_task = None
+    if _nightly_sync_task:
+        _nightly_sync_task.cancel()
+        try:
+            await _nightly_sync_task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            _nightly_sync_task = None
+    await webhook_queue.stop()
+    await event_sink.stop()
+    await loop_monitor.stop()
+    await asyncio.to_thread(get_trace_recorder().stop)
 
 
 def _ensure_gcp():
@@ -245,6 +285,15 @@ async def health_check(_: firestore.AsyncClient = Depends(get_db)):
         "timestamp": datetime.utcnow().isoformat()
     }
 
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Prometheus scrape endpoint (bearer token required when METRICS_TOKEN is set)"""
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 # ==================== AUTHENTICATION ====================
 
 async def get_current_user(
@@ -264,20 +313,29 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    # In a real app, we'd query by ID, but here we use email as key or query
-    users_ref = db.collection("users")
-    query = users_ref.where("email", "==", email).limit(1)
-    docs = query.stream()
+    cache_key = user_cache.key(email, payload.get("jti"))
+    user_data = user_cache.get(cache_key)
+    if user_data is not None:
+        return User(**user_data)
     
-    user_data = None
-    async for doc in docs:
-        user_data = doc.to_dict()
-        user_data["id"] = doc.id
-        break
+    users_ref = db.collection("users")
+    user_id = payload.get("uid")
+    if user_id:
+        # Newer tokens carry the user id, so this is a point read
+        doc = await users_ref.document(user_id).get()
+        if doc.exists and doc.to_dict().get("email") == email:
+            user_data = {**doc.to_dict(), "id": doc.id}
+    else:
+        query = users_ref.where("email", "==", email).limit(1)
+        async for doc in query.stream():
+            user_data = doc.to_dict()
+            user_data["id"] = doc.id
+            break
     
     if user_data is None:
         raise credentials_exception
-        
+    
+    user_cache.put(cache_key, user_data)
     return User(**user_data)
 
 
@@ -299,7 +357,7 @@ async def signup(
     # Create user
     user_data = {
         "email": user_in.email,
-        "hashed_password": get_password_hash(user_in.password),
+        "hashed_password": await get_password_hash_async(user_in.password),
         "full_name": user_in.full_name,
         "is_active": True,
         "is_superuser": False,
@@ -314,7 +372,7 @@ async def signup(
     background_tasks = BackgroundTasks()
     background_tasks.add_task(email_service.send_welcome_email, user_in.email, user_in.full_name or "User")
     
-    access_token = create_access_token(subject=user_in.email)
+    access_token = create_access_token(subject=user_in.email, user_id=new_user_ref.id)
     return JSONResponse(
         content={"access_token": access_token, "token_type": "bearer"},
         background=background_tasks
@@ -363,18 +421,29 @@ async def login_for_access_token(
     docs = query.stream()
     
     user_data = None
+    user_doc = None
     async for doc in docs:
         user_data = doc.to_dict()
+        user_doc = doc
         break
     
-    if not user_data or not verify_password(form_data.password, user_data["hashed_password"]):
+    valid, new_hash = False, None
+    if user_data:
+        valid, new_hash = await verify_and_update_password_async(
+            form_data.password, user_data["hashed_password"]
+        )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash used an outdated cost; upgrade it transparently
+        await user_doc.reference.update({"hashed_password": new_hash, "updated_at": datetime.utcnow()})
+        user_cache.invalidate(user_doc.id)
     
-    access_token = create_access_token(subject=user_data["email"])
+    access_token = create_access_token(subject=user_data["email"], user_id=user_doc.id)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -415,8 +484,8 @@ async def delete_user_account(
         "hashed_password": "deleted",
         "deleted_at": datetime.utcnow()
     })
-    host = request.headers.get("host", "")
-    return get_niche_config(host)
+    user_cache.invalidate(current_user.id)
+    return {"status": "deleted"}
 
 @app.get("/api/agent/welcome")
 async def agent_welcome(
@@ -497,7 +566,6 @@ async def shopify_callback(
     shop: str,
     code: str,
     state: str,
-    background_tasks: BackgroundTasks,
     db: firestore.AsyncClient = Depends(get_db)
 ):
     """
@@ -516,7 +584,7 @@ async def shopify_callback(
     # Exchange code for access token
     async with httpx.AsyncClient() as client:
         response = await client.post(
-            f"https://{shop}/admin/oauth/access_token",
+            shopify_service.shop_url(shop, "admin/oauth/access_token"),
             json={
                 "client_id": SHOPIFY_API_KEY,
                 "client_secret": SHOPIFY_API_SECRET,
@@ -574,7 +642,7 @@ async def shopify_callback(
     
     # Register required webhooks then trigger initial sync
     await shopify_service.ensure_webhooks(shop, access_token)
-    background_tasks.add_task(shopify_service.sync_products, shop)
+    sync_orchestrator.schedule(shop, "full")
     
     # Generate Stripe onboarding link if possible
     frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
@@ -614,25 +682,130 @@ async def shopify_webhook(
     if hmac_header != computed_hmac:
         raise HTTPException(status_code=401, detail="Invalid webhook signature")
     
-    # Process webhook
+    # Queue for the webhook workers and ack before Shopify's timeout
     topic = request.headers.get("X-Shopify-Topic")
     shop = request.headers.get("X-Shopify-Shop-Domain")
     data = await request.json()
     
+    await webhook_queue.enqueue(
+        "shopify",
+        topic,
+        {"shop": shop, "data": data},
+        dedup_id=request.headers.get("X-Shopify-Webhook-Id"),
+        coalesce_key=shopify_service.webhook_coalesce_key(shop, topic, data),
+        version=data.get("updated_at"),
+    )
+    return {"status": "queued"}
+
+
+async def process_shopify_webhook(topic: str, payload: Dict[str, Any]):
+    """Webhook queue handler for verified Shopify payloads."""
+    shop = payload["shop"]
+    data = payload["data"]
+    
     if topic in ("products/create", "products/update"):
         await shopify_service.sync_single_product(shop, data)
     elif topic == "products/delete":
         await shopify_service.delete_product(shop, data["id"])
     elif topic == "inventory_levels/update":
         await shopify_service.handle_inventory_level_update(shop, data)
-    
-    return {"status": "processed"}
 
 
 # ==================== PRODUCTS ====================
 
+def normalize_product_name(name: str) -> str:
+    """Normalize product name by removing special chars, extra spaces, and lowercasing"""
+    if not name:
+        return ""
+    # Remove special characters except spaces and alphanumerics
+    normalized = re.sub(r'[^a-z0-9\s]', '', name.lower())
+    # Replace multiple spaces with single space and strip
+    normalized = re.sub(r'\s+', ' ', normalized).strip()
+    return normalized
+
+
+def dedupe_products(products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Collapse products that share a UPC, ASIN or normalized name
+    Keeps the in-stock, then cheapest, entry of each group
+    """
+    unique_products = []
+    seen_upcs = {}  # UPC -> index in unique_products
+    seen_asins = {}  # ASIN -> index in unique_products
+    seen_names = {}  # Normalized Name -> index in unique_products
+
+    for p in products:
+        asin = p.get("asin")
+        upc = p.get("upc")
+        name = p.get("name", "")
+        normalized_name = normalize_product_name(name)
+
+        existing_idx = None
+
+        # Check if we've seen this UPC (highest priority)
+        if upc and upc in seen_upcs:
+            existing_idx = seen_upcs[upc]
+
+        # Check if we've seen this ASIN (second priority)
+        if existing_idx is None and asin and asin in seen_asins:
+            existing_idx = seen_asins[asin]
+
+        # Check if we've seen this normalized name (fallback for missing UPC/ASIN)
+        if existing_idx is None and normalized_name and normalized_name in seen_names:
+            existing_idx = seen_names[normalized_name]
+
+        if existing_idx is not None:
+            # Found a duplicate - merge by keeping the better listing
+            existing = unique_products[existing_idx]
+
+            # Prefer in_stock, then lower price
+            current_in_stock = p.get("in_stock", False)
+            existing_in_stock = existing.get("in_stock", False)
+
+            should_replace = False
+            if current_in_stock and not existing_in_stock:
+                # Current is in stock, existing is not - replace
+                should_replace = True
+            elif current_in_stock == existing_in_stock:
+                # Both have same stock status - compare prices
+                current_price = p.get("best_price") or float('inf')
+                existing_price = existing.get("best_price") or float('inf')
+                if current_price < existing_price:
+                    should_replace = True
+
+            if should_replace:
+                # Replace with better listing
+                unique_products[existing_idx] = p
+
+            # CRITICAL: Always update ALL mappings for the current product
+            # This ensures future products with the same UPC/ASIN/name find this entry
+            if upc:
+                seen_upcs[upc] = existing_idx
+            if asin:
+                seen_asins[asin] = existing_idx
+            if normalized_name:
+                seen_names[normalized_name] = existing_idx
+
+        else:
+            # New unique product - add to list
+            new_idx = len(unique_products)
+            unique_products.append(p)
+
+            # Register all identifiers for this product
+            if upc:
+                seen_upcs[upc] = new_idx
+            if asin:
+                seen_asins[asin] = new_idx
+            if normalized_name:
+                seen_names[normalized_name] = new_idx
+
+    return unique_products
+
+
 @app.get("/api/products")
+@trusted_json
 async def get_products(
+    request: Request,
     limit: int = 50,
     offset: int = 0,
     category: Optional[str] = None,
@@ -643,6 +816,12 @@ async def get_products(
     Get unified product listings with best prices
     Returns ONE listing per product showing the cheapest available source
     """
+    etags = get_catalog_etags()
+    cache_key = etags.page_key(limit=limit, offset=offset, category=category, search=search)
+    version = etags.version_for(cache_key)
+    cached = etags.check(request, cache_key, version, PRODUCTS_CACHE_CONTROL)
+    if cached is not None:
+        return cached
 
     if db is None:
         logger.warning("Using mock products due to missing DB connection")
@@ -705,90 +884,15 @@ async def get_products(
         products.append(product_data)
     
     
-    # Deduplication Logic with improved name normalization
-    # Helper function to normalize product names for better matching
-    def normalize_name(name: str) -> str:
-        """Normalize product name by removing special chars, extra spaces, and lowercasing"""
-        import re
-        if not name:
-            return ""
-        # Remove special characters except spaces and alphanumerics
-        normalized = re.sub(r'[^a-z0-9\s]', '', name.lower())
-        # Replace multiple spaces with single space and strip
-        normalized = re.sub(r'\s+', ' ', normalized).strip()
-        return normalized
-    
-    unique_products = []
-    seen_upcs = {}  # UPC -> index in unique_products
-    seen_asins = {}  # ASIN -> index in unique_products
-    seen_names = {}  # Normalized Name -> index in unique_products
-
-    for p in products:
-        asin = p.get("asin")
-        upc = p.get("upc")
-        name = p.get("name", "")
-        normalized_name = normalize_name(name)
-        
-        existing_idx = None
-        
-        # Check if we've seen this UPC (highest priority)
-        if upc and upc in seen_upcs:
-            existing_idx = seen_upcs[upc]
-
-        # Check if we've seen this ASIN (second priority)
-        if existing_idx is None and asin and asin in seen_asins:
-            existing_idx = seen_asins[asin]
-        
-        # Check if we've seen this normalized name (fallback for missing UPC/ASIN)
-        if existing_idx is None and normalized_name and normalized_name in seen_names:
-            existing_idx = seen_names[normalized_name]
-            
-        if existing_idx is not None:
-            # Found a duplicate - merge by keeping the better listing
-            existing = unique_products[existing_idx]
-            
-            # Prefer in_stock, then lower price
-            current_in_stock = p.get("in_stock", False)
-            existing_in_stock = existing.get("in_stock", False)
-            
-            should_replace = False
-            if current_in_stock and not existing_in_stock:
-                # Current is in stock, existing is not - replace
-                should_replace = True
-            elif current_in_stock == existing_in_stock:
-                # Both have same stock status - compare prices
-                current_price = p.get("best_price") or float('inf')
-                existing_price = existing.get("best_price") or float('inf')
-                if current_price < existing_price:
-                    should_replace = True
-            
-            if should_replace:
-                # Replace with better listing
-                unique_products[existing_idx] = p
-            
-            # CRITICAL: Always update ALL mappings for the current product
-            # This ensures future products with the same UPC/ASIN/name find this entry
-            if upc:
-                seen_upcs[upc] = existing_idx
-            if asin:
-                seen_asins[asin] = existing_idx
-            if normalized_name:
-                seen_names[normalized_name] = existing_idx
+    unique_products = dedupe_products(products)
 
-        else:
-            # New unique product - add to list
-            new_idx = len(unique_products)
-            unique_products.append(p)
-            
-            # Register all identifiers for this product
-            if upc:
-                seen_upcs[upc] = new_idx
-            if asin:
-                seen_asins[asin] = new_idx
-            if normalized_name:
-                seen_names[normalized_name] = new_idx
-    
-    return {"products": unique_products, "total": len(unique_products)}
+    return etags.respond(
+        request,
+        cache_key,
+        version,
+        {"products": unique_products, "total": len(unique_products)},
+        PRODUCTS_CACHE_CONTROL,
+    )
 
 
 @app.post("/api/admin/products/amazon/scrape")
@@ -1130,17 +1234,12 @@ async def add_ebay_product(
         "images": [image_url] if image_url else [],
         "description": description,
         "status": "active",
-        "updated_at": datetime.utcnow(),
     }
     
-    listing_ref = db.collection("affiliateProducts").document(doc_id)
-    existing = await listing_ref.get()
-    if existing.exists:
-        listing_data["created_at"] = existing.to_dict().get("created_at")
+    if await set_if_changed("affiliateProducts", doc_id, listing_data):
+        await deal_service.observe_listing(product_id, doc_id, price, True, listing_data)
     else:
-        listing_data["created_at"] = datetime.utcnow()
-    
-    await listing_ref.set(listing_data)
+        logger.info(f"Listing {doc_id} unchanged, skipped write")
     
     logger.info(f"Successfully added eBay product: {product_name}")
     
@@ -1222,11 +1321,20 @@ async def get_best_price(
 
 
 @app.get("/api/products/{product_id}")
+@trusted_json
 async def get_product(
     product_id: str,
+    request: Request,
     db: firestore.AsyncClient = Depends(get_db)
 ):
     """Get detailed product information with all available listings"""
+    etags = get_catalog_etags()
+    cache_key = etags.product_key(product_id)
+    version = etags.version_for(cache_key)
+    cached = etags.check(request, cache_key, version, PRODUCT_DETAIL_CACHE_CONTROL)
+    if cached is not None:
+        return cached
+
     doc = await db.collection("products").document(product_id).get()
     if not doc.exists:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -1276,7 +1384,32 @@ async def get_product(
     product_data["listings"] = all_listings
     product_data["best_price"] = all_listings[0]["price"] if all_listings else None
     
-    return product_data
+    return etags.respond(
+        request,
+        cache_key,
+        version,
+        product_data,
+        PRODUCT_DETAIL_CACHE_CONTROL,
+        listing_ids=[listing["listing_id"] for listing in all_listings],
+    )
+
+
+# ==================== DEALS ====================
+
+@app.get("/api/deals")
+async def get_deals(
+    limit: int = Query(20, ge=1, le=100),
+    category: Optional[str] = None,
+    _: firestore.AsyncClient = Depends(get_db)
+):
+    """
+    Listings priced below their product's market price, best deal first.
+    Served from the maintained `deals` index; listings are never scanned here.
+    """
+    deals = await deal_service.get_deals(limit=limit, category=category)
+    for deal in deals:
+        deal["updated_at"] = _serialize_datetime(deal.get("updated_at"))
+    return {"deals": deals, "total": len(deals)}
 
 
 # ==================== CART OPTIMIZATION ====================
@@ -1293,9 +1426,10 @@ async def optimize_cart(
     """
     # 1. Fetch all valid listings for every item
     cart_listings = {} # {product_id: [listings]}
+    shipping_address = request.shipping_address.model_dump()
     for item in request.items:
         listings = await get_all_listings_with_shipping(
-            db, item.product_id, item.quantity, request.shipping_address
+            db, item.product_id, item.quantity, shipping_address
         )
         if not listings:
             raise HTTPException(status_code=400, detail=f"Product {item.product_id} not available")
@@ -1478,7 +1612,8 @@ async def get_user_payment_methods(
         return {"customer_id": None, "payment_methods": []}
     
     try:
-        payment_methods = stripe.PaymentMethod.list(
+        payment_methods = await stripe_client.call(
+            stripe.PaymentMethod.list,
             customer=customer_id,
             type="card"
         )
@@ -1657,10 +1792,7 @@ async def create_vendor_billing_portal_link(
 
 
 @app.post("/api/stripe/webhook")
-async def stripe_webhook(
-    request: Request,
-    db: firestore.AsyncClient = Depends(get_db)
-):
+async def stripe_webhook(request: Request):
     """Handle Stripe webhooks for payment and subscription events"""
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
@@ -1674,7 +1806,15 @@ async def stripe_webhook(
     except stripe.error.SignatureVerificationError:
         raise HTTPException(status_code=400, detail="Invalid signature")
     
-    event_type = event["type"]
+    await webhook_queue.enqueue(
+        "stripe", event["type"], json.loads(payload), dedup_id=event["id"]
+    )
+    return {"status": "queued"}
+
+
+async def process_stripe_event(event_type: str, event: Dict[str, Any]):
+    """Webhook queue handler for verified Stripe events"""
+    db = await get_db()
     data_object = event["data"]["object"]
     metadata = data_object.get("metadata") or {}
     checkout_type = metadata.get("checkout_type")
@@ -1698,8 +1838,6 @@ async def stripe_webhook(
         )
     else:
         logger.debug("Unhandled Stripe event %s", event_type)
-    
-    return {"status": "processed"}
 
 
 async def handle_checkout_session_completed(
@@ -1707,7 +1845,8 @@ async def handle_checkout_session_completed(
     db: firestore.AsyncClient
 ):
     """Finalize orders for completed Stripe Checkout sessions"""
-    session = stripe.checkout.Session.retrieve(
+    session = await stripe_client.call(
+        stripe.checkout.Session.retrieve,
         session_payload["id"],
         expand=["payment_intent.latest_charge.balance_transaction"]
     )
@@ -1736,6 +1875,8 @@ async def record_order_from_session(
         .stream()
     async for doc in existing:
         logger.info("Order already recorded for session %s", session["id"])
+        # Retry any vendor transfers a previous attempt did not finish
+        await stripe_service.process_commission(doc.id, metadata, None)
         return doc.id
     
     shipping_address = {}
@@ -1748,7 +1889,8 @@ async def record_order_from_session(
     
     payment_intent = session.get("payment_intent")
     if isinstance(payment_intent, str):
-        payment_intent = stripe.PaymentIntent.retrieve(
+        payment_intent = await stripe_client.call(
+            stripe.PaymentIntent.retrieve,
             payment_intent,
             expand=["latest_charge.balance_transaction"]
         )
@@ -1779,11 +1921,13 @@ async def record_order_from_session(
         "metadata": metadata
     }
     
-    order_ref = db.collection("orders").document()
-    await order_ref.set(order_data)
-    
-    order_items_collection = db.collection("orderItems")
-    for item in line_items:
+    # Order, items and payout placeholders are committed atomically so a retry
+    # never sees a partially recorded order. Ids derive from the session, so two
+    # events for it processed at once overwrite one order instead of recording two.
+    order_id = session["id"]
+    batch = repository.batch()
+    batch.set("orders", order_id, order_data)
+    for index, item in enumerate(line_items):
         quantity = int(item.get("quantity", 1))
         product_total = Decimal(item.get("product_total", "0"))
         unit_price = (product_total / Decimal(quantity)) if quantity else Decimal("0")
@@ -1791,7 +1935,7 @@ async def record_order_from_session(
         gross_total = Decimal(item.get("gross_total", "0"))
         
         order_item = {
-            "order_id": order_ref.id,
+            "order_id": order_id,
             "product_id": item.get("product_id"),
             "listing_id": item.get("listing_id"),
             "source": "shopify",
@@ -1805,10 +1949,14 @@ async def record_order_from_session(
             "status": "paid",
             "shipping_total": float(Decimal(item.get("shipping_total", "0")))
         }
-        await order_items_collection.document().set(order_item)
+        batch.set("orderItems", f"{order_id}_{index}", order_item)
+    
+    payouts = stripe_service.build_payouts(order_id, metadata, payment_intent)
+    stripe_service.stage_payouts(batch, payouts)
+    await batch.commit()
     
-    await stripe_service.process_commission(order_ref.id, metadata, payment_intent)
-    return order_ref.id
+    await stripe_service.process_commission(order_id, metadata, payment_intent, payouts)
+    return order_id
 
 
 async def handle_vendor_subscription_checkout_event(
@@ -1822,7 +1970,7 @@ async def handle_vendor_subscription_checkout_event(
     
     subscription = None
     if subscription_id:
-        subscription = stripe.Subscription.retrieve(subscription_id)
+        subscription = await stripe_client.call(stripe.Subscription.retrieve, subscription_id)
         meta = subscription.metadata or {}
         store_id = store_id or meta.get("store_id")
         tier = tier or meta.get("subscription_tier")
@@ -1898,6 +2046,7 @@ async def handle_vendor_subscription_cancellation(
 # ==================== VENDOR DASHBOARD ====================
 
 @app.get("/api/vendor/dashboard")
+@trusted_json
 async def vendor_dashboard(
     shop: str,
     db: firestore.AsyncClient = Depends(get_db)
@@ -1954,7 +2103,9 @@ async def vendor_dashboard(
         "stats": {
             "total_sales": store_data.get("total_sales", 0),
             "total_products": len(products),
-            "pending_payouts": sum(p["amount"] for p in payouts if p["status"] == "pending")
+            "pending_payouts": sum(
+                p["amount"] for p in payouts if p["status"] in ("pending", "awaiting_transfer")
+            )
         }
     }
 
@@ -1962,18 +2113,33 @@ async def vendor_dashboard(
 @app.post("/api/vendor/sync-products")
 async def sync_vendor_products(
     shop: str,
-    background_tasks: BackgroundTasks,
+    full: bool = False,
     db: firestore.AsyncClient = Depends(get_db)
 ):
-    """Manually trigger product sync"""
+    """Manually trigger product sync (delta by default, `full=true` to reconcile)"""
     store_doc = await db.collection("stores").document(shop).get()
     if not store_doc.exists:
         raise HTTPException(status_code=404, detail="Store not found")
     
-    store_data = store_doc.to_dict()
-    background_tasks.add_task(shopify_service.sync_products, shop)
+    mode = "full" if full else "auto"
+    if not sync_orchestrator.schedule(shop, mode):
+        return {"status": "sync_already_running"}
     
-    return {"status": "sync_started"}
+    return {"status": "sync_started", "mode": mode}
+
+
+@app.get("/api/vendor/sync-status")
+async def vendor_sync_status(
+    shop: str,
+    _: firestore.AsyncClient = Depends(get_db)
+):
+    """Progress of the current or most recent product sync"""
+    sync_status = await sync_orchestrator.status(shop)
+    if sync_status is None:
+        raise HTTPException(status_code=404, detail="Store not found")
+    for field in ("started_at", "heartbeat_at", "last_sync_at"):
+        sync_status[field] = _serialize_datetime(sync_status[field])
+    return sync_status
 
 
 @app.post("/api/vendor/shipping-label")
@@ -2124,6 +2290,137 @@ async def set_vendor_commission(
     return {"status": "updated"}
 
 
+@app.get("/api/admin/webhooks/metrics")
+async def webhook_queue_metrics(admin_key: str):
+    """Webhook ingestion queue depth, lag and per-topic throughput"""
+    if admin_key != os.getenv("ADMIN_API_KEY"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return await asyncio.to_thread(webhook_queue.stats)
+
+
+@app.get("/api/admin/stripe/metrics")
+async def stripe_client_metrics(admin_key: str):
+    """Stripe SDK call latency, errors and timeouts per API method"""
+    if admin_key != os.getenv("ADMIN_API_KEY"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return stripe_client.stats()
+
+
+@app.get("/api/admin/loop/stalls")
+async def event_loop_stalls(admin_key: str):
+    """Event loop lag and the stacks of recent blocking calls"""
+    if admin_key != os.getenv("ADMIN_API_KEY"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return loop_monitor.stats()
+
+
+@app.get("/api/admin/profile")
+async def profile_worker(
+    admin_key: str,
+    seconds: float = Query(10, gt=0, le=120),
+    interval_ms: float = Query(5, ge=1, le=100),
+    format: str = Query("collapsed", pattern="^(collapsed|json)$"),
+):
+    """Sample every thread of this worker for N seconds; returns collapsed stacks for flamegraphs"""
+    if admin_key != os.getenv("ADMIN_API_KEY"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running on this worker")
+    async with _profile_lock:
+        sampler = StackSampler(interval=interval_ms / 1000).start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(sampler.stop)
+    if format == "json":
+        return sampler.summary(top=100)
+    return Response(
+        content=sampler.collapsed(),
+        media_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="profile-{os.getpid()}.collapsed"'},
+    )
+
+
+@app.get("/api/admin/profiles")
+async def list_request_profiles(admin_key: str):
+    """Profiles captured from slow requests sent with the X-Profile header"""
+    if admin_key != os.getenv("ADMIN_API_KEY"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return {"profiles": get_profile_store().list()}
+
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_request_profile(profile_id: str, admin_key: str):
+    """Collapsed stacks for one slow-request profile"""
+    if admin_key != os.getenv("ADMIN_API_KEY"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    profile = get_profile_store().get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(content=profile["collapsed"], media_type="text/plain")
+
+
+@app.post("/api/admin/traces/start")
+async def start_trace_capture(
+    admin_key: str,
+    seconds: float = Query(300, gt=0, le=86400),
+    sample_rate: float = Query(1.0, gt=0, le=1),
+    max_records: int = Query(100000, gt=0),
+):
+    """Record sanitized request traces on this worker for replay with benchmarks/replay.py"""
+    if admin_key != os.getenv("ADMIN_API_KEY"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    recorder = get_trace_recorder()
+    if recorder.active:
+        raise HTTPException(status_code=409, detail="A trace capture is already running on this worker")
+    await asyncio.to_thread(recorder.start, seconds=seconds, sample_rate=sample_rate, max_records=max_records)
+    return recorder.stats()
+
+
+@app.post("/api/admin/traces/stop")
+async def stop_trace_capture(admin_key: str):
+    """Finish the running trace capture and close its file"""
+    if admin_key != os.getenv("ADMIN_API_KEY"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return await asyncio.to_thread(get_trace_recorder().stop)
+
+
+@app.get("/api/admin/traces")
+async def list_trace_captures(admin_key: str):
+    """Trace capture status and the capture files stored on this worker"""
+    if admin_key != os.getenv("ADMIN_API_KEY"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    recorder = get_trace_recorder()
+    return {**recorder.stats(), "files": recorder.files()}
+
+
+@app.get("/api/admin/traces/{name}")
+async def download_trace_capture(name: str, admin_key: str):
+    """Download one gzip NDJSON capture file"""
+    if admin_key != os.getenv("ADMIN_API_KEY"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    path = get_trace_recorder().file_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Trace file not found")
+    return FileResponse(path, media_type="application/gzip", filename=name)
+
+
+@app.get("/api/admin/catalog/etags")
+async def catalog_etag_stats(admin_key: str):
+    """Catalogue ETag versions, remembered entries and 304 counts for this worker"""
+    if admin_key != os.getenv("ADMIN_API_KEY"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return get_catalog_etags().stats()
+
+
+@app.get("/api/admin/analytics/sink")
+async def event_sink_metrics(admin_key: str):
+    """Analytics event buffer depth, flushed/dropped/spilled counts"""
+    if admin_key != os.getenv("ADMIN_API_KEY"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return event_sink.stats()
+
+
 @app.post("/api/admin/amazon/sync")
 async def trigger_amazon_sync(admin_key: str):
     """Manually trigger an Amazon.ca affiliate sync"""
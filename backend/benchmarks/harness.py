@@ -0,0 +1,241 @@
+"""
+Registry, timing and baseline comparison for the benchmark suite (`suite.py`).
+
+A benchmark's setup runs once and returns the operation to time: a plain
+callable for micro-benchmarks, a coroutine function for macro-benchmarks
+(which also receive the shared `MacroEnvironment` and the number of
+operations they will be asked to run). Each round times `number` calls and
+records the mean per call, so results are seconds per operation.
+"""
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MICRO = "micro"
+MACRO = "macro"
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+METRICS = ("min", "median", "mean", "p95")
+
+
+@dataclass
+class Benchmark:
+    name: str
+    group: str
+    setup: Callable[..., Any]
+    number: int
+    rounds: int
+    # Allowed slowdown past the baseline's p95 before `compare` flags a regression, e.g. 0.15 = 15%
+    tolerance: float
+    description: str = ""
+
+    @property
+    def total_ops(self) -> int:
+        # One warm-up round plus the timed rounds
+        return self.number * (self.rounds + 1)
+
+
+REGISTRY: Dict[str, Benchmark] = {}
+
+
+def _register(group: str, name: str, number: int, rounds: int, tolerance: float):
+    def decorator(setup):
+        full_name = f"{group}.{name}"
+        if full_name in REGISTRY:
+            raise ValueError(f"Benchmark {full_name} registered twice")
+        REGISTRY[full_name] = Benchmark(
+            full_name, group, setup, number, rounds, tolerance, (setup.__doc__ or "").strip()
+        )
+        return setup
+
+    return decorator
+
+
+def micro(name: str, number: int = 100, rounds: int = 15, tolerance: float = 0.15):
+    """Register `setup() -> op` where `op()` is timed."""
+    return _register(MICRO, name, number, rounds, tolerance)
+
+
+def macro(name: str, number: int = 5, rounds: int = 5, tolerance: float = 0.30):
+    """Register `async setup(env, ops) -> op` where `await op()` is timed."""
+    return _register(MACRO, name, number, rounds, tolerance)
+
+
+# ----------------------------------------------------------------------
+# Timing
+# ----------------------------------------------------------------------
+def measure(op: Callable[[], Any], number: int, rounds: int) -> List[float]:
+    """Seconds per call for each round, with GC paused while timing (as `timeit` does)."""
+    for _ in range(number):
+        op()
+    samples = []
+    for _ in range(rounds):
+        gc.collect()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            for _ in range(number):
+                op()
+            samples.append((time.perf_counter() - started) / number)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+    return samples
+
+
+async def measure_async(op: Callable[[], Any], number: int, rounds: int) -> List[float]:
+    """Seconds per awaited call for each round; GC stays on since it is part of serving requests."""
+    for _ in range(number):
+        await op()
+    samples = []
+    for _ in range(rounds):
+        gc.collect()
+        started = time.perf_counter()
+        for _ in range(number):
+            await op()
+        samples.append((time.perf_counter() - started) / number)
+    return samples
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "p95": ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))],
+        "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+    }
+
+
+def result_entry(bench: Benchmark, samples: List[float]) -> Dict[str, Any]:
+    return {
+        "group": bench.group,
+        "number": bench.number,
+        "rounds": len(samples),
+        "tolerance": bench.tolerance,
+        "samples": samples,
+        **summarize(samples),
+    }
+
+
+# ----------------------------------------------------------------------
+# Baselines
+# ----------------------------------------------------------------------
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def baseline_path(name_or_path: str) -> str:
+    """A bare name (e.g. "main") resolves to benchmarks/baselines/main.json."""
+    if os.sep in name_or_path or name_or_path.endswith(".json"):
+        return name_or_path
+    return os.path.join(BASELINE_DIR, f"{name_or_path}.json")
+
+
+def save(results: Dict[str, Any], path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    metric: str = "median",
+    max_regression: Optional[float] = None,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Per-benchmark change in `metric`; returns (rows, names that regressed).
+
+    A benchmark regresses when `metric` exceeds the baseline's p95 by more
+    than its own tolerance (stored with the current results) or
+    `max_regression` when given. Gating on the baseline's slow rounds rather
+    than its median keeps round-to-round noise from failing the gate; `change`
+    is still reported against the baseline's `metric`. Benchmarks present on
+    only one side are listed but never fail.
+    """
+    rows: List[Dict[str, Any]] = []
+    regressions: List[str] = []
+    old_results = baseline.get("benchmarks", {})
+    new_results = current.get("benchmarks", {})
+    for name in sorted(set(old_results) | set(new_results)):
+        old, new = old_results.get(name), new_results.get(name)
+        row: Dict[str, Any] = {"name": name, "baseline": None, "current": None, "change": None, "status": ""}
+        if old is None or new is None:
+            row["status"] = "new" if old is None else "missing"
+            row["baseline"] = old and old[metric]
+            row["current"] = new and new[metric]
+            rows.append(row)
+            continue
+        tolerance = max_regression if max_regression is not None else new.get("tolerance", 0.15)
+        change = new[metric] / old[metric] - 1 if old[metric] else 0.0
+        threshold = max(old[metric], old.get("p95", old[metric])) * (1 + tolerance)
+        row.update(
+            baseline=old[metric], current=new[metric], change=change, tolerance=tolerance, threshold=threshold
+        )
+        if new[metric] > threshold:
+            row["status"] = "REGRESSION"
+            regressions.append(name)
+        elif change < -tolerance:
+            row["status"] = "faster"
+        else:
+            row["status"] = "ok"
+        rows.append(row)
+    return rows, regressions
+
+
+def _format_seconds(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if value >= scale:
+            return f"{value / scale:.2f} {unit}"
+    return f"{value / 1e-9:.0f} ns"
+
+
+def format_results(results: Dict[str, Any]) -> str:
+    lines = [f"{'benchmark':<40} {'median':>12} {'min':>12} {'p95':>12} {'stdev':>8}"]
+    for name, entry in sorted(results["benchmarks"].items()):
+        spread = entry["stdev"] / entry["mean"] if entry["mean"] else 0.0
+        lines.append(
+            f"{name:<40} {_format_seconds(entry['median']):>12} {_format_seconds(entry['min']):>12} "
+            f"{_format_seconds(entry['p95']):>12} {spread:>7.1%}"
+        )
+    return "\n".join(lines)
+
+
+def format_comparison(rows: List[Dict[str, Any]], metric: str) -> str:
+    lines = [f"{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>9}  status ({metric})"]
+    for row in rows:
+        change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+        lines.append(
+            f"{row['name']:<40} {_format_seconds(row['baseline']):>12} "
+            f"{_format_seconds(row['current']):>12} {change:>9}  {row['status']}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,80 @@
+"""
+Login throughput per worker: bcrypt inline on the event loop vs the hashing pool.
+
+Runs concurrent password verifications the way `login_for_access_token` does
+and reports logins/second plus the worst event-loop stall seen by a ticker
+task, which is what other requests on the same worker experience.
+
+    cd backend && BCRYPT_ROUNDS=12 python benchmarks/login_throughput.py --logins 64 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from security import (  # noqa: E402
+    BCRYPT_ROUNDS,
+    PASSWORD_HASH_WORKERS,
+    pwd_context,
+    verify_and_update_password_async,
+)
+
+PASSWORD = "correct horse battery staple"
+
+
+async def _inline_login(hashed: str) -> bool:
+    return pwd_context.verify(PASSWORD, hashed)
+
+
+async def _offloaded_login(hashed: str) -> bool:
+    valid, _ = await verify_and_update_password_async(PASSWORD, hashed)
+    return valid
+
+
+async def _run(login, hashed: str, logins: int, concurrency: int):
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stalls.append(time.perf_counter() - started - 0.005)
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with slots:
+            assert await login(hashed)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await tick
+    return {
+        "logins_per_second": logins / elapsed,
+        "max_loop_stall_ms": max(stalls, default=0.0) * 1000,
+    }
+
+
+async def main(logins: int, concurrency: int):
+    hashed = pwd_context.hash(PASSWORD)
+    print(f"bcrypt rounds={BCRYPT_ROUNDS} pool workers={PASSWORD_HASH_WORKERS} "
+          f"logins={logins} concurrency={concurrency}")
+    for name, login in (("inline (before)", _inline_login), ("pool (after)", _offloaded_login)):
+        result = await _run(login, hashed, logins, concurrency)
+        print(f"{name:16} {result['logins_per_second']:8.1f} logins/s   "
+              f"max loop stall {result['max_loop_stall_ms']:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency))
@@ -0,0 +1,225 @@
+"""
+Macro-benchmarks: whole requests and jobs against the mock DB and the fakes.
+
+`MacroEnvironment` seeds a synthetic data set into the in-memory Firestore
+mock, starts the fake integration servers in a subprocess and drives the
+ASGI app in-process with httpx, so a run needs no network and no API keys.
+`suite.configure_environment` must have pointed the services at the fakes
+before `app.main` is imported.
+"""
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+import database
+import repository
+from app import main
+from fakes import synthetic
+from harness import macro
+from models import User
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SYNC_SHOP = "bench-sync.myshopify.com"
+BENCH_USER = User(id="bench-user", email="bench@example.com", hashed_password="-")
+SHIPPING_ADDRESS = {
+    "name": "Bench Buyer",
+    "street": "100 King St W",
+    "city": "Toronto",
+    "province": "ON",
+    "postal_code": "M5X 1A9",
+    "country": "CA",
+}
+
+
+class MacroEnvironment:
+    def __init__(self, config: synthetic.SyntheticConfig, fakes_port: int):
+        self.config = config
+        self.fakes_port = fakes_port
+        self.client: httpx.AsyncClient = None
+        self._fakes: subprocess.Popen = None
+        self._log_level = logging.getLogger().level
+
+    async def __aenter__(self) -> "MacroEnvironment":
+        database._mock_db_data.clear()
+        database._db_client = database.MockFirestoreClient()
+        # Access logs and the mock's per-write INFO lines would dominate every timing
+        logging.getLogger().setLevel(logging.WARNING)
+        await synthetic.seed(self.config)
+        await repository.set_doc(database.STORES, SYNC_SHOP, {
+            "shop_domain": SYNC_SHOP,
+            "store_name": "Bench Sync Store",
+            "access_token": "bench-token",
+            "status": "active",
+            "subscription_status": "active",
+        })
+
+        self._fakes = subprocess.Popen(
+            [sys.executable, "-m", "fakes", "--port", str(self.fakes_port)], cwd=BACKEND_DIR
+        )
+        await self._wait_for_fakes()
+
+        main.app.dependency_overrides[main.get_current_user] = lambda: BENCH_USER
+        self.client = httpx.AsyncClient(app=main.app, base_url="http://bench")
+        main.webhook_queue.register("stripe", main.process_stripe_event)
+        await main.webhook_queue.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await main.webhook_queue.stop()
+        if self.client is not None:
+            await self.client.aclose()
+        main.app.dependency_overrides.pop(main.get_current_user, None)
+        if self._fakes is not None:
+            self._fakes.terminate()
+            self._fakes.wait(timeout=10)
+        database._mock_db_data.clear()
+        logging.getLogger().setLevel(self._log_level)
+
+    async def _wait_for_fakes(self, timeout: float = 15.0):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self._fakes.poll() is not None:
+                    raise RuntimeError("Fake integration server exited during startup")
+                try:
+                    if (await client.get(f"http://127.0.0.1:{self.fakes_port}/health")).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+        raise RuntimeError("Fake integration server did not start")
+
+    def listings_per_product(self) -> Counter:
+        return Counter(
+            synthetic.listing_product(self.config, index) for index in range(self.config.listings)
+        )
+
+
+def _check(response: httpx.Response) -> httpx.Response:
+    if response.status_code >= 400:
+        request = response.request
+        raise RuntimeError(f"{request.method} {request.url.path}: {response.status_code} {response.text[:200]}")
+    return response
+
+
+@macro("browse_products_page", number=3, rounds=5)
+async def browse_products(env: MacroEnvironment, ops: int):
+    """GET /api/products, 48 per page, cycling through the first ten pages."""
+    offsets = itertools.cycle(range(0, 480, 48))
+
+    async def op():
+        _check(await env.client.get("/api/products", params={"limit": 48, "offset": next(offsets)}))
+
+    return op
+
+
+@macro("product_detail", number=20, rounds=5)
+async def product_detail(env: MacroEnvironment, ops: int):
+    """GET /api/products/{id} for the 50 most-listed products."""
+    product_ids = itertools.cycle(synthetic.product_id(index) for index in range(50))
+
+    async def op():
+        _check(await env.client.get(f"/api/products/{next(product_ids)}"))
+
+    return op
+
+
+@macro("product_detail_revalidate", number=50, rounds=5)
+async def product_detail_revalidate(env: MacroEnvironment, ops: int):
+    """GET /api/products/{id} with a current If-None-Match: 304 from the in-memory ETag versions."""
+    etags = {}
+    for index in range(50):
+        product_id = synthetic.product_id(index)
+        etags[product_id] = _check(await env.client.get(f"/api/products/{product_id}")).headers["etag"]
+    requests = itertools.cycle(etags.items())
+
+    async def op():
+        product_id, etag = next(requests)
+        response = await env.client.get(f"/api/products/{product_id}", headers={"If-None-Match": etag})
+        if response.status_code != 304:
+            raise RuntimeError(f"Expected 304 for {product_id}, got {response.status_code}")
+
+    return op
+
+
+@macro("cart_optimize_3_items", number=5, rounds=5)
+async def cart_optimize(env: MacroEnvironment, ops: int):
+    """POST /api/cart/optimize for three mid-catalogue products (Shippo rates from the fakes)."""
+    counts = env.listings_per_product()
+    picks = [index for index, count in sorted(counts.items()) if 3 <= count <= 8][:3]
+    body = {
+        "items": [{"product_id": synthetic.product_id(index), "quantity": 1} for index in picks],
+        "shipping_address": SHIPPING_ADDRESS,
+    }
+
+    async def op():
+        _check(await env.client.post("/api/cart/optimize", json=body))
+
+    return op
+
+
+@macro("shopify_bulk_sync", number=1, rounds=5)
+async def shopify_bulk_sync(env: MacroEnvironment, ops: int):
+    """Full Shopify bulk sync of one store (FAKE_SHOPIFY_PRODUCTS products) at steady state."""
+
+    async def op():
+        await main.shopify_service.sync_products(SYNC_SHOP, mode="full")
+
+    return op
+
+
+def _sign(payload: str, secret: str) -> str:
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+@macro("stripe_checkout_webhook", number=5, rounds=5)
+async def stripe_checkout_webhook(env: MacroEnvironment, ops: int):
+    """checkout.session.completed: verify, enqueue, record the order and pay three vendors."""
+    carts = []
+    for cart in range(ops):
+        items = []
+        for line in range(3):
+            index = (cart * 3 + line) * 7 % env.config.listings
+            listing = synthetic.listing(env.config, index)
+            items.append({
+                "listing_id": synthetic.listing_id(env.config, index),
+                "product_id": listing["product_id"],
+                "quantity": 1,
+                "shipping_cost": 9.99,
+            })
+        carts.append(items)
+    sessions = iter([
+        await main.stripe_service.create_checkout_session(items, "bench@example.com", SHIPPING_ADDRESS)
+        for items in carts
+    ])
+    secret = os.environ["STRIPE_WEBHOOK_SECRET"]
+
+    async def op():
+        session = next(sessions)
+        payload = json.dumps({
+            "id": f"evt_{uuid.uuid4().hex}",
+            "object": "event",
+            "type": "checkout.session.completed",
+            "data": {"object": {"id": session.id, "object": "checkout.session", "metadata": {}}},
+        })
+        _check(await env.client.post(
+            "/api/stripe/webhook",
+            content=payload,
+            headers={"stripe-signature": _sign(payload, secret), "content-type": "application/json"},
+        ))
+        await main.webhook_queue.drain()
+
+    return op
@@ -0,0 +1,182 @@
+"""
+Micro-benchmarks: pure functions on the browse, sync and checkout paths.
+
+Inputs come from `fakes.synthetic` so they look like production data
+(duplicate names with noise, skewed prices, multi-vendor carts).
+"""
+import json
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.main import affiliate_service, dedupe_products, shippo_service, shopify_service, stripe_service
+from fakes import synthetic
+from fast_json import FastJSONResponse
+from harness import micro
+
+CONFIG = synthetic.SyntheticConfig(products=5_000, listings=20_000, stores=50)
+PROVINCES = ("ON", "QC", "BC", "AB", "MB", "SK", "NS", "NB", "NL", "PE", "NT", "YT", "NU", "XX")
+
+
+def _titles(count: int):
+    return [synthetic.product(CONFIG, index)["name"] for index in range(count)]
+
+
+@micro("dedupe_products_5k", number=5)
+def dedupe_5k():
+    """`get_products` deduplication over 5,000 priced products (8% duplicates)."""
+    products = []
+    for index in range(CONFIG.products):
+        product = synthetic.product(CONFIG, index)
+        affiliate = synthetic.affiliate_product(CONFIG, index)
+        products.append({
+            **product,
+            "id": synthetic.product_id(index),
+            "best_price": synthetic.base_price(CONFIG, index),
+            "in_stock": index % 7 != 0,
+            "asin": affiliate["asin"] if affiliate else None,
+        })
+    return lambda: dedupe_products(list(products))
+
+
+@micro("classify_shopify_products_1k", number=20)
+def classify_shopify():
+    """Segment and game detection for 1,000 Shopify titles with tags."""
+    rows = [
+        (title, ["sealed", "tcg", "new"], title.rsplit(" ", 2)[-2] + " Box")
+        for title in _titles(1_000)
+    ]
+
+    def op():
+        for title, tags, product_type in rows:
+            shopify_service._classify_segment(title, tags, product_type)
+            shopify_service._detect_game(title, product_type, tags)
+
+    return op
+
+
+@micro("classify_affiliate_products_1k", number=50)
+def classify_affiliate():
+    """Product type and release status for 1,000 Amazon titles."""
+    titles = _titles(1_000)
+
+    def op():
+        for title in titles:
+            affiliate_service._classify_product_type(title)
+            affiliate_service._classify_release_status(title, "Best Seller in Trading Cards")
+
+    return op
+
+
+@micro("estimate_shipping_1k", number=100)
+def estimate_shipping():
+    """Fallback shipping estimate for 1,000 province/quantity pairs."""
+    requests = [({"province": PROVINCES[i % len(PROVINCES)]}, 1 + i % 6) for i in range(1_000)]
+
+    def op():
+        for address, quantity in requests:
+            shippo_service.estimate_shipping(address, quantity)
+
+    return op
+
+
+@micro("commission_payouts_8_items", number=200)
+def commission_payouts():
+    """Commission rates and per-vendor payouts for an 8-line, 4-vendor order."""
+    items = []
+    for line in range(8):
+        listing = synthetic.listing(CONFIG, line * 97)
+        product = synthetic.product(CONFIG, line * 31)
+        rate = stripe_service._determine_commission_rate(product)
+        product_total = Decimal(str(listing["price"])) * 2
+        items.append({
+            "store_id": f"store-{line % 4}",
+            "store_name": f"Store {line % 4}",
+            "stripe_account_id": f"acct_{line % 4}",
+            "listing_id": f"listing-{line}",
+            "product_id": f"product-{line}",
+            "quantity": 2,
+            "product_total": str(product_total),
+            "shipping_total": "9.99",
+            "gross_total": str(product_total + Decimal("9.99")),
+            "commission_rate": str(rate),
+            "platform_commission": str((product_total * rate).quantize(Decimal("0.01"))),
+            "category": product["category"],
+        })
+    metadata = {"items": json.dumps(items), "transfer_group": "order-bench"}
+    products = [synthetic.product(CONFIG, index) for index in range(100)]
+
+    def op():
+        for product in products:
+            stripe_service._determine_commission_rate(product)
+        stripe_service.build_payouts("order-bench", metadata, None)
+
+    return op
+
+
+def _products_page():
+    products = []
+    for index in range(48):
+        products.append({
+            **synthetic.product(CONFIG, index),
+            "id": synthetic.product_id(index),
+            "best_price": synthetic.base_price(CONFIG, index),
+            "source": "shopify",
+            "source_name": "Synthetic Games",
+            "in_stock": True,
+            "is_preorder": False,
+            "url": "",
+            "asin": None,
+        })
+    return {"products": products, "total": len(products)}
+
+
+def _vendor_dashboard():
+    store = synthetic.store(CONFIG, 1)
+    listings = [
+        {**synthetic.listing(CONFIG, index), "id": synthetic.listing_id(CONFIG, index)} for index in range(500)
+    ]
+    orders = []
+    for index in range(20):
+        order, items = synthetic.order(CONFIG, index)
+        orders.append({**items[0], "id": f"item-{index}", "created_at": order["created_at"]})
+    payouts = [
+        {"amount": Decimal("45.56"), "status": "pending", "created_at": orders[index]["created_at"], "id": f"po-{index}"}
+        for index in range(10)
+    ]
+    return {
+        "store": store,
+        "products": listings,
+        "recent_orders": orders,
+        "payouts": payouts,
+        "stats": {"total_sales": 0, "total_products": len(listings), "pending_payouts": sum(p["amount"] for p in payouts)},
+    }
+
+
+@micro("json_products_page_default", number=200)
+def json_products_page_default():
+    """48-product /api/products page: jsonable_encoder + stdlib JSONResponse (the old default path)."""
+    page = _products_page()
+    return lambda: JSONResponse(jsonable_encoder(page)).body
+
+
+@micro("json_products_page_fast", number=200)
+def json_products_page_fast():
+    """Same page rendered directly by FastJSONResponse (the @trusted_json path)."""
+    page = _products_page()
+    return lambda: FastJSONResponse(page).body
+
+
+@micro("json_vendor_dashboard_default", number=20)
+def json_vendor_dashboard_default():
+    """Vendor dashboard with 500 listings, 20 orders and Decimal payouts: jsonable_encoder + stdlib json."""
+    dashboard = _vendor_dashboard()
+    return lambda: JSONResponse(jsonable_encoder(dashboard)).body
+
+
+@micro("json_vendor_dashboard_fast", number=20)
+def json_vendor_dashboard_fast():
+    """Same dashboard rendered directly by FastJSONResponse."""
+    dashboard = _vendor_dashboard()
+    return lambda: FastJSONResponse(dashboard).body
@@ -0,0 +1,111 @@
+"""
+Requests/second on a trivial endpoint: no middleware, the previous
+`BaseHTTPMiddleware`-style request logger, and the pure ASGI `AuditMiddleware`.
+
+Drives the ASGI app directly (no sockets, no HTTP client) so the numbers
+isolate per-request middleware overhead.
+
+    cd backend && python benchmarks/middleware_overhead.py --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import FastAPI, Request  # noqa: E402
+
+from middleware.audit import AuditMiddleware  # noqa: E402
+from repository import read_scope  # noqa: E402
+
+logger = logging.getLogger("benchmark.access")
+
+
+class _NullAnalytics:
+    async def log_event(self, dataset, table, entry):
+        return None
+
+
+def _build_app(variant: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if variant == "base_http":
+        @app.middleware("http")
+        async def log_requests(request: Request, call_next):
+            start_time = datetime.utcnow()
+            with read_scope():
+                response = await call_next(request)
+            duration = (datetime.utcnow() - start_time).total_seconds()
+            logger.info(json.dumps({
+                "method": request.method,
+                "path": request.url.path,
+                "status_code": response.status_code,
+                "duration": duration,
+                "ip": request.client.host,
+            }))
+            return response
+    elif variant == "asgi":
+        app.add_middleware(AuditMiddleware, analytics=_NullAnalytics())
+    return app
+
+
+async def _drive(app, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/ping", "raw_path": b"/ping",
+        "root_path": "", "query_string": b"", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+    request_message = {"type": "http.request", "body": b"", "more_body": False}
+    disconnected = asyncio.Event()
+
+    async def send(message):
+        return None
+
+    async def one():
+        messages = iter((request_message,))
+
+        async def receive():
+            # Body first, then park like a live connection until the response is done
+            message = next(messages, None)
+            if message is None:
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            return message
+
+        await app(dict(scope), receive, send)
+
+    for _ in range(200):  # warm up routing and middleware stack
+        await one()
+    started = time.perf_counter()
+    for _ in range(requests):
+        await one()
+    return requests / (time.perf_counter() - started)
+
+
+async def main(requests: int):
+    logging.basicConfig(level=logging.INFO, stream=open(os.devnull, "w"))
+    print(f"requests={requests} (access logs written to /dev/null)")
+    baseline = None
+    for name, variant in (("no middleware", "none"),
+                          ("BaseHTTPMiddleware (before)", "base_http"),
+                          ("pure ASGI (after)", "asgi")):
+        rps = await _drive(_build_app(variant), requests)
+        baseline = baseline or rps
+        print(f"{name:28} {rps:10.0f} req/s   {rps / baseline * 100:5.1f}% of bare")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
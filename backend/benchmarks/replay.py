@@ -0,0 +1,251 @@
+"""
+Replay captured request traces against a local build and report latency per route.
+
+Traces come from the capture mode in `AuditMiddleware` (see `trace_capture`;
+start one with POST /api/admin/traces/start and download the files from
+/api/admin/traces/{name}). Requests are sent open-loop at their original
+offsets, divided by --speed, so the replay keeps the captured mix of
+browse, cart and webhook traffic and its bursts:
+
+    cd backend
+    python benchmarks/replay.py traces/*.ndjson.gz --target http://127.0.0.1:8000
+    python benchmarks/replay.py traces/*.ndjson.gz --speed 4 --output after.json --compare before.json
+    python benchmarks/replay.py traces/*.ndjson.gz --speed 0 --max-in-flight 32   # as fast as possible
+
+Webhook bodies are re-signed with the local STRIPE_WEBHOOK_SECRET and
+SHOPIFY_API_SECRET, and their event/webhook ids get a per-run suffix so the
+webhook queue does not drop a second replay as duplicates (--keep-ids to
+disable). Authenticated requests use --token; captures never hold the
+original credentials. Latencies are measured by the client; the captured
+server-side duration is reported next to them for reference.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from trace_capture import REDACTED, SHOPIFY, STRIPE, encode_body, read_traces  # noqa: E402
+
+PERCENTILES = (50, 90, 99)
+
+
+class Replayer:
+    """Turns trace records into requests: auth, fresh webhook ids and local signatures."""
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        stripe_secret: Optional[str] = None,
+        shopify_secret: Optional[str] = None,
+        keep_ids: bool = False,
+        run_id: Optional[str] = None,
+    ):
+        self.token = token
+        self.stripe_secret = stripe_secret if stripe_secret is not None else os.getenv("STRIPE_WEBHOOK_SECRET")
+        self.shopify_secret = shopify_secret if shopify_secret is not None else os.getenv("SHOPIFY_API_SECRET")
+        self.keep_ids = keep_ids
+        self.run_id = run_id or uuid.uuid4().hex[:8]
+
+    def build(self, record: Dict[str, Any]) -> Tuple[str, str, List[List[str]], Dict[str, str], Optional[bytes]]:
+        headers = dict(record.get("headers") or {})
+        authorization = headers.pop("authorization", None)
+        if authorization and self.token:
+            headers["authorization"] = f"{authorization.split(' ', 1)[0]} {self.token}"
+        query = [[key, value] for key, value in record.get("query") or () if value != REDACTED]
+
+        kind = record.get("signature")
+        if kind and "json" in record and not self.keep_ids:
+            record = self._fresh_ids(kind, record, headers)
+        body = encode_body(record)
+        if kind == STRIPE and body is not None and self.stripe_secret:
+            timestamp = int(time.time())
+            signature = hmac.new(
+                self.stripe_secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256
+            ).hexdigest()
+            headers["stripe-signature"] = f"t={timestamp},v1={signature}"
+        elif kind == SHOPIFY and body is not None and self.shopify_secret:
+            digest = hmac.new(self.shopify_secret.encode(), body, hashlib.sha256).digest()
+            headers["x-shopify-hmac-sha256"] = base64.b64encode(digest).decode()
+        return record["method"], record["path"], query, headers, body
+
+    def _fresh_ids(self, kind: str, record: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        if kind == STRIPE and isinstance(record["json"], dict) and "id" in record["json"]:
+            record = {**record, "json": {**record["json"], "id": f"{record['json']['id']}_{self.run_id}"}}
+        elif kind == SHOPIFY and "x-shopify-webhook-id" in headers:
+            headers["x-shopify-webhook-id"] = f"{headers['x-shopify-webhook-id']}-{self.run_id}"
+        return record
+
+
+async def replay(
+    records: List[Dict[str, Any]],
+    client: httpx.AsyncClient,
+    replayer: Replayer,
+    speed: float = 1.0,
+    max_in_flight: int = 256,
+) -> List[Dict[str, Any]]:
+    """Send every record at its captured offset / `speed` (0 = back to back); one result per request."""
+    if not records:
+        return []
+    first = records[0]["ts"]
+    limit = asyncio.Semaphore(max_in_flight)
+    results: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+
+    async def send(record, due):
+        method, path, query, headers, body = replayer.build(record)
+        result = {
+            "key": f"{record['method']} {record.get('route') or record['path']}",
+            "original_status": record.get("status"),
+            "original_ms": record.get("duration_ms"),
+            "status": None,
+        }
+        async with limit:
+            # How far behind schedule the request went out (client or cap saturated)
+            result["lag_ms"] = max(0.0, time.perf_counter() - started - due) * 1000
+            sent = time.perf_counter()
+            try:
+                response = await client.request(method, path, params=query, headers=headers, content=body)
+                result["status"] = response.status_code
+            except httpx.HTTPError as exc:
+                result["error"] = type(exc).__name__
+            result["ms"] = (time.perf_counter() - sent) * 1000
+        results.append(result)
+
+    tasks = []
+    for record in records:
+        due = (record["ts"] - first) / speed if speed > 0 else 0.0
+        delay = due - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(record, due)))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Latency distribution, error and status-mismatch counts per "METHOD /route/{template}"."""
+    grouped: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for result in results:
+        grouped[result["key"]].append(result)
+        grouped["ALL"].append(result)
+
+    summary = {}
+    for key, group in sorted(grouped.items()):
+        latencies = sorted(result["ms"] for result in group)
+        original = sorted(result["original_ms"] for result in group if result.get("original_ms") is not None)
+        entry = {
+            "count": len(group),
+            "errors": sum(1 for r in group if r["status"] is None or r["status"] >= 500),
+            "status_mismatches": sum(
+                1 for r in group if r.get("original_status") is not None and r["status"] != r["original_status"]
+            ),
+            "mean_ms": sum(latencies) / len(latencies),
+            "max_ms": latencies[-1],
+            "max_lag_ms": max(result["lag_ms"] for result in group),
+        }
+        for pct in PERCENTILES:
+            entry[f"p{pct}_ms"] = _percentile(latencies, pct)
+            if original:
+                entry[f"original_p{pct}_ms"] = _percentile(original, pct)
+        summary[key] = entry
+    return summary
+
+
+def format_summary(summary: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    header = f"{'route':<48} {'count':>6} {'err':>5} {'diff':>5} {'p50':>9} {'p90':>9} {'p99':>9} {'capt p50':>9}"
+    if baseline is not None:
+        header += f" {'p50 chg':>8} {'p99 chg':>8}"
+    lines = [header]
+    for key, entry in summary.items():
+        line = (
+            f"{key[:48]:<48} {entry['count']:>6} {entry['errors']:>5} {entry['status_mismatches']:>5} "
+            f"{entry['p50_ms']:>7.1f}ms {entry['p90_ms']:>7.1f}ms {entry['p99_ms']:>7.1f}ms "
+            + (f"{entry['original_p50_ms']:>7.1f}ms" if "original_p50_ms" in entry else f"{'-':>9}")
+        )
+        if baseline is not None:
+            old = baseline.get(key)
+            for pct in (50, 99):
+                if old and old[f"p{pct}_ms"]:
+                    line += f" {entry[f'p{pct}_ms'] / old[f'p{pct}_ms'] - 1:>+8.1%}"
+                else:
+                    line += f" {'new':>8}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+async def _run(args) -> Dict[str, Any]:
+    records = read_traces(args.traces)
+    if args.limit:
+        records = records[: args.limit]
+    replayer = Replayer(token=args.token, keep_ids=args.keep_ids)
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.target, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        results = await replay(records, client, replayer, args.speed, args.max_in_flight)
+        elapsed = time.perf_counter() - started
+    captured = records[-1]["ts"] - records[0]["ts"] if records else 0.0
+    return {
+        "meta": {
+            "traces": args.traces,
+            "target": args.target,
+            "speed": args.speed,
+            "requests": len(records),
+            "captured_seconds": round(captured, 3),
+            "replay_seconds": round(elapsed, 3),
+            "run_id": replayer.run_id,
+        },
+        "routes": summarize(results),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay captured request traces and report latency per route")
+    parser.add_argument("traces", nargs="+", help="Capture files (.ndjson.gz), e.g. one per worker")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="Base URL of the build under test")
+    parser.add_argument("--speed", type=float, default=1.0, help="Time scale: 2 = twice as fast, 0 = no pacing")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Concurrent requests cap")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--limit", type=int, default=0, help="Only replay the first N requests")
+    parser.add_argument("--token", default=os.getenv("REPLAY_BEARER_TOKEN"), help="Bearer token for authed routes")
+    parser.add_argument("--keep-ids", action="store_true", help="Do not suffix webhook event ids")
+    parser.add_argument("--output", help="Write the report JSON here")
+    parser.add_argument("--compare", metavar="REPORT", help="Earlier report JSON to show p50/p99 changes against")
+    args = parser.parse_args()
+
+    report = asyncio.run(_run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            baseline = json.load(handle)["routes"]
+    meta = report["meta"]
+    print(
+        f"Replayed {meta['requests']} requests captured over {meta['captured_seconds']:.1f}s "
+        f"in {meta['replay_seconds']:.1f}s (speed {meta['speed']})\n"
+    )
+    print(format_summary(report["routes"], baseline))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+            handle.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
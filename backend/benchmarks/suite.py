@@ -0,0 +1,171 @@
+"""
+Benchmark suite with JSON baselines and a regression gate.
+
+Micro-benchmarks time pure functions (dedup, classifiers, shipping estimate,
+commission math); macro-benchmarks time whole requests and jobs (browse,
+product detail, cart optimize, Shopify bulk sync, Stripe webhook) against the
+in-memory Firestore mock and the fake integration servers in `fakes`.
+
+    cd backend
+    python benchmarks/suite.py list
+    python benchmarks/suite.py run --save-baseline main          # benchmarks/baselines/main.json
+    python benchmarks/suite.py run --output current.json --compare main
+    python benchmarks/suite.py compare main current.json --max-regression 0.2
+
+`run --compare` and `compare` exit with status 1 when any benchmark is slower
+than the baseline's p95 by more than its tolerance (15% micro, 30% macro by
+default, or --max-regression). Baselines are machine-specific: compare runs
+from the same host.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import harness  # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def configure_environment(fakes_port: int, workdir: str, shopify_products: int):
+    """Point every integration at the fakes; must run before `app.main` is imported."""
+    fakes = f"http://127.0.0.1:{fakes_port}"
+    os.environ.update({
+        "SHOPIFY_API_BASE_URL": f"{fakes}/shopify",
+        "SHIPPO_API_BASE_URL": f"{fakes}/shippo",
+        "RAPIDAPI_AMAZON_BASE_URL": f"{fakes}/rapidapi",
+        "STRIPE_API_BASE": f"{fakes}/stripe",
+        "SHIPPO_API_KEY": "shippo_test_bench",
+        "RAPIDAPI_KEY": "rapidapi-bench",
+        "STRIPE_SECRET_KEY": "sk_test_bench",
+        "STRIPE_WEBHOOK_SECRET": "whsec_bench",
+        "SHOPIFY_BULK_POLL_INITIAL_SECONDS": "0.01",
+        "SHOPIFY_BULK_POLL_MAX_SECONDS": "0.05",
+        "FAKE_SHOPIFY_PRODUCTS": str(shopify_products),
+        "WEBHOOK_QUEUE_PATH": os.path.join(workdir, "webhook_queue.sqlite3"),
+        "EVENT_SINK_SPILL_DIR": os.path.join(workdir, "event_spill"),
+        # Keep real credentials out of a benchmark run
+        "GOOGLE_APPLICATION_CREDENTIALS": "",
+    })
+
+
+def _select(group: str, pattern: str):
+    return [
+        bench for name, bench in sorted(harness.REGISTRY.items())
+        if (group == "all" or bench.group == group) and (not pattern or pattern in name)
+    ]
+
+
+async def _run_macros(benchmarks, config, fakes_port: int, results):
+    from macro import MacroEnvironment
+
+    async with MacroEnvironment(config, fakes_port) as env:
+        for bench in benchmarks:
+            print(f"  {bench.name} ...", flush=True)
+            op = await bench.setup(env, bench.total_ops)
+            samples = await harness.measure_async(op, bench.number, bench.rounds)
+            results["benchmarks"][bench.name] = harness.result_entry(bench, samples)
+
+
+def run(args) -> int:
+    from fakes import synthetic
+
+    config = synthetic.PROFILES[args.profile]
+    results = {"meta": {**harness.environment(), "profile": args.profile}, "benchmarks": {}}
+    benchmarks = _select(args.group, args.filter)
+    if not benchmarks:
+        print("No benchmarks selected", file=sys.stderr)
+        return 2
+
+    for bench in benchmarks:
+        if bench.group == harness.MICRO:
+            print(f"  {bench.name} ...", flush=True)
+            samples = harness.measure(bench.setup(), bench.number, bench.rounds)
+            results["benchmarks"][bench.name] = harness.result_entry(bench, samples)
+    macros = [bench for bench in benchmarks if bench.group == harness.MACRO]
+    if macros:
+        asyncio.run(_run_macros(macros, config, args.fakes_port, results))
+
+    print()
+    print(harness.format_results(results))
+    if args.output:
+        harness.save(results, args.output)
+    if args.save_baseline:
+        path = harness.baseline_path(args.save_baseline)
+        harness.save(results, path)
+        print(f"\nBaseline written to {path}")
+    if args.compare:
+        return _report(harness.load(harness.baseline_path(args.compare)), results, args)
+    return 0
+
+
+def _report(baseline, current, args) -> int:
+    rows, regressions = harness.compare(baseline, current, args.metric, args.max_regression)
+    print()
+    print(harness.format_comparison(rows, args.metric))
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run and compare performance benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_compare_options(sub):
+        sub.add_argument("--metric", choices=harness.METRICS, default="median")
+        sub.add_argument(
+            "--max-regression", type=float, default=None,
+            help="Allowed slowdown for every benchmark (0.2 = 20%%); defaults to each benchmark's tolerance",
+        )
+
+    commands.add_parser("list", help="List registered benchmarks")
+
+    run_parser = commands.add_parser("run", help="Run benchmarks")
+    run_parser.add_argument("--group", choices=["all", harness.MICRO, harness.MACRO], default="all")
+    run_parser.add_argument("-k", "--filter", default="", help="Only benchmarks whose name contains this")
+    run_parser.add_argument("--profile", default="small", help="fakes.synthetic profile seeded for macro runs")
+    run_parser.add_argument("--shopify-products", type=int, default=500, help="Products per fake Shopify bulk sync")
+    run_parser.add_argument("--output", help="Write results JSON here")
+    run_parser.add_argument("--save-baseline", metavar="NAME", help="Also write benchmarks/baselines/NAME.json")
+    run_parser.add_argument("--compare", metavar="BASELINE", help="Baseline name or path to gate against")
+    add_compare_options(run_parser)
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    add_compare_options(compare_parser)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        return _report(
+            harness.load(harness.baseline_path(args.baseline)), harness.load(harness.baseline_path(args.current)), args
+        )
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    args.fakes_port = _free_port()
+    configure_environment(args.fakes_port, workdir, getattr(args, "shopify_products", 500))
+    import macro  # noqa: F401,E402  (registers benchmarks; imports app.main)
+    import micro  # noqa: F401,E402
+
+    if args.command == "list":
+        for name, bench in sorted(harness.REGISTRY.items()):
+            print(f"{name:<40} {bench.description}")
+        return 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Conditional GET support for the public catalogue endpoints.
+
+Every product and every page of `/api/products` has a version. Versions live
+in memory and are bumped by a Firestore write listener (see
+`db_instrumentation.add_write_listener`) whenever a product, Shopify listing
+or affiliate listing is written: listing upserts from syncs and webhooks,
+inventory updates, admin edits. A write to a product or a listing that names
+its `product_id` bumps that product; any catalogue write bumps the pages.
+
+ETags are strong: a digest of the rendered body, so every worker produces
+the same tag for the same content. After a response is rendered its ETag
+is remembered together with the version it was built from. While that
+version is current, a matching `If-None-Match` is answered with 304 before
+the handler touches Firestore. Writes made by another worker cannot bump
+this worker's versions, so remembered ETags are only trusted for
+`CATALOG_ETAG_TTL_SECONDS`. After that the handler runs again, and a
+request whose tag still matches the fresh body also gets a 304.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from database import AFFILIATE_PRODUCTS, PRODUCTS, SHOPIFY_LISTINGS
+from db_instrumentation import add_write_listener
+from fast_json import dumps
+
+CATALOG_COLLECTIONS = frozenset({PRODUCTS, SHOPIFY_LISTINGS, AFFILIATE_PRODUCTS})
+
+# Browsers revalidate with If-None-Match; the CDN may serve a stale copy while it does
+PRODUCTS_CACHE_CONTROL = os.getenv(
+    "PRODUCTS_CACHE_CONTROL", "public, max-age=30, stale-while-revalidate=300"
+)
+PRODUCT_DETAIL_CACHE_CONTROL = os.getenv(
+    "PRODUCT_DETAIL_CACHE_CONTROL", "public, max-age=60, stale-while-revalidate=600"
+)
+
+Version = Tuple[int, int]
+PRODUCT_PREFIX = "product:"
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison, as RFC 9110 prescribes for If-None-Match."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+class CatalogETags:
+    """Per-product and per-page versions plus the ETags last rendered for them."""
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl = ttl_seconds if ttl_seconds is not None else float(
+            os.getenv("CATALOG_ETAG_TTL_SECONDS", "30")
+        )
+        self.max_entries = max_entries or int(os.getenv("CATALOG_ETAG_CACHE_SIZE", "20000"))
+        self._product_versions: Dict[str, int] = {}
+        # Bumped when a listing write cannot be tied to a product
+        self._products_generation = 0
+        self._pages_version = 0
+        # key -> (version, etag, expires_at, listing ids in the body)
+        self._entries: "OrderedDict[str, Tuple[Version, str, float, Tuple[str, ...]]]" = OrderedDict()
+        self._products_by_listing: Dict[str, Set[str]] = {}
+        self._not_modified = 0
+        self._rendered = 0
+
+    # ------------------------------------------------------------------
+    # Versions
+    # ------------------------------------------------------------------
+    @staticmethod
+    def product_key(product_id: str) -> str:
+        return PRODUCT_PREFIX + product_id
+
+    @staticmethod
+    def page_key(**params: Any) -> str:
+        return "products?" + "&".join(f"{name}={params[name]}" for name in sorted(params))
+
+    def product_version(self, product_id: str) -> Version:
+        return (self._products_generation, self._product_versions.get(product_id, 0))
+
+    def pages_version(self) -> Version:
+        return (self._pages_version, 0)
+
+    def version_for(self, key: str) -> Version:
+        if key.startswith(PRODUCT_PREFIX):
+            return self.product_version(key[len(PRODUCT_PREFIX):])
+        return self.pages_version()
+
+    def bump_product(self, product_id: str):
+        self._product_versions[product_id] = self._product_versions.get(product_id, 0) + 1
+        self._pages_version += 1
+
+    def bump_all(self):
+        self._products_generation += 1
+        self._pages_version += 1
+
+    def on_write(self, collection: str, doc_id: str, data: Optional[Dict[str, Any]]):
+        """Firestore write listener: bump whatever the written document can change."""
+        if collection not in CATALOG_COLLECTIONS:
+            return
+        if collection == PRODUCTS:
+            self.bump_product(doc_id)
+            return
+        product_id = (data or {}).get("product_id")
+        if product_id:
+            self.bump_product(product_id)
+            return
+        # Partial listing updates (inventory, status) and deletes do not name the product
+        products = self._products_by_listing.get(doc_id)
+        if products:
+            for product_id in list(products):
+                self.bump_product(product_id)
+        elif data is not None and data.get("status") == "active":
+            # A listing we never rendered became visible somewhere
+            self.bump_all()
+        else:
+            self._pages_version += 1
+
+    # ------------------------------------------------------------------
+    # ETags
+    # ------------------------------------------------------------------
+    def check(self, request: Request, key: str, version: Version, cache_control: str) -> Optional[Response]:
+        """A 304 when the client's tag matches the remembered, still-current one; no I/O."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version or entry[2] < time.monotonic():
+            return None
+        if not etag_matches(request, entry[1]):
+            return None
+        self._not_modified += 1
+        return not_modified(entry[1], cache_control)
+
+    def respond(
+        self,
+        request: Request,
+        key: str,
+        version: Version,
+        content: Any,
+        cache_control: str,
+        listing_ids: Iterable[str] = (),
+    ) -> Response:
+        """Render `content`, remember its ETag for `version` and answer 200 or 304."""
+        body = dumps(content)
+        etag = etag_for(body)
+        self._rendered += 1
+        # A write that landed while the handler was reading leaves the body unconfirmed
+        if version == self.version_for(key):
+            self._remember(key, version, etag, tuple(listing_ids))
+        if etag_matches(request, etag):
+            self._not_modified += 1
+            return not_modified(etag, cache_control)
+        return Response(
+            body, media_type="application/json", headers={"ETag": etag, "Cache-Control": cache_control}
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "tracked_products": len(self._product_versions),
+            "pages_version": self._pages_version,
+            "products_generation": self._products_generation,
+            "rendered": self._rendered,
+            "not_modified": self._not_modified,
+        }
+
+    def clear(self):
+        self._entries.clear()
+        self._products_by_listing.clear()
+
+    def _remember(self, key: str, version: Version, etag: str, listing_ids: Tuple[str, ...]):
+        self._forget(key)
+        self._entries[key] = (version, etag, time.monotonic() + self.ttl, listing_ids)
+        if listing_ids:
+            product_id = key[len(PRODUCT_PREFIX):]
+            for listing_id in listing_ids:
+                self._products_by_listing.setdefault(listing_id, set()).add(product_id)
+        while len(self._entries) > self.max_entries:
+            self._forget(next(iter(self._entries)))
+
+    def _forget(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None or not entry[3]:
+            return
+        product_id = key[len(PRODUCT_PREFIX):]
+        for listing_id in entry[3]:
+            products = self._products_by_listing.get(listing_id)
+            if products is not None:
+                products.discard(product_id)
+                if not products:
+                    del self._products_by_listing[listing_id]
+
+
+@lru_cache(maxsize=1)
+def get_catalog_etags() -> CatalogETags:
+    """Shared instance, registered as a Firestore write listener on first use."""
+    etags = CatalogETags()
+    add_write_listener(etags.on_write)
+    return etags
@@ -0,0 +1,76 @@
+"""
+Content-hash change detection so unchanged listings are not rewritten.
+"""
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import repository
+
+# Bookkeeping fields that change on every write and are not part of the content
+VOLATILE_FIELDS = ("content_hash", "created_at", "updated_at")
+
+
+def content_hash(data: Dict[str, Any]) -> str:
+    """Stable digest of a document's content, ignoring bookkeeping fields."""
+    content = {key: value for key, value in data.items() if key not in VOLATILE_FIELDS}
+    encoded = json.dumps(content, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+class WriteTracker:
+    """Content hashes seen during one sync run, plus written/skipped counters.
+
+    Partial updates that bypass `set_if_changed` (inventory webhooks, price
+    refreshes) must reset `content_hash` on the doc so the next full write is
+    not skipped.
+    """
+
+    def __init__(self):
+        self.hashes: Dict[str, str] = {}
+        self.written = 0
+        self.skipped = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"written": self.written, "skipped": self.skipped}
+
+
+async def set_if_changed(
+    collection: str,
+    doc_id: str,
+    data: Dict[str, Any],
+    tracker: Optional[WriteTracker] = None,
+) -> bool:
+    """Write `data` to the document unless its content hash matches the stored one.
+
+    Keeps the original `created_at` and only bumps `updated_at` on real
+    changes. Returns True when the document was written.
+    """
+    digest = content_hash(data)
+    if tracker is not None and tracker.hashes.get(doc_id) == digest:
+        tracker.skipped += 1
+        return False
+
+    previous = await repository.get_doc(collection, doc_id) or {}
+    if tracker is not None:
+        tracker.hashes[doc_id] = digest
+    if previous.get("content_hash") == digest:
+        if tracker is not None:
+            tracker.skipped += 1
+        return False
+
+    now = datetime.utcnow()
+    await repository.set_doc(
+        collection,
+        doc_id,
+        {
+            **data,
+            "content_hash": digest,
+            "created_at": previous.get("created_at") or now,
+            "updated_at": now,
+        },
+    )
+    if tracker is not None:
+        tracker.written += 1
+    return True
@@ -1,11 +1,15 @@
 """
 Firestore database connection for GeoCheapest v2
 """
+import itertools
 import logging
 import os
 from typing import Optional
+from google.api_core import exceptions as gcp_exceptions
 from google.cloud import firestore
 
+from db_instrumentation import InstrumentedClient
+
 logger = logging.getLogger(__name__)
 
 _db_client: Optional[firestore.Client] = None
@@ -17,6 +21,9 @@ def _create_client() -> firestore.AsyncClient:
 
 
 _mock_db_data = {} # Global storage for the mock DB
+# (collection, doc id) -> opaque update time, for write preconditions
+_mock_update_times = {}
+_mock_clock = itertools.count(1)
 
 class MockCollection:
     def __init__(self, name):
@@ -24,6 +31,8 @@ class MockCollection:
         if name not in _mock_db_data:
             _mock_db_data[name] = {}
         self.filters = []
+        self.order_field = None
+        self.order_desc = False
         self.limit_val = None
         self.offset_val = 0
 
@@ -37,6 +46,11 @@ class MockCollection:
         self.filters.append((field, op, value))
         return self
 
+    def order_by(self, field, direction="ASCENDING"):
+        self.order_field = field
+        self.order_desc = direction == "DESCENDING"
+        return self
+
     def limit(self, n):
         self.limit_val = n
         return self
@@ -74,6 +88,10 @@ class MockCollection:
                         break
             if match:
                 docs.append(MockSnapshot(True, doc_id, data, self.name))
+
+        if self.order_field:
+            docs = [d for d in docs if d.to_dict().get(self.order_field) is not None]
+            docs.sort(key=lambda d: d.to_dict()[self.order_field], reverse=self.order_desc)
         
         if hasattr(self, 'offset_val') and self.offset_val:
             docs = docs[self.offset_val:]
@@ -86,25 +104,76 @@ class MockCollection:
     def __iter__(self):
         return iter(self._get_docs())
 
+def _merge_fields(target: dict, data: dict):
+    """Apply a `set(..., merge=True)` payload: nested maps merge, DELETE_FIELD removes."""
+    for key, value in data.items():
+        if value is firestore.DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _merge_fields(target[key], value)
+        else:
+            target[key] = value
+
+
+class MockWriteOption:
+    def __init__(self, last_update_time=None):
+        self.last_update_time = last_update_time
+
+
+class MockWriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
 class MockDocument:
     def __init__(self, col_name, doc_id):
         self.col_name = col_name
         self.id = doc_id
         self.reference = self
 
-    async def set(self, data):
+    def _touch(self) -> MockWriteResult:
+        update_time = next(_mock_clock)
+        _mock_update_times[(self.col_name, self.id)] = update_time
+        return MockWriteResult(update_time)
+
+    def _check(self, option):
+        if option is None:
+            return
+        if _mock_update_times.get((self.col_name, self.id)) != option.last_update_time:
+            raise gcp_exceptions.FailedPrecondition(f"{self.col_name}/{self.id} was modified")
+
+    async def set(self, data, merge=False):
         logger.info(f"MOCK DB: Set {self.col_name}/{self.id}")
         if self.col_name not in _mock_db_data:
             _mock_db_data[self.col_name] = {}
-        _mock_db_data[self.col_name][self.id] = data
+        if merge:
+            _merge_fields(_mock_db_data[self.col_name].setdefault(self.id, {}), data)
+        else:
+            _mock_db_data[self.col_name][self.id] = dict(data)
+        return self._touch()
+
+    async def create(self, data):
+        if self.id in _mock_db_data.get(self.col_name, {}):
+            raise gcp_exceptions.AlreadyExists(f"{self.col_name}/{self.id} already exists")
+        return await self.set(data)
 
-    async def update(self, data):
+    async def update(self, data, option=None):
         logger.info(f"MOCK DB: Update {self.col_name}/{self.id}")
+        self._check(option)
         if self.col_name not in _mock_db_data:
             _mock_db_data[self.col_name] = {}
         if self.id not in _mock_db_data[self.col_name]:
              _mock_db_data[self.col_name][self.id] = {}
         _mock_db_data[self.col_name][self.id].update(data)
+        return self._touch()
+
+    async def delete(self, option=None):
+        logger.info(f"MOCK DB: Delete {self.col_name}/{self.id}")
+        self._check(option)
+        _mock_db_data.get(self.col_name, {}).pop(self.id, None)
+        _mock_update_times.pop((self.col_name, self.id), None)
 
     async def get(self):
         exists = False
@@ -120,14 +189,43 @@ class MockSnapshot:
         self.id = doc_id
         self._data = data
         self.reference = MockDocument(col_name, doc_id)
+        self.update_time = _mock_update_times.get((col_name, doc_id)) if exists else None
 
     def to_dict(self):
         return self._data
 
+class MockWriteBatch:
+    def __init__(self):
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append((ref.set, (data, merge)))
+
+    def update(self, ref, data):
+        self._ops.append((ref.update, (data,)))
+
+    def delete(self, ref):
+        self._ops.append((ref.delete, ()))
+
+    async def commit(self):
+        ops, self._ops = self._ops, []
+        for op, args in ops:
+            await op(*args)
+
 class MockFirestoreClient:
     def collection(self, name):
         return MockCollection(name)
 
+    def batch(self):
+        return MockWriteBatch()
+
+    def write_option(self, last_update_time=None):
+        return MockWriteOption(last_update_time)
+
+    async def get_all(self, references):
+        for ref in references:
+            yield await ref.get()
+
 class FirestoreProxy:
     """Lazy Firestore client that avoids initialization at import time."""
 
@@ -146,7 +244,11 @@ class FirestoreProxy:
 
     def __getattr__(self, name):
         client = self._ensure_client()
-        return getattr(client, name)
+        wrapped = self.__dict__.get("_wrapped")
+        # Rewrap if the underlying client was swapped (e.g. by tests)
+        if wrapped is None or wrapped._ref is not client:
+            wrapped = self.__dict__["_wrapped"] = InstrumentedClient(client)
+        return getattr(wrapped, name)
 
 
 db = FirestoreProxy()
@@ -164,4 +266,8 @@ VENDOR_COMMISSION_OVERRIDES = "vendorCommissionOverrides"
 RETURN_REQUESTS = "returnRequests"
 OAUTH_NONCES = "oauth_nonces"
 USERS = "users"
+PRICE_STATS = "priceStats"
+DEALS = "deals"
+INVENTORY_ITEM_INDEX = "inventoryItemIndex"
+SYNC_LEASES = "syncLeases"
 
@@ -0,0 +1,372 @@
+"""
+Thin wrappers around the Firestore client that time and count every operation.
+
+`database.db` hands out these wrappers instead of the raw client, so every
+caller (services, `repository`, and the routes in `app.main`) is measured
+without changes. Anything not wrapped here passes straight through.
+
+Operation counts are collected per request through a contextvar (see
+`track_db_ops`), which is what the access log, the debug headers and the
+`db_budget` test fixture read. Write listeners (`add_write_listener`) are
+told about every successful document write, e.g. to invalidate caches.
+"""
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import INTEGRATION_DURATION
+
+logger = logging.getLogger(__name__)
+
+_INTEGRATION = "firestore"
+
+
+class OpCounts:
+    """Firestore reads, queries, writes and documents returned in one scope.
+
+    Scopes nest: an op recorded in an inner scope also counts in every
+    enclosing one, so a test budget wrapped around a request still sees the
+    ops the request middleware tracks.
+    """
+
+    __slots__ = ("reads", "queries", "writes", "docs", "by_target", "_parent")
+
+    def __init__(self, parent: Optional["OpCounts"] = None):
+        self.reads = 0
+        self.queries = 0
+        self.writes = 0
+        self.docs = 0
+        # (kind, collection) -> number of separate round trips
+        self.by_target: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._parent = parent
+
+    def record(self, kind: str, collection: str, count: int = 1):
+        scope = self
+        while scope is not None:
+            if kind == "read":
+                scope.reads += count
+            elif kind == "query":
+                scope.queries += count
+            else:
+                scope.writes += count
+            scope.by_target[(kind, collection)] += 1
+            scope = scope._parent
+
+    def add_docs(self, count: int = 1):
+        scope = self
+        while scope is not None:
+            scope.docs += count
+            scope = scope._parent
+
+    def repeated(self, threshold: int) -> List[Tuple[str, str, int]]:
+        """Reads/queries against one collection issued `threshold`+ times (likely N+1)."""
+        return [
+            (kind, collection, count)
+            for (kind, collection), count in self.by_target.items()
+            if kind != "write" and count >= threshold
+        ]
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"reads": self.reads, "queries": self.queries, "writes": self.writes, "docs": self.docs}
+
+
+_op_counts: ContextVar[Optional[OpCounts]] = ContextVar("db_op_counts", default=None)
+
+
+@contextmanager
+def track_db_ops():
+    """Count Firestore operations made inside the block (and its tasks)."""
+    counts = OpCounts(parent=_op_counts.get())
+    token = _op_counts.set(counts)
+    try:
+        yield counts
+    finally:
+        _op_counts.reset(token)
+
+
+def _count(kind: str, collection: str, count: int = 1):
+    counts = _op_counts.get()
+    if counts is not None:
+        counts.record(kind, collection, count)
+
+
+def _count_docs(count: int = 1):
+    counts = _op_counts.get()
+    if counts is not None:
+        counts.add_docs(count)
+
+
+def _observe(operation: str, started: float, failed: bool):
+    INTEGRATION_DURATION.labels(_INTEGRATION, operation, "error" if failed else "ok").observe(
+        time.perf_counter() - started
+    )
+
+
+# ----------------------------------------------------------------------
+# Write listeners
+# ----------------------------------------------------------------------
+# Called as listener(collection, doc_id, data) after a write succeeds; data is
+# None for deletes and the partial field dict for updates
+WriteListener = Callable[[str, str, Optional[Dict[str, Any]]], None]
+_write_listeners: List[WriteListener] = []
+
+
+def add_write_listener(listener: WriteListener):
+    if listener not in _write_listeners:
+        _write_listeners.append(listener)
+
+
+def remove_write_listener(listener: WriteListener):
+    if listener in _write_listeners:
+        _write_listeners.remove(listener)
+
+
+def _notify(collection: str, doc_id: str, data: Optional[Dict[str, Any]]):
+    for listener in _write_listeners:
+        try:
+            listener(collection, doc_id, data)
+        except Exception as exc:
+            logger.warning("Write listener failed for %s/%s: %s", collection, doc_id, exc)
+
+
+def _unwrap(ref):
+    return getattr(ref, "_ref", ref)
+
+
+def _collection_of(ref) -> str:
+    return getattr(ref, "_collection", None) or getattr(getattr(ref, "parent", None), "id", "") or ""
+
+
+async def _timed(operation: str, awaitable):
+    """Await `awaitable` and record its latency under `operation`."""
+    started = time.perf_counter()
+    failed = True
+    try:
+        result = await awaitable
+        failed = False
+        return result
+    finally:
+        _observe(operation, started, failed)
+
+
+class InstrumentedSnapshot:
+    """Document snapshot whose `.reference` writes through the instrumented wrappers."""
+
+    __slots__ = ("_ref", "_collection")
+
+    def __init__(self, snapshot, collection: str):
+        self._ref = snapshot
+        self._collection = collection
+
+    @property
+    def id(self):
+        return self._ref.id
+
+    @property
+    def exists(self):
+        return self._ref.exists
+
+    def to_dict(self):
+        return self._ref.to_dict()
+
+    @property
+    def reference(self):
+        return InstrumentedDocument(self._ref.reference, self._collection)
+
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
+
+
+class InstrumentedStream:
+    """Async iterator over query results; records time spent waiting on Firestore."""
+
+    def __init__(self, source, collection: str, operation: str = "query"):
+        self._source = source
+        self._collection = collection
+        self._operation = operation
+
+    async def __aiter__(self):
+        if self._operation == "query":
+            _count("query", self._collection)
+        iterator = self._source.__aiter__()
+        waited = 0.0
+        failed = True
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    snapshot = await iterator.__anext__()
+                except StopAsyncIteration:
+                    waited += time.perf_counter() - started
+                    break
+                waited += time.perf_counter() - started
+                if getattr(snapshot, "exists", True):
+                    _count_docs()
+                yield InstrumentedSnapshot(snapshot, self._collection)
+            failed = False
+        finally:
+            INTEGRATION_DURATION.labels(
+                _INTEGRATION, self._operation, "error" if failed else "ok"
+            ).observe(waited)
+
+    def __iter__(self):
+        # The mock client also supports plain iteration (used by local scripts)
+        return (InstrumentedSnapshot(snapshot, self._collection) for snapshot in self._source)
+
+
+class InstrumentedQuery:
+    def __init__(self, query, collection: str):
+        self._ref = query
+        self._collection = collection
+
+    def where(self, *args, **kwargs):
+        return InstrumentedQuery(self._ref.where(*args, **kwargs), self._collection)
+
+    def order_by(self, *args, **kwargs):
+        return InstrumentedQuery(self._ref.order_by(*args, **kwargs), self._collection)
+
+    def limit(self, count):
+        return InstrumentedQuery(self._ref.limit(count), self._collection)
+
+    def offset(self, count):
+        return InstrumentedQuery(self._ref.offset(count), self._collection)
+
+    def start_after(self, *args, **kwargs):
+        args = [_unwrap(arg) for arg in args]
+        return InstrumentedQuery(self._ref.start_after(*args, **kwargs), self._collection)
+
+    def select(self, *args, **kwargs):
+        return InstrumentedQuery(self._ref.select(*args, **kwargs), self._collection)
+
+    def stream(self, *args, **kwargs):
+        return InstrumentedStream(self._ref.stream(*args, **kwargs), self._collection)
+
+    async def get(self, *args, **kwargs):
+        _count("query", self._collection)
+        results = await _timed("query", self._ref.get(*args, **kwargs))
+        _count_docs(len(results))
+        return [InstrumentedSnapshot(snapshot, self._collection) for snapshot in results]
+
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
+
+
+class InstrumentedCollection(InstrumentedQuery):
+    def document(self, *args, **kwargs):
+        return InstrumentedDocument(self._ref.document(*args, **kwargs), self._collection)
+
+    async def add(self, document_data, *args, **kwargs):
+        _count("write", self._collection)
+        result = await _timed("add", self._ref.add(document_data, *args, **kwargs))
+        if _write_listeners:
+            _notify(self._collection, result[1].id, document_data)
+        return result
+
+
+class InstrumentedDocument:
+    def __init__(self, ref, collection: str):
+        self._ref = ref
+        self._collection = collection
+
+    async def get(self, *args, **kwargs):
+        _count("read", self._collection)
+        snapshot = await _timed("get", self._ref.get(*args, **kwargs))
+        if snapshot.exists:
+            _count_docs()
+        return InstrumentedSnapshot(snapshot, self._collection)
+
+    async def set(self, document_data, *args, **kwargs):
+        _count("write", self._collection)
+        result = await _timed("set", self._ref.set(document_data, *args, **kwargs))
+        if _write_listeners:
+            _notify(self._collection, self._ref.id, document_data)
+        return result
+
+    async def update(self, document_data, *args, **kwargs):
+        _count("write", self._collection)
+        result = await _timed("update", self._ref.update(document_data, *args, **kwargs))
+        if _write_listeners:
+            _notify(self._collection, self._ref.id, document_data)
+        return result
+
+    async def delete(self, *args, **kwargs):
+        _count("write", self._collection)
+        result = await _timed("delete", self._ref.delete(*args, **kwargs))
+        if _write_listeners:
+            _notify(self._collection, self._ref.id, None)
+        return result
+
+    async def create(self, document_data, *args, **kwargs):
+        _count("write", self._collection)
+        result = await _timed("create", self._ref.create(document_data, *args, **kwargs))
+        if _write_listeners:
+            _notify(self._collection, self._ref.id, document_data)
+        return result
+
+    def collection(self, name):
+        return InstrumentedCollection(self._ref.collection(name), name)
+
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
+
+
+class InstrumentedBatch:
+    def __init__(self, batch):
+        self._ref = batch
+        self._writes: List[Tuple[str, str, Optional[Dict[str, Any]]]] = []
+
+    def _queue(self, ref, data):
+        if _write_listeners:
+            self._writes.append((_collection_of(ref), _unwrap(ref).id, data))
+
+    def set(self, ref, document_data, *args, **kwargs):
+        _count("write", _collection_of(ref))
+        self._queue(ref, document_data)
+        return self._ref.set(_unwrap(ref), document_data, *args, **kwargs)
+
+    def update(self, ref, field_updates, *args, **kwargs):
+        _count("write", _collection_of(ref))
+        self._queue(ref, field_updates)
+        return self._ref.update(_unwrap(ref), field_updates, *args, **kwargs)
+
+    def delete(self, ref, *args, **kwargs):
+        _count("write", _collection_of(ref))
+        self._queue(ref, None)
+        return self._ref.delete(_unwrap(ref), *args, **kwargs)
+
+    async def commit(self, *args, **kwargs):
+        result = await _timed("batch_commit", self._ref.commit(*args, **kwargs))
+        writes, self._writes = self._writes, []
+        for collection, doc_id, data in writes:
+            _notify(collection, doc_id, data)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
+
+
+class InstrumentedClient:
+    def __init__(self, client):
+        self._ref = client
+
+    def collection(self, name):
+        return InstrumentedCollection(self._ref.collection(name), name)
+
+    def batch(self):
+        return InstrumentedBatch(self._ref.batch())
+
+    def get_all(self, references, *args, **kwargs):
+        references = list(references)
+        collection = _collection_of(references[0]) if references else ""
+        _count("read", collection, len(references))
+        return InstrumentedStream(
+            self._ref.get_all([_unwrap(ref) for ref in references], *args, **kwargs),
+            collection,
+            operation="get_all",
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._ref, name)
@@ -0,0 +1,299 @@
+"""
+Deal detection: flag listings priced below the market for their product.
+
+`priceStats/{product_id}` holds the product's distribution as three maps:
+live vendor prices, recent prices keyed by observation time, and the
+listings currently flagged as deals. Every instance writes only the entries
+a listing change touched (a merge write), so concurrent instances never
+overwrite each other's updates. The in-process copies are a read cache for
+scoring and are reloaded after `DEAL_CACHE_TTL_SECONDS`.
+"""
+import bisect
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.cloud import firestore
+
+import repository
+from database import AFFILIATE_PRODUCTS, DEALS, PRICE_STATS, SHOPIFY_LISTINGS
+
+logger = logging.getLogger(__name__)
+
+
+class PriceDistribution:
+    """Live vendor prices plus a bounded window of recent prices for one product.
+
+    Both views are kept sorted on insert so median and percentile lookups are
+    constant time when a listing price changes. Mutations are also recorded
+    as pending field changes; `take_changes` returns them as a merge payload.
+    """
+
+    def __init__(self, history_size: int):
+        self.vendors: Dict[str, float] = {}
+        self.history: deque = deque(maxlen=history_size)
+        self.flagged: set = set()
+        self._history_keys: deque = deque(maxlen=history_size)
+        self._vendor_prices: List[float] = []
+        self._history_prices: List[float] = []
+        self._pending: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], history_size: int) -> "PriceDistribution":
+        dist = cls(history_size)
+        for listing_id, price in (data.get("vendors") or {}).items():
+            dist._set_vendor(listing_id, float(price))
+        entries = sorted((data.get("history") or {}).items())
+        # Entries other instances pushed past the window are trimmed on the next write
+        for key, _ in entries[:-history_size]:
+            dist._record("history", key, firestore.DELETE_FIELD)
+        for key, price in entries[-history_size:]:
+            dist._push_history(key, float(price))
+        dist.flagged = set(data.get("deals") or {})
+        return dist
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "vendors": dict(self.vendors),
+            "history": dict(zip(self._history_keys, self.history)),
+            "deals": {listing_id: True for listing_id in self.flagged},
+        }
+
+    def observe(self, listing_id: str, price: float) -> bool:
+        """Record a live price; returns False when the price is unchanged."""
+        if self.vendors.get(listing_id) == price:
+            return False
+        self._set_vendor(listing_id, price)
+        self._record("vendors", listing_id, price)
+        key = f"{time.time_ns():020d}-{listing_id}"
+        evicted = self._push_history(key, price)
+        self._record("history", key, price)
+        if evicted is not None:
+            self._record("history", evicted, firestore.DELETE_FIELD)
+        return True
+
+    def remove(self, listing_id: str) -> bool:
+        previous = self.vendors.pop(listing_id, None)
+        if previous is None:
+            return False
+        self._vendor_prices.pop(bisect.bisect_left(self._vendor_prices, previous))
+        self._record("vendors", listing_id, firestore.DELETE_FIELD)
+        return True
+
+    def flag(self, listing_id: str):
+        self.flagged.add(listing_id)
+        self._record("deals", listing_id, True)
+
+    def unflag(self, listing_id: str):
+        self.flagged.discard(listing_id)
+        self._record("deals", listing_id, firestore.DELETE_FIELD)
+
+    def take_changes(self) -> Dict[str, Any]:
+        """Pending field changes as a `set(..., merge=True)` payload, then clear them."""
+        changes, self._pending = self._pending, {}
+        return changes
+
+    def median(self) -> Optional[float]:
+        return self._median(self._vendor_prices) or self._median(self._history_prices)
+
+    def history_percentile(self, q: float) -> Optional[float]:
+        prices = self._history_prices
+        if not prices:
+            return None
+        index = min(len(prices) - 1, max(0, int(round(q * (len(prices) - 1)))))
+        return prices[index]
+
+    def percentile_rank(self, price: float) -> float:
+        prices = self._history_prices
+        if not prices:
+            return 0.5
+        return bisect.bisect_left(prices, price) / len(prices)
+
+    def _record(self, field: str, key: str, value: Any):
+        self._pending.setdefault(field, {})[key] = value
+
+    def _set_vendor(self, listing_id: str, price: float):
+        previous = self.vendors.get(listing_id)
+        if previous is not None:
+            self._vendor_prices.pop(bisect.bisect_left(self._vendor_prices, previous))
+        self.vendors[listing_id] = price
+        bisect.insort(self._vendor_prices, price)
+
+    def _push_history(self, key: str, price: float) -> Optional[str]:
+        """Append a price; returns the key of the entry that aged out, if any."""
+        evicted = None
+        if self.history.maxlen and len(self.history) == self.history.maxlen:
+            oldest = self.history[0]
+            evicted = self._history_keys[0]
+            self._history_prices.pop(bisect.bisect_left(self._history_prices, oldest))
+        self.history.append(price)
+        self._history_keys.append(key)
+        bisect.insort(self._history_prices, price)
+        return evicted
+
+    @staticmethod
+    def _median(prices: List[float]) -> Optional[float]:
+        if not prices:
+            return None
+        mid = len(prices) // 2
+        if len(prices) % 2:
+            return prices[mid]
+        return (prices[mid - 1] + prices[mid]) / 2
+
+
+class DealService:
+    """Score listing price changes against their product's price distribution."""
+
+    def __init__(self):
+        self.min_discount = float(os.getenv("DEAL_MIN_DISCOUNT", "0.10"))
+        self.max_percentile = float(os.getenv("DEAL_MAX_PERCENTILE", "0.25"))
+        self.min_samples = int(os.getenv("DEAL_MIN_SAMPLES", "3"))
+        self.history_size = int(os.getenv("DEAL_HISTORY_SIZE", "50"))
+        self.cache_size = int(os.getenv("DEAL_CACHE_SIZE", "5000"))
+        self.cache_ttl = float(os.getenv("DEAL_CACHE_TTL_SECONDS", "60"))
+        # product id -> (distribution, monotonic expiry)
+        self._distributions: "OrderedDict[str, Tuple[PriceDistribution, float]]" = OrderedDict()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    async def observe_listing(
+        self,
+        product_id: str,
+        listing_id: str,
+        price: Optional[float],
+        active: bool,
+        listing: Dict[str, Any],
+    ):
+        """Update the product distribution and the `deals` index for one listing."""
+        if not product_id or not listing_id:
+            return
+        try:
+            dist = await self._get_distribution(product_id)
+            if active and price and price > 0:
+                changed = dist.observe(listing_id, float(price))
+            else:
+                changed = dist.remove(listing_id)
+            if not changed:
+                return
+
+            await self._rescore(product_id, dist, {listing_id: listing})
+            await repository.set_doc(
+                PRICE_STATS,
+                product_id,
+                {**dist.take_changes(), "updated_at": datetime.utcnow()},
+                merge=True,
+            )
+        except Exception as exc:
+            # The cached copy may now disagree with Firestore; reload it next time
+            self._distributions.pop(product_id, None)
+            logger.error("Deal scoring failed for %s/%s: %s", product_id, listing_id, exc)
+
+    async def get_deals(
+        self, limit: int = 20, category: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Read the ranked deals index."""
+        filters = [("category", "==", category)] if category else []
+        return await repository.query(
+            DEALS, filters, order_by="score", descending=True, limit=limit
+        )
+
+    def score(self, dist: PriceDistribution, price: float) -> Optional[Dict[str, float]]:
+        """Return deal metrics for a price, or None if it is not a deal."""
+        market_price = dist.median()
+        samples = max(len(dist.vendors), len(dist.history))
+        if not market_price or samples < self.min_samples:
+            return None
+
+        discount = (market_price - price) / market_price
+        ceiling = dist.history_percentile(self.max_percentile)
+        if discount < self.min_discount or (ceiling is not None and price > ceiling):
+            return None
+
+        return {
+            "market_price": round(market_price, 2),
+            "discount": round(discount, 4),
+            "percentile": round(dist.percentile_rank(price), 4),
+            "score": round(discount, 4),
+        }
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    async def _get_distribution(self, product_id: str) -> PriceDistribution:
+        cached = self._distributions.get(product_id)
+        if cached is not None and cached[1] > time.monotonic():
+            self._distributions.move_to_end(product_id)
+            return cached[0]
+
+        # Other instances write to the same document; reload rather than trust a stale copy
+        data = await repository.get_doc(PRICE_STATS, product_id)
+        dist = PriceDistribution.from_dict(data or {}, self.history_size)
+        self._distributions[product_id] = (dist, time.monotonic() + self.cache_ttl)
+        self._distributions.move_to_end(product_id)
+        if len(self._distributions) > self.cache_size:
+            self._distributions.popitem(last=False)
+        return dist
+
+    async def _rescore(
+        self,
+        product_id: str,
+        dist: PriceDistribution,
+        listing_info: Dict[str, Dict[str, Any]],
+    ):
+        # A price change moves the market for every vendor of the product, so
+        # re-evaluate them all; only listings whose deal status changes are written.
+        for listing_id in list(dist.flagged | set(dist.vendors)):
+            price = dist.vendors.get(listing_id)
+            metrics = self.score(dist, price) if price is not None else None
+
+            if metrics is None:
+                if listing_id in dist.flagged:
+                    dist.unflag(listing_id)
+                    await repository.delete_doc(DEALS, listing_id)
+                continue
+
+            listing = listing_info.get(listing_id)
+            if listing is None:
+                if listing_id in dist.flagged:
+                    await repository.update_doc(
+                        DEALS, listing_id, {**metrics, "updated_at": datetime.utcnow()}
+                    )
+                    continue
+                listing = await repository.get_doc(
+                    self._listing_collection(listing_id), listing_id
+                ) or {}
+
+            dist.flag(listing_id)
+            await repository.set_doc(
+                DEALS,
+                listing_id,
+                {
+                    **metrics,
+                    "product_id": product_id,
+                    "listing_id": listing_id,
+                    "price": price,
+                    "product_name": listing.get("product_name") or listing.get("title"),
+                    "category": listing.get("product_game") or listing.get("game"),
+                    "source": listing.get("source") or "shopify",
+                    "source_name": listing.get("store_name") or listing.get("affiliate_name"),
+                    "url": listing.get("affiliate_url"),
+                    "updated_at": datetime.utcnow(),
+                },
+            )
+
+    @staticmethod
+    def _listing_collection(listing_id: str) -> str:
+        if listing_id.startswith(("amazon_", "ebay_")):
+            return AFFILIATE_PRODUCTS
+        return SHOPIFY_LISTINGS
+
+
+@lru_cache(maxsize=1)
+def get_deal_service() -> DealService:
+    """Shared instance so every ingestion path updates the same distributions."""
+    return DealService()
@@ -0,0 +1,248 @@
+"""
+Background sink for analytics and audit events.
+
+Request handlers call `emit()`, which only appends to a bounded in-memory
+ring buffer. A worker task drains the buffer in batches (by size or by time)
+and hands each batch to the writer, e.g. a BigQuery streaming insert. When
+the writer fails, batches are spilled to local NDJSON files and re-sent once
+the writer recovers or the process restarts.
+
+Several workers may share the spill directory, so a file is claimed by
+renaming it to `<name>.replaying.<pid>` before it is read; a claim that is
+older than EVENT_SINK_CLAIM_SECONDS was left by a crashed worker and can be
+taken over.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EventWriter = Callable[[str, str, List[Dict[str, Any]]], Awaitable[None]]
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+
+class EventSink:
+    """Bounded ring buffer flushed in batches by a background worker."""
+
+    def __init__(
+        self,
+        writer: EventWriter,
+        capacity: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        spill_dir: Optional[str] = None,
+        drop_policy: Optional[str] = None,
+    ):
+        self.writer = writer
+        self.capacity = capacity or int(os.getenv("EVENT_SINK_CAPACITY", "10000"))
+        self.batch_size = batch_size or int(os.getenv("EVENT_SINK_BATCH_SIZE", "500"))
+        self.flush_interval = flush_interval or float(os.getenv("EVENT_SINK_FLUSH_SECONDS", "2.0"))
+        self.spill_dir = spill_dir or os.getenv("EVENT_SINK_SPILL_DIR", "event_spill")
+        self.drop_policy = drop_policy or os.getenv("EVENT_SINK_DROP_POLICY", DROP_OLDEST)
+        self.retry_backoff = float(os.getenv("EVENT_SINK_RETRY_SECONDS", "30"))
+        self.claim_timeout = float(os.getenv("EVENT_SINK_CLAIM_SECONDS", "300"))
+        if self.drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {self.drop_policy}")
+
+        self._buffer: deque = deque(maxlen=self.capacity)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._unavailable_until = 0.0
+        self._spill_seq = 0
+
+        self._emitted = 0
+        self._flushed: Dict[str, int] = defaultdict(int)
+        self._dropped = 0
+        self._spilled = 0
+        self._replayed = 0
+        self._failed_batches = 0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def emit(self, dataset: str, table: str, data: Dict[str, Any]) -> bool:
+        """Buffer an event without blocking. Returns False if it was dropped."""
+        if len(self._buffer) >= self.capacity:
+            self._dropped += 1
+            if self.drop_policy == DROP_NEWEST:
+                return False
+            # deque(maxlen) evicts the oldest event on append
+        self._buffer.append((dataset, table, data))
+        self._emitted += 1
+        if self._wakeup is not None and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def start(self):
+        if self._worker is not None:
+            return
+        self._wakeup = asyncio.Event()
+        # The worker replays spills left by earlier runs on its first pass
+        self._worker = asyncio.create_task(self._run())
+        logger.info("Event sink started (capacity=%s, batch=%s)", self.capacity, self.batch_size)
+
+    async def stop(self):
+        worker, self._worker = self._worker, None
+        if worker is not None:
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        # Whatever is still buffered goes to the writer, or to disk if it is down
+        await self.flush()
+
+    async def flush(self):
+        """Drain the buffer now, one writer call per (dataset, table) batch."""
+        while self._buffer:
+            groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+            for _ in range(min(self.batch_size, len(self._buffer))):
+                dataset, table, data = self._buffer.popleft()
+                groups[(dataset, table)].append(data)
+            for (dataset, table), rows in groups.items():
+                await self._write(dataset, table, rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered": len(self._buffer),
+            "capacity": self.capacity,
+            "drop_policy": self.drop_policy,
+            "emitted": self._emitted,
+            "flushed": dict(self._flushed),
+            "dropped": self._dropped,
+            "spilled": self._spilled,
+            "replayed": self._replayed,
+            "failed_batches": self._failed_batches,
+            "spill_files": len(self._spill_files()),
+            "writer_available": time.monotonic() >= self._unavailable_until,
+        }
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+    async def _run(self):
+        while True:
+            try:
+                await self.flush()
+                if time.monotonic() >= self._unavailable_until:
+                    await self._replay_spills()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.error(f"Event sink flush failed: {exc}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _write(self, dataset: str, table: str, rows: List[Dict[str, Any]]):
+        if time.monotonic() < self._unavailable_until:
+            await self._spill(dataset, table, rows)
+            return
+        try:
+            await self.writer(dataset, table, rows)
+            self._flushed[f"{dataset}.{table}"] += len(rows)
+        except Exception as exc:
+            self._failed_batches += 1
+            self._unavailable_until = time.monotonic() + self.retry_backoff
+            logger.warning(
+                "Event sink writer failed for %s.%s (%s rows), spilling: %s",
+                dataset, table, len(rows), exc,
+            )
+            await self._spill(dataset, table, rows)
+
+    # ------------------------------------------------------------------
+    # Spill files
+    # ------------------------------------------------------------------
+    def _spill_files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.spill_dir, "*.ndjson")))
+
+    async def _spill(self, dataset: str, table: str, rows: List[Dict[str, Any]]):
+        self._spill_seq += 1
+        name = f"{dataset}.{table}.{int(time.time() * 1000)}-{os.getpid()}-{self._spill_seq:06d}.ndjson"
+        path = os.path.join(self.spill_dir, name)
+        try:
+            await asyncio.to_thread(self._write_ndjson, path, rows)
+            self._spilled += len(rows)
+        except Exception as exc:
+            self._dropped += len(rows)
+            logger.error(f"Event sink could not spill {len(rows)} rows to {path}: {exc}")
+
+    def _write_ndjson(self, path: str, rows: List[Dict[str, Any]]):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            for row in rows:
+                fh.write(json.dumps(row, default=str))
+                fh.write("\n")
+        os.replace(tmp_path, path)
+
+    def _stale_claims(self) -> List[str]:
+        cutoff = time.time() - self.claim_timeout
+        stale = []
+        for path in glob.glob(os.path.join(self.spill_dir, "*.ndjson.replaying.*")):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    stale.append(path)
+            except FileNotFoundError:
+                continue
+        return sorted(stale)
+
+    def _claim(self, path: str) -> Optional[str]:
+        """Rename a spill file to this process's claim; None if another worker got it first."""
+        spill_path = path.split(".replaying.", 1)[0]
+        claimed = f"{spill_path}.replaying.{os.getpid()}"
+        try:
+            os.rename(path, claimed)
+            os.utime(claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    @staticmethod
+    def _release(claimed: str, spill_path: str):
+        """Hand a claimed file back so any worker can retry it."""
+        try:
+            os.rename(claimed, spill_path)
+        except FileNotFoundError:
+            pass
+
+    async def _replay_spills(self):
+        """Re-send spilled batches; stops at the first failure and keeps the rest."""
+        for path in self._spill_files() + self._stale_claims():
+            claimed = self._claim(path)
+            if claimed is None:
+                continue
+            spill_path = claimed.split(".replaying.", 1)[0]
+            dataset, table = os.path.basename(spill_path).split(".", 2)[:2]
+            try:
+                rows = await asyncio.to_thread(self._read_ndjson, claimed)
+                await self.writer(dataset, table, rows)
+            except asyncio.CancelledError:
+                self._release(claimed, spill_path)
+                raise
+            except Exception as exc:
+                self._unavailable_until = time.monotonic() + self.retry_backoff
+                logger.warning(f"Event sink replay of {spill_path} failed: {exc}")
+                self._release(claimed, spill_path)
+                return
+            try:
+                os.remove(claimed)
+            except FileNotFoundError:
+                pass
+            self._replayed += len(rows)
+            self._flushed[f"{dataset}.{table}"] += len(rows)
+
+    @staticmethod
+    def _read_ndjson(path: str) -> List[Dict[str, Any]]:
+        with open(path, encoding="utf-8") as fh:
+            return [json.loads(line) for line in fh if line.strip()]
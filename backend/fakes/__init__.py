@@ -0,0 +1,24 @@
+"""
+Local stand-ins for the paid third-party APIs (Shopify, Shippo, RapidAPI
+Amazon, Stripe) so sync, shipping, affiliate and checkout paths can be load
+tested fully offline.
+
+    cd backend && python -m fakes --port 9100
+
+then point the backend at it:
+
+    SHOPIFY_API_BASE_URL=http://localhost:9100/shopify
+    SHIPPO_API_BASE_URL=http://localhost:9100/shippo
+    RAPIDAPI_AMAZON_BASE_URL=http://localhost:9100/rapidapi
+    STRIPE_API_BASE=http://localhost:9100/stripe
+
+Latency, error rate and 429 rate are set per integration with
+FAKE_<INTEGRATION>_LATENCY_MS / _JITTER_MS / _ERROR_RATE / _RATE_LIMIT_RATE
+(falling back to FAKE_LATENCY_MS etc.), see `fakes.faults`.
+
+`fakes.synthetic` seeds a production-sized catalogue, vendor set and order
+history into the Firestore emulator or the mock DB using the same names.
+"""
+from fakes.app import create_app
+
+__all__ = ["create_app"]
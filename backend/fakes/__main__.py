@@ -0,0 +1,15 @@
+"""
+Run the fake integration servers: `python -m fakes --port 9100`.
+"""
+import argparse
+
+import uvicorn
+
+from fakes.app import create_app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve fake Shopify/Shippo/RapidAPI/Stripe APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+    uvicorn.run(create_app(), host=args.host, port=args.port, log_level="warning")
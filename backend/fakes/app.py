@@ -0,0 +1,405 @@
+"""
+One FastAPI app serving every fake integration under its own path prefix.
+"""
+import gzip
+import itertools
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from fakes.catalog import product
+from fakes.faults import FaultInjector
+
+_ids = itertools.count(1)
+
+
+def _shop_seed(shop: str) -> int:
+    return sum(ord(ch) for ch in shop)
+
+
+def _now() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# ----------------------------------------------------------------------
+# Shopify (Admin GraphQL bulk operations + REST)
+# ----------------------------------------------------------------------
+shopify = APIRouter(prefix="/shopify")
+_bulk_operations: Dict[str, Dict[str, Any]] = {}
+
+
+@lru_cache(maxsize=16)
+def _bulk_file(shop: str, products: int, variants: int, delta: bool) -> bytes:
+    """gzip JSONL in Shopify's flattened bulk format, children after their parent."""
+    seed = _shop_seed(shop)
+    lines = []
+    for index in range(products):
+        # Delta exports only contain the recently updated slice of the catalogue
+        if delta and index % 20:
+            continue
+        item = product(index, seed)
+        gid = f"gid://shopify/Product/{seed * 1_000_000 + index}"
+        lines.append(json.dumps({
+            "id": gid,
+            "title": item["title"],
+            "productType": item["product_type"],
+            "tags": [item["game"], item["set_name"], "sealed"],
+            "status": "ACTIVE",
+            "vendor": item["game"],
+            "totalInventory": 12 * variants,
+            "createdAt": "2024-01-01T00:00:00Z",
+            "updatedAt": _now(),
+        }))
+        for variant in range(variants):
+            variant_id = (seed * 1_000_000 + index) * 10 + variant
+            lines.append(json.dumps({
+                "id": f"gid://shopify/ProductVariant/{variant_id}",
+                "title": "Default Title" if variant == 0 else f"Case of {variant * 6}",
+                "sku": f"SKU-{variant_id}",
+                "barcode": item["upc"] if variant == 0 else None,
+                "price": f"{item['base_price'] * (1 + variant * 5):.2f}",
+                "inventoryQuantity": (index + variant) % 15,
+                "availableForSale": True,
+                "requiresShipping": True,
+                "inventoryItem": {"id": f"gid://shopify/InventoryItem/{variant_id}"},
+                "__parentId": gid,
+            }))
+        lines.append(json.dumps({
+            "url": f"https://cdn.example.com/{seed}/{index}.jpg",
+            "__parentId": gid,
+        }))
+    return gzip.compress(("\n".join(lines) + "\n").encode("utf-8"), compresslevel=5)
+
+
+def _bulk_operation_node(shop: str, operation, request: Request):
+    if operation is None:
+        return None
+    running_for = float(os.getenv("FAKE_SHOPIFY_BULK_SECONDS", "0"))
+    done = time.monotonic() - operation["created"] >= running_for
+    products = int(os.getenv("FAKE_SHOPIFY_PRODUCTS", "1000"))
+    suffix = "delta" if operation["delta"] else "full"
+    return {
+        "id": operation["id"],
+        "status": "COMPLETED" if done else "RUNNING",
+        "url": f"{str(request.base_url).rstrip('/')}/shopify/{shop}/bulk/{suffix}.jsonl.gz" if done else None,
+        "errorCode": None,
+        "objectCount": str(products),
+        "completedAt": _now() if done else None,
+        "createdAt": operation["createdAt"],
+    }
+
+
+@shopify.post("/{shop}/admin/api/{version}/graphql.json")
+async def shopify_graphql(shop: str, version: str, request: Request):
+    body = await request.json()
+    query = body.get("query", "")
+    if "bulkOperationRunQuery" in query:
+        bulk_query = (body.get("variables") or {}).get("query", "")
+        bulk_id = f"gid://shopify/BulkOperation/{next(_ids)}"
+        _bulk_operations[shop] = {
+            "id": bulk_id,
+            "created": time.monotonic(),
+            "createdAt": _now(),
+            "delta": "updated_at:>" in bulk_query,
+        }
+        return {"data": {"bulkOperationRunQuery": {
+            "bulkOperation": {"id": bulk_id, "status": "CREATED"},
+            "userErrors": [],
+        }}}
+    if "currentBulkOperation" in query:
+        operation = _bulk_operations.get(shop)
+        return {"data": {"currentBulkOperation": _bulk_operation_node(shop, operation, request)}}
+    if "node(id:" in query:
+        bulk_id = (body.get("variables") or {}).get("id")
+        operation = _bulk_operations.get(shop)
+        if operation is None or operation["id"] != bulk_id:
+            return {"data": {"node": None}}
+        return {"data": {"node": _bulk_operation_node(shop, operation, request)}}
+    return {"data": {}}
+
+
+@shopify.get("/{shop}/bulk/{kind}.jsonl.gz")
+async def shopify_bulk_file(shop: str, kind: str):
+    content = _bulk_file(
+        shop,
+        int(os.getenv("FAKE_SHOPIFY_PRODUCTS", "1000")),
+        int(os.getenv("FAKE_SHOPIFY_VARIANTS", "2")),
+        kind == "delta",
+    )
+    return Response(content=content, media_type="application/jsonl+gzip")
+
+
+@shopify.get("/{shop}/admin/api/{version}/shop.json")
+async def shopify_shop(shop: str, version: str):
+    return {"shop": {
+        "id": _shop_seed(shop),
+        "name": shop.split(".")[0].replace("-", " ").title(),
+        "email": f"owner@{shop}",
+        "domain": shop,
+        "myshopify_domain": shop,
+        "currency": "CAD",
+        "country_code": "CA",
+    }}
+
+
+_webhooks: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+
+@shopify.get("/{shop}/admin/api/{version}/webhooks.json")
+async def shopify_list_webhooks(shop: str, version: str):
+    return {"webhooks": list(_webhooks.get(shop, {}).values())}
+
+
+@shopify.post("/{shop}/admin/api/{version}/webhooks.json")
+async def shopify_create_webhook(shop: str, version: str, request: Request):
+    hook = (await request.json()).get("webhook", {})
+    hook["id"] = next(_ids)
+    _webhooks.setdefault(shop, {})[hook["topic"]] = hook
+    return JSONResponse({"webhook": hook}, status_code=201)
+
+
+@shopify.put("/{shop}/admin/api/{version}/webhooks/{hook_id}.json")
+async def shopify_update_webhook(shop: str, version: str, hook_id: int, request: Request):
+    hook = (await request.json()).get("webhook", {})
+    hook["id"] = hook_id
+    _webhooks.setdefault(shop, {})[hook.get("topic", str(hook_id))] = hook
+    return {"webhook": hook}
+
+
+@shopify.post("/{shop}/admin/oauth/access_token")
+async def shopify_access_token(shop: str):
+    return {"access_token": f"shpat_fake_{_shop_seed(shop)}", "scope": "read_products,read_inventory"}
+
+
+# ----------------------------------------------------------------------
+# Shippo
+# ----------------------------------------------------------------------
+shippo = APIRouter(prefix="/shippo")
+
+_SHIPPO_SERVICES = [
+    ("canada_post", "Expedited Parcel", 14.25, 3),
+    ("canada_post", "Xpresspost", 21.60, 2),
+    ("ups", "Standard", 18.40, 3),
+    ("purolator", "Ground", 16.75, 4),
+    ("fedex", "Economy", 19.10, 3),
+]
+
+
+@shippo.post("/shipments/")
+async def shippo_create_shipment(request: Request):
+    body = await request.json()
+    parcel = (body.get("parcels") or [{}])[0]
+    weight = float(parcel.get("weight") or 1)
+    shipment_id = uuid.uuid4().hex
+    rates = [
+        {
+            "object_id": f"rate_{shipment_id[:8]}_{n}",
+            "provider": provider,
+            "servicelevel": {"name": service, "token": f"{provider}_{n}"},
+            "amount": f"{base + weight * 1.5:.2f}",
+            "amount_local": f"{base + weight * 1.5:.2f}",
+            "currency": "CAD",
+            "currency_local": "CAD",
+            "estimated_days": days,
+        }
+        for n, (provider, service, base, days) in enumerate(_SHIPPO_SERVICES)
+    ]
+    return {"object_id": shipment_id, "status": "SUCCESS", "rates": rates, "messages": []}
+
+
+@shippo.post("/transactions/")
+async def shippo_create_transaction(request: Request):
+    body = await request.json()
+    transaction_id = uuid.uuid4().hex
+    return {
+        "object_id": transaction_id,
+        "status": "SUCCESS",
+        "rate": body.get("rate"),
+        "tracking_number": f"FAKE{next(_ids):012d}",
+        "label_url": f"https://labels.example.com/{transaction_id}.pdf",
+    }
+
+
+@shippo.get("/tracks/{carrier}/{tracking_number}/")
+async def shippo_track(carrier: str, tracking_number: str):
+    return {
+        "carrier": carrier,
+        "tracking_number": tracking_number,
+        "tracking_status": {"status": "TRANSIT", "status_details": "In transit", "status_date": _now()},
+        "tracking_history": [],
+    }
+
+
+# ----------------------------------------------------------------------
+# RapidAPI Amazon data scraper
+# ----------------------------------------------------------------------
+rapidapi = APIRouter(prefix="/rapidapi")
+
+
+def _amazon_result(index: int, seed: int) -> Dict[str, Any]:
+    item = product(index, seed)
+    asin = f"B0FAKE{seed % 100:02d}{index:04d}"
+    return {
+        "asin": asin,
+        "title": item["title"],
+        "price": f"${item['base_price'] * 1.08:.2f}",
+        "rating": 4.0 + (index % 10) / 10,
+        "reviews_count": 50 + index * 7,
+        "in_stock": True,
+        "availability": "In Stock",
+        "merchant": "Amazon.ca",
+        "image": f"https://images.example.com/{asin}.jpg",
+        "url": f"https://www.amazon.ca/dp/{asin}",
+        "is_prime": index % 2 == 0,
+    }
+
+
+@rapidapi.get("/search")
+async def rapidapi_search(query: str, country: str = "CA"):
+    seed = _shop_seed(query)
+    count = int(os.getenv("FAKE_RAPIDAPI_RESULTS", "20"))
+    return {"results": [_amazon_result(index, seed) for index in range(count)]}
+
+
+@rapidapi.get("/product/{asin}")
+async def rapidapi_product(asin: str, country: str = "CA"):
+    index = int(asin[-4:]) if asin[-4:].isdigit() else 0
+    return {**_amazon_result(index, 0), "asin": asin, "description": "Factory sealed."}
+
+
+# ----------------------------------------------------------------------
+# Stripe (form-encoded requests, JSON objects back)
+# ----------------------------------------------------------------------
+stripe_router = APIRouter(prefix="/stripe/v1")
+
+_STRIPE_OBJECTS = {
+    "checkout/sessions": ("cs_test", "checkout.session"),
+    "transfers": ("tr", "transfer"),
+    "refunds": ("re", "refund"),
+    "payment_intents": ("pi", "payment_intent"),
+    "accounts": ("acct", "account"),
+    "account_links": ("al", "account_link"),
+    "customers": ("cus", "customer"),
+    "setup_intents": ("seti", "setup_intent"),
+    "subscriptions": ("sub", "subscription"),
+    "payment_methods": ("pm", "payment_method"),
+}
+# Created objects, so a later retrieve (e.g. the checkout session a webhook names) sees their fields
+_stripe_store: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_STRIPE_STORE_LIMIT = 10_000
+
+
+def _stripe_object(resource: str, object_id: Optional[str], fields: Dict[str, Any]) -> Dict[str, Any]:
+    prefix, kind = _STRIPE_OBJECTS.get(resource, ("obj", resource.rstrip("s")))
+    obj = {
+        "id": object_id or f"{prefix}_{uuid.uuid4().hex[:24]}",
+        "object": kind,
+        "created": int(time.time()),
+        "livemode": False,
+        "metadata": {},
+    }
+    for key, value in fields.items():
+        # metadata[order_id]=... style keys are flattened into nested dicts
+        if "[" in key:
+            parent, child = key.split("[", 1)
+            if isinstance(obj.get(parent), dict):
+                obj[parent][child.split("]", 1)[0]] = value
+            continue
+        obj[key] = value
+    if kind == "checkout.session":
+        obj.setdefault("url", f"https://checkout.stripe.test/{obj['id']}")
+        obj.setdefault("payment_status", "unpaid")
+        obj.setdefault("status", "open")
+    if kind == "payment_intent":
+        obj.setdefault("status", "succeeded")
+        obj.setdefault("latest_charge", f"ch_{uuid.uuid4().hex[:24]}")
+    if kind == "account_link":
+        obj.setdefault("url", f"https://connect.stripe.test/setup/{obj['id']}")
+    return obj
+
+
+def _stripe_resource(path: str):
+    parts = path.strip("/").split("/")
+    if parts[0] == "checkout" and len(parts) > 1:
+        return "checkout/sessions", (parts[2] if len(parts) > 2 else None)
+    return parts[0], (parts[1] if len(parts) > 1 else None)
+
+
+@stripe_router.post("/{path:path}")
+async def stripe_post(path: str, request: Request):
+    resource, object_id = _stripe_resource(path)
+    form = dict(await request.form())
+    obj = _stripe_object(resource, object_id, form)
+    stored = _stripe_store.get(obj["id"])
+    if stored is not None:
+        # Update: only fields sent in this request change
+        stored["metadata"].update(obj["metadata"])
+        stored.update({key: value for key, value in obj.items() if key in form})
+        return stored
+    _stripe_store[obj["id"]] = obj
+    if len(_stripe_store) > _STRIPE_STORE_LIMIT:
+        _stripe_store.popitem(last=False)
+    return obj
+
+
+@stripe_router.get("/{path:path}")
+async def stripe_get(path: str, request: Request):
+    resource, object_id = _stripe_resource(path)
+    if object_id is None:
+        return {"object": "list", "data": [], "has_more": False, "url": f"/v1/{resource}"}
+    return _stripe_store.get(object_id) or _stripe_object(resource, object_id, {})
+
+
+# ----------------------------------------------------------------------
+# App + fault injection
+# ----------------------------------------------------------------------
+class FaultMiddleware:
+    """Delay or fail requests according to the integration's `FaultConfig`."""
+
+    def __init__(self, app, faults: FaultInjector):
+        self.app = app
+        self.faults = faults
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        integration = scope["path"].strip("/").split("/", 1)[0]
+        await self.faults.delay(integration)
+        status = self.faults.failure(integration)
+        if status == 429:
+            response = JSONResponse(
+                {"error": {"type": "rate_limit_error", "message": "Too many requests"}},
+                status_code=429,
+                headers={"Retry-After": str(self.faults.config(integration).retry_after_seconds)},
+            )
+        elif status:
+            response = JSONResponse(
+                {"error": {"type": "api_error", "message": "Injected failure"}}, status_code=status
+            )
+        else:
+            await self.app(scope, receive, send)
+            return
+        await response(scope, receive, send)
+
+
+def create_app(faults: Optional[FaultInjector] = None) -> FastAPI:
+    app = FastAPI(title="GeoCheapest fake integrations")
+    app.state.faults = faults or FaultInjector()
+    app.add_middleware(FaultMiddleware, faults=app.state.faults)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    for router in (shopify, shippo, rapidapi, stripe_router):
+        app.include_router(router)
+    return app
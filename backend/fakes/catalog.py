@@ -0,0 +1,48 @@
+"""
+Deterministic TCG product names and prices shared by the fake servers.
+"""
+import random
+from typing import Dict
+
+GAMES = [
+    ("Pokemon", ["Scarlet & Violet 151", "Paldean Fates", "Temporal Forces", "Obsidian Flames"]),
+    ("Magic: The Gathering", ["Murders at Karlov Manor", "Outlaws of Thunder Junction", "Bloomburrow", "Duskmourn"]),
+    ("Yu-Gi-Oh", ["Phantom Nightmare", "Legacy of Destruction", "The Infinite Forbidden", "Rage of the Abyss"]),
+    ("One Piece", ["Romance Dawn", "Paramount War", "Kingdoms of Intrigue", "Wings of the Captain"]),
+    ("Lorcana", ["The First Chapter", "Rise of the Floodborn", "Into the Inklands", "Ursula's Return"]),
+    ("Flesh and Blood", ["Heavy Hitters", "Part the Mistveil", "Rosetta", "Bright Lights"]),
+]
+
+PRODUCT_TYPES = [
+    ("Booster Box", 120.0, 260.0),
+    ("Elite Trainer Box", 45.0, 80.0),
+    ("Booster Bundle", 25.0, 45.0),
+    ("Collector Booster Box", 250.0, 450.0),
+    ("Starter Deck", 12.0, 25.0),
+    ("Booster Pack", 4.0, 9.0),
+]
+
+SETS_PER_GAME = 4
+# Every index below this maps to a distinct game/set/type combination
+DISTINCT_TITLES = len(GAMES) * SETS_PER_GAME * len(PRODUCT_TYPES)
+
+
+def product(index: int, seed: int = 0) -> Dict[str, object]:
+    """The `index`-th product of a catalogue; same inputs, same product."""
+    rng = random.Random(seed * 1_000_003 + index)
+    game, sets = GAMES[index % len(GAMES)]
+    set_name = sets[(index // len(GAMES)) % SETS_PER_GAME]
+    product_type, low, high = PRODUCT_TYPES[(index // (len(GAMES) * SETS_PER_GAME)) % len(PRODUCT_TYPES)]
+    title = f"{game} TCG: {set_name} {product_type}"
+    run = index // DISTINCT_TITLES
+    if run:
+        # Keep titles unique past the base combinations
+        title = f"{title} (Print Run {run + 1})"
+    return {
+        "game": game,
+        "set_name": set_name,
+        "product_type": product_type,
+        "title": title,
+        "base_price": round(rng.uniform(low, high), 2),
+        "upc": f"{820650000000 + index:012d}",
+    }
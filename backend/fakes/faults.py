@@ -0,0 +1,62 @@
+"""
+Latency and failure injection for the fake integration servers.
+"""
+import asyncio
+import os
+import random
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+INTEGRATIONS = ("shopify", "shippo", "rapidapi", "stripe")
+
+
+def _env(integration: str, name: str, default: str) -> str:
+    return os.getenv(f"FAKE_{integration.upper()}_{name}", os.getenv(f"FAKE_{name}", default))
+
+
+@dataclass
+class FaultConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after_seconds: int = 1
+
+    @classmethod
+    def from_env(cls, integration: str) -> "FaultConfig":
+        return cls(
+            latency_ms=float(_env(integration, "LATENCY_MS", "0")),
+            jitter_ms=float(_env(integration, "JITTER_MS", "0")),
+            error_rate=float(_env(integration, "ERROR_RATE", "0")),
+            rate_limit_rate=float(_env(integration, "RATE_LIMIT_RATE", "0")),
+            retry_after_seconds=int(_env(integration, "RETRY_AFTER_SECONDS", "1")),
+        )
+
+
+class FaultInjector:
+    """Delays requests and decides whether to fail them, per integration."""
+
+    def __init__(self, configs: Optional[Dict[str, FaultConfig]] = None, seed: Optional[int] = None):
+        self.configs = configs or {name: FaultConfig.from_env(name) for name in INTEGRATIONS}
+        seed = seed if seed is not None else os.getenv("FAKE_SEED")
+        self._random = random.Random(int(seed) if seed is not None else None)
+
+    def config(self, integration: str) -> FaultConfig:
+        return self.configs.setdefault(integration, FaultConfig())
+
+    async def delay(self, integration: str):
+        config = self.config(integration)
+        if config.latency_ms <= 0 and config.jitter_ms <= 0:
+            return
+        jitter = self._random.uniform(-config.jitter_ms, config.jitter_ms) if config.jitter_ms else 0.0
+        await asyncio.sleep(max(0.0, config.latency_ms + jitter) / 1000)
+
+    def failure(self, integration: str) -> Optional[int]:
+        """429 or 500 if this request should fail, else None."""
+        config = self.config(integration)
+        roll = self._random.random()
+        if roll < config.rate_limit_rate:
+            return 429
+        if roll < config.rate_limit_rate + config.error_rate:
+            return 500
+        return None
@@ -0,0 +1,465 @@
+"""
+Synthetic catalogue, vendor and order data at production scale.
+
+Every document is a pure function of (seed, index), so a run is reproducible
+and nothing has to be held in memory while writing: listings pick their
+product and store from skewed distributions (a few sets and big stores carry
+most of the catalogue), and orders re-derive the listings they buy from their
+indexes. Duplicate products copy an earlier product's title with name noise;
+some of the noise survives `normalize_name` in `get_products` and some does
+not, and a share of duplicates keep the UPC so UPC matching is exercised too.
+
+    cd backend && python -m fakes.synthetic --profile production --target emulator
+
+`--target emulator` writes through `database.db` (set FIRESTORE_EMULATOR_HOST
+so the client talks to the emulator); `--target mock` fills the in-memory
+mock DB, which is mainly useful when calling `seed()` from benchmarks or tests.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import asdict, dataclass, replace
+from functools import lru_cache
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import repository
+from database import (
+    AFFILIATE_PRODUCTS,
+    ORDER_ITEMS,
+    ORDERS,
+    PRODUCTS,
+    SHOPIFY_LISTINGS,
+    STORES,
+)
+from fakes import catalog
+
+logger = logging.getLogger(__name__)
+
+Document = Tuple[str, str, Dict[str, Any]]
+
+ORDER_STATUSES = (("paid", 0.35), ("shipped", 0.30), ("delivered", 0.31), ("refunded", 0.04))
+# Fixed so generated timestamps do not move between runs
+EPOCH = datetime(2026, 1, 1)
+
+
+@dataclass(frozen=True)
+class SyntheticConfig:
+    seed: int = 1
+    stores: int = 20
+    products: int = 2_000
+    listings: int = 20_000
+    orders: int = 2_000
+    # Share of products that duplicate an earlier product under a noisy name
+    duplicate_rate: float = 0.08
+    # Share of duplicates that keep the original UPC
+    duplicate_upc_rate: float = 0.5
+    affiliate_rate: float = 0.3
+    out_of_stock_rate: float = 0.15
+    preorder_rate: float = 0.04
+    # Log-normal sigma of a listing's price around the product's base price
+    price_spread: float = 0.12
+    # >1 concentrates listings and orders on the first products / stores
+    product_skew: float = 2.0
+    store_skew: float = 1.5
+    order_days: int = 180
+    max_items_per_order: int = 4
+    commission_rate: float = 0.10
+
+
+PROFILES: Dict[str, SyntheticConfig] = {
+    "small": SyntheticConfig(),
+    "medium": SyntheticConfig(stores=100, products=20_000, listings=200_000, orders=20_000),
+    "production": SyntheticConfig(stores=500, products=200_000, listings=2_000_000, orders=200_000),
+}
+
+
+_MASK64 = (1 << 64) - 1
+
+
+class _IndexRandom(random.Random):
+    """splitmix64 behind the `random.Random` API.
+
+    One generator is created per generated document, and seeding the
+    Mersenne Twister (2.5 KB of state) costs more than building the document.
+    """
+
+    def seed(self, a=None, version=2):
+        self._state = (a or 0) & _MASK64
+
+    def getstate(self):
+        return self._state
+
+    def setstate(self, state):
+        self._state = state
+
+    def random(self) -> float:
+        self._state = state = (self._state + 0x9E3779B97F4A7C15) & _MASK64
+        z = ((state ^ (state >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+        return ((z ^ (z >> 31)) >> 11) * (1.0 / (1 << 53))
+
+
+def _rng(config: SyntheticConfig, kind: int, index: int) -> random.Random:
+    return _IndexRandom((config.seed * 16 + kind) * 100_000_003 + index)
+
+
+def _skewed(rng: random.Random, count: int, skew: float) -> int:
+    return min(count - 1, int(count * rng.random() ** skew))
+
+
+# ----------------------------------------------------------------------
+# Ids
+# ----------------------------------------------------------------------
+def store_id(index: int) -> str:
+    return f"synthetic-{index:04d}.myshopify.com"
+
+
+def product_id(index: int) -> str:
+    return f"syn-p{index:07d}"
+
+
+def listing_id(config: SyntheticConfig, index: int) -> str:
+    return f"{store_id(listing_store(config, index))}_{9_000_000_000 + index}"
+
+
+# ----------------------------------------------------------------------
+# Stores
+# ----------------------------------------------------------------------
+def store(config: SyntheticConfig, index: int) -> Dict[str, Any]:
+    rng = _rng(config, 0, index)
+    shop = store_id(index)
+    return {
+        "shop_domain": shop,
+        "store_name": f"Synthetic Games {index:04d}",
+        "owner_email": f"owner{index}@synthetic.example.com",
+        "stripe_account_id": f"acct_syn{index:06d}",
+        "status": "active",
+        "created_at": EPOCH - timedelta(days=rng.randint(30, 900)),
+        "last_sync_at": EPOCH,
+        "total_products": 0,
+        "total_sales": 0,
+        "commission_rate": config.commission_rate,
+        "currency": "CAD",
+        "country": "Canada",
+        "province": rng.choice(["ON", "QC", "BC", "AB", "MB", "NS"]),
+        "subscription_status": "active" if rng.random() < 0.6 else "not_subscribed",
+        "price_factor": _price_factor(config, index),
+    }
+
+
+@lru_cache(maxsize=4096)
+def _price_factor(config: SyntheticConfig, index: int) -> float:
+    """Stores price consistently above or below the market."""
+    return round(_rng(config, 7, index).uniform(0.9, 1.15), 3)
+
+
+# ----------------------------------------------------------------------
+# Products
+# ----------------------------------------------------------------------
+def _noisy_name(rng: random.Random, name: str) -> str:
+    """A name a second vendor might use for the same product."""
+    roll = rng.random()
+    if roll < 0.25:
+        return name.upper()
+    if roll < 0.45:
+        return name.replace(":", " -").replace(" TCG", "")
+    if roll < 0.6:
+        return "  ".join(name.split(" ")) + " "
+    if roll < 0.7:
+        if "Pokemon" in name:
+            return name.replace("Pokemon", "Pokémon")
+        return name.replace(" TCG:", " Trading Card Game:")
+    if roll < 0.85:
+        return f"{name} - Sealed"
+    return f"{name} (English)"
+
+
+def canonical_index(config: SyntheticConfig, index: int) -> int:
+    """The first product `index` duplicates, or `index` itself."""
+    while index:
+        rng = _rng(config, 1, index)
+        if rng.random() >= config.duplicate_rate:
+            return index
+        index = rng.randrange(index)
+    return index
+
+
+@lru_cache(maxsize=65_536)
+def _product_core(config: SyntheticConfig, index: int) -> Tuple[str, Optional[str], int, Dict[str, Any]]:
+    """(name, upc, canonical index, catalogue entry); listings and orders hit popular products repeatedly."""
+    root = canonical_index(config, index)
+    base = catalog.product(root, config.seed)
+    name, upc = base["title"], base["upc"]
+    if root != index:
+        rng = _rng(config, 9, index)
+        name = _noisy_name(rng, name)
+        if rng.random() >= config.duplicate_upc_rate:
+            upc = None
+    return name, upc, root, base
+
+
+def product(config: SyntheticConfig, index: int) -> Dict[str, Any]:
+    name, upc, root, base = _product_core(config, index)
+    rng = _rng(config, 8, index)
+    created = EPOCH - timedelta(days=rng.randint(0, 720), seconds=rng.randint(0, 86_399))
+    return {
+        "name": name,
+        "description": f"{base['product_type']} from the {base['set_name']} set.",
+        "category": base["game"],
+        "segment": "sealed",
+        "image_url": f"https://images.synthetic.example.com/{root}.jpg",
+        "upc": upc,
+        "created_at": created,
+        "updated_at": created,
+        "total_sales": 0,
+    }
+
+
+def base_price(config: SyntheticConfig, index: int) -> float:
+    return _product_core(config, index)[3]["base_price"]
+
+
+def affiliate_product(config: SyntheticConfig, index: int) -> Optional[Dict[str, Any]]:
+    rng = _rng(config, 2, index)
+    if rng.random() >= config.affiliate_rate:
+        return None
+    asin = f"B0{_product_core(config, index)[2]:08d}"
+    return {
+        "product_id": product_id(index),
+        "affiliate_name": "Amazon.ca",
+        "affiliate_url": f"https://www.amazon.ca/dp/{asin}?tag=geocheapest-20",
+        "asin": asin,
+        "price": round(base_price(config, index) * rng.lognormvariate(0.05, config.price_spread), 2),
+        "in_stock": rng.random() >= config.out_of_stock_rate,
+        "estimated_shipping": rng.choice([0.0, 0.0, 5.99, 9.99]),
+        "commission_rate": 0.03,
+        "status": "active",
+        "created_at": EPOCH,
+        "updated_at": EPOCH,
+    }
+
+
+# ----------------------------------------------------------------------
+# Listings
+# ----------------------------------------------------------------------
+def listing_product(config: SyntheticConfig, index: int) -> int:
+    return _skewed(_rng(config, 3, index), config.products, config.product_skew)
+
+
+def listing_store(config: SyntheticConfig, index: int) -> int:
+    return _skewed(_rng(config, 4, index), config.stores, config.store_skew)
+
+
+def listing(config: SyntheticConfig, index: int) -> Dict[str, Any]:
+    rng = _rng(config, 5, index)
+    product_index = listing_product(config, index)
+    store_index = listing_store(config, index)
+    name, _, _, base = _product_core(config, product_index)
+    price = base["base_price"] * _price_factor(config, store_index) * rng.lognormvariate(0, config.price_spread)
+    if rng.random() < 0.5:
+        price = int(price) + 0.99
+    roll = rng.random()
+    preorder = roll < config.preorder_rate
+    quantity = 0 if roll < config.preorder_rate + config.out_of_stock_rate else int(rng.expovariate(1 / 8)) + 1
+    variant_id = str(9_000_000_000 + index)
+    shop = store_id(store_index)
+    return {
+        "product_id": product_id(product_index),
+        "product_name": name,
+        "product_segment": "sealed",
+        "product_game": base["game"],
+        "store_id": shop,
+        "store_name": f"Synthetic Games {store_index:04d}",
+        "shopify_product_id": str(8_000_000_000 + product_index * 1000 + store_index),
+        "shopify_variant_id": variant_id,
+        "price": round(price, 2),
+        "quantity": quantity,
+        "inventory_item_id": str(7_000_000_000 + index),
+        "is_preorder": preorder,
+        "status": "active" if rng.random() >= 0.03 else "inactive",
+        "images": [f"https://images.synthetic.example.com/{product_index}.jpg"],
+    }
+
+
+# ----------------------------------------------------------------------
+# Orders
+# ----------------------------------------------------------------------
+def order(config: SyntheticConfig, index: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """An order and its items; item `order_id`s are filled in by the caller."""
+    rng = _rng(config, 6, index)
+    # Order volume grows towards the present
+    created = EPOCH - timedelta(seconds=int(config.order_days * 86_400 * (1 - rng.random() ** 0.7)))
+    roll, status = rng.random(), ORDER_STATUSES[-1][0]
+    for name, share in ORDER_STATUSES:
+        if roll < share:
+            status = name
+            break
+        roll -= share
+
+    items: List[Dict[str, Any]] = []
+    for _ in range(rng.randint(1, config.max_items_per_order)):
+        listing_index = _skewed(rng, config.listings, config.product_skew)
+        data = listing(config, listing_index)
+        quantity = 1 if rng.random() < 0.8 else rng.randint(2, 4)
+        shipping = rng.choice([0.0, 9.99, 14.99])
+        total = round(data["price"] * quantity, 2)
+        commission = round(total * config.commission_rate, 2)
+        items.append({
+            "product_id": data["product_id"],
+            "listing_id": f"{data['store_id']}_{data['shopify_variant_id']}",
+            "source": "shopify",
+            "store_id": data["store_id"],
+            "quantity": quantity,
+            "unit_price": data["price"],
+            "total_price": total,
+            "commission_rate": config.commission_rate,
+            "commission_amount": commission,
+            "vendor_payout": round(total - commission, 2),
+            "status": "refunded" if status == "refunded" else "paid",
+            "shipping_total": shipping,
+        })
+
+    products_total = round(sum(item["total_price"] for item in items), 2)
+    shipping_total = round(sum(item["shipping_total"] for item in items), 2)
+    order_total = round(products_total + shipping_total, 2)
+    order_data = {
+        "stripe_session_id": f"cs_syn_{config.seed}_{index:08d}",
+        "stripe_payment_intent": f"pi_syn_{config.seed}_{index:08d}",
+        "customer_email": f"customer{rng.randrange(max(1, config.orders // 3))}@synthetic.example.com",
+        "user_id": None,
+        "status": status,
+        "payment_status": "paid",
+        "created_at": created,
+        "updated_at": created,
+        "total_amount": order_total,
+        "total_product_price": products_total,
+        "total_shipping": shipping_total,
+        "currency": "CAD",
+        "platform_commission": round(sum(item["commission_amount"] for item in items), 2),
+        "stripe_fee": round(order_total * 0.029 + 0.30, 2),
+        "shipping_address": {"city": "Toronto", "province": "ON", "country": "CA"},
+        "metadata": {"synthetic": "true"},
+    }
+    return order_data, items
+
+
+# ----------------------------------------------------------------------
+# Document streams
+# ----------------------------------------------------------------------
+def documents(config: SyntheticConfig) -> Iterator[Document]:
+    """Every document of the data set as (collection, id, data), lazily."""
+    for index in range(config.stores):
+        yield STORES, store_id(index), store(config, index)
+    for index in range(config.products):
+        yield PRODUCTS, product_id(index), product(config, index)
+        affiliate = affiliate_product(config, index)
+        if affiliate is not None:
+            yield AFFILIATE_PRODUCTS, f"syn-amazon-{index:07d}", affiliate
+    for index in range(config.listings):
+        yield SHOPIFY_LISTINGS, listing_id(config, index), listing(config, index)
+    for index in range(config.orders):
+        order_id = f"syn-o{index:08d}"
+        order_data, items = order(config, index)
+        yield ORDERS, order_id, order_data
+        for position, item in enumerate(items):
+            item["order_id"] = order_id
+            yield ORDER_ITEMS, f"{order_id}-{position}", item
+
+
+def _chunks(docs: Iterable[Document], size: int) -> Iterator[List[Document]]:
+    chunk: List[Document] = []
+    for doc in docs:
+        chunk.append(doc)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _commit(chunk: List[Document]):
+    batch = repository.batch()
+    for collection, doc_id, data in chunk:
+        batch.set(collection, doc_id, data)
+    await batch.commit()
+
+
+async def write_documents(
+    docs: Iterable[Document],
+    concurrency: int = 16,
+    batch_size: int = repository.MAX_BATCH_WRITES,
+    progress_every: int = 100_000,
+) -> Dict[str, int]:
+    """Write `docs` in Firestore-sized batches with up to `concurrency` commits in flight."""
+    counts: Dict[str, int] = {}
+    pending: set = set()
+    written = 0
+    next_report = progress_every
+    started = time.perf_counter()
+    for chunk in _chunks(docs, batch_size):
+        if len(pending) >= concurrency:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        pending.add(asyncio.ensure_future(_commit(chunk)))
+        for collection, _, _ in chunk:
+            counts[collection] = counts.get(collection, 0) + 1
+        written += len(chunk)
+        if progress_every and written >= next_report:
+            next_report += progress_every
+            logger.info("Seeded %d documents (%.0f/s)", written, written / (time.perf_counter() - started))
+    if pending:
+        for task in (await asyncio.wait(pending))[0]:
+            task.result()
+    return counts
+
+
+async def seed(config: SyntheticConfig, concurrency: int = 16) -> Dict[str, int]:
+    """Write the whole data set through `database.db`; returns documents per collection."""
+    # The mock client logs every write at INFO, which dominates at this volume
+    db_logger = logging.getLogger("database")
+    level = db_logger.level
+    db_logger.setLevel(max(level, logging.WARNING))
+    try:
+        return await write_documents(documents(config), concurrency=concurrency)
+    finally:
+        db_logger.setLevel(level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a synthetic catalogue, vendors and order history")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--target", choices=["emulator", "mock"], default="emulator")
+    parser.add_argument("--concurrency", type=int, default=16)
+    for field, default in asdict(SyntheticConfig()).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=None)
+    args = parser.parse_args()
+
+    overrides = {
+        field: getattr(args, field) for field in asdict(SyntheticConfig()) if getattr(args, field) is not None
+    }
+    config = replace(PROFILES[args.profile], **overrides)
+
+    import database
+
+    if args.target == "mock":
+        database._db_client = database.MockFirestoreClient()
+    elif not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        parser.error("--target emulator needs FIRESTORE_EMULATOR_HOST (e.g. localhost:8080)")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    started = time.perf_counter()
+    counts = asyncio.run(seed(config, concurrency=args.concurrency))
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    for collection, count in sorted(counts.items()):
+        print(f"  {collection:<20} {count:>10,}")
+    print(f"Seeded {total:,} documents in {elapsed:.1f}s ({total / elapsed:,.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Fast JSON rendering for API responses.
+
+`FastJSONResponse` is the app's default response class. It serializes with
+orjson when it is installed and with stdlib `json` otherwise. Types orjson
+does not handle natively (Decimal, sets, bytes, pydantic models, Firestore
+values) go through FastAPI's `jsonable_encoder`, so the body is the same as
+the stock `JSONResponse` produced: datetimes as `isoformat()`, Decimals as
+int or float, non-string keys as strings. Only the spelling of float
+exponents differs (`1e16` vs `1e+16`), and NaN/Infinity render as null
+instead of failing the request.
+
+The response class only replaces the final `json.dumps`: FastAPI still
+walks every returned dict with `jsonable_encoder` and validates it against
+the route's `response_model`. Routes that return dicts built from trusted
+internal data can skip both with `@trusted_json`.
+"""
+import asyncio
+import functools
+import json
+from decimal import Decimal
+from typing import Any, Callable
+
+from fastapi.encoders import decimal_encoder, jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json keeps the same output
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def _default(value: Any) -> Any:
+    """Fallback for types the serializer does not know, matching `jsonable_encoder`."""
+    if isinstance(value, Decimal):
+        return decimal_encoder(value)
+    return jsonable_encoder(value)
+
+
+def _stdlib_dumps(content: Any) -> bytes:
+    # Same settings as starlette's JSONResponse.render
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is None:
+        return _stdlib_dumps(content)
+    try:
+        return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+    except TypeError:
+        # Integers beyond 64 bits and other values orjson rejects outright
+        return _stdlib_dumps(content)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _as_response(content: Any) -> Response:
+    if isinstance(content, Response):
+        return content
+    return FastJSONResponse(content)
+
+
+def trusted_json(endpoint: Callable) -> Callable:
+    """
+    Send the endpoint's return value straight to `FastJSONResponse`.
+
+    Skips FastAPI's `jsonable_encoder` pass and `response_model` validation
+    (a declared model still documents the route). Only for routes that return
+    plain dicts from our own data with a 200 status; a route that sets headers
+    through an injected `Response` should return its own response instead.
+    Place it below the route decorator.
+    """
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            return _as_response(await endpoint(*args, **kwargs))
+
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        return _as_response(endpoint(*args, **kwargs))
+
+    return wrapper
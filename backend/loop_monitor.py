@@ -0,0 +1,148 @@
+"""
+Event-loop lag monitor and blocking-call detector.
+
+A heartbeat coroutine sleeps for `interval` and measures how late it wakes
+up; that scheduling lag is exported as a histogram on `/metrics`. A watchdog
+thread watches the heartbeat: when the loop has not ticked for `threshold`
+it grabs the loop thread's current frame, i.e. the code that is blocking,
+and logs it with the task name and the request that task is serving.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOOP_LAG = REGISTRY.register(Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a scheduled heartbeat",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+))
+EVENT_LOOP_LAG_LAST = REGISTRY.register(Gauge(
+    "event_loop_lag_last_seconds",
+    "Most recent event loop lag measurement",
+))
+EVENT_LOOP_STALLS = REGISTRY.register(Counter(
+    "event_loop_stalls_total",
+    "Times the event loop was blocked longer than the stall threshold",
+))
+
+# Request label per task, set by the request middleware
+_task_labels: "weakref.WeakKeyDictionary[asyncio.Task, str]" = weakref.WeakKeyDictionary()
+
+
+def tag_current_task(label: str):
+    """Remember what the running task is doing (e.g. "GET /api/products") for stall reports."""
+    task = asyncio.current_task()
+    if task is not None:
+        _task_labels[task] = label
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: Optional[float] = None, threshold: Optional[float] = None):
+        self.interval = interval or float(os.getenv("LOOP_LAG_INTERVAL_MS", "100")) / 1000
+        self.threshold = threshold or float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250")) / 1000
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._stalls: deque = deque(maxlen=int(os.getenv("LOOP_STALLS_KEPT", "20")))
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._open_stall: Optional[Dict[str, Any]] = None
+
+    async def start(self):
+        if self._heartbeat is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stop.clear()
+        self._heartbeat = asyncio.create_task(self._beat(), name="loop-lag-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        heartbeat, self._heartbeat = self._heartbeat, None
+        if heartbeat is not None:
+            heartbeat.cancel()
+            try:
+                await heartbeat
+            except asyncio.CancelledError:
+                pass
+        self._stop.set()
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "last_lag_ms": round(self.last_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "stalls": list(reversed(self._stalls)),
+        }
+
+    async def _beat(self):
+        while True:
+            scheduled = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - scheduled - self.interval)
+            self._last_beat = now
+            EVENT_LOOP_LAG.observe(lag)
+            EVENT_LOOP_LAG_LAST.set(lag)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            stall = self._open_stall
+            if stall is not None:
+                # The watchdog saw the block start; now we know how long it lasted
+                self._open_stall = None
+                stall["blocked_ms"] = round(lag * 1000, 1)
+                logger.warning(
+                    "Event loop was blocked for %.0f ms by %s (%s)",
+                    lag * 1000, stall["task"], stall["request"] or "no request",
+                )
+
+    def _watch(self):
+        check_every = min(self.interval, self.threshold) / 2
+        reported_beat = None
+        while not self._stop.wait(check_every):
+            beat = self._last_beat
+            if time.perf_counter() - beat < self.threshold + self.interval or beat == reported_beat:
+                continue
+            reported_beat = beat
+            self._report_stall()
+
+    def _report_stall(self):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack: List[str] = traceback.format_stack(frame) if frame is not None else []
+        del frame
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        stall = {
+            "detected_at": datetime.utcnow().isoformat(),
+            "task": task.get_name() if task is not None else "<loop callback>",
+            "request": _task_labels.get(task) if task is not None else None,
+            "blocked_ms": None,
+            "stack": [line.rstrip() for line in stack[-15:]],
+        }
+        self._stalls.append(stall)
+        self._open_stall = stall
+        EVENT_LOOP_STALLS.inc()
+        logger.warning(
+            "Event loop blocked > %.0f ms in %s (%s):\n%s",
+            self.threshold * 1000, stall["task"], stall["request"] or "no request", "".join(stack[-15:]),
+        )
@@ -0,0 +1,252 @@
+"""
+In-process Prometheus metrics rendered at `/metrics`.
+
+A small registry instead of `prometheus_client`: every observation happens
+on the event loop thread, so children are plain counters in dicts and lists
+with no locks, and `labels()` is a single dict lookup once a label set has
+been seen. The text exposition format matches what Prometheus scrapes.
+"""
+import math
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers sub-millisecond Firestore cache hits up to bulk downloads
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_str(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{self._label_str(values)} {_format(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default.value += amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self._default.value -= amount
+
+    def set(self, value: float):
+        self._default.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # One slot per upper bound plus +Inf; cumulated only when rendering
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _render_child(self, values, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), child.counts):
+            cumulative += count
+            le = 'le="+Inf"' if bound == math.inf else f'le="{_format(bound)}"'
+            lines.append(f"{self.name}_bucket{self._label_str(values, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_str(values)} {_format(child.sum)}")
+        lines.append(f"{self.name}_count{self._label_str(values)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ----------------------------------------------------------------------
+# HTTP server
+# ----------------------------------------------------------------------
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds",
+    "Request latency by route template",
+    ("method", "route", "status"),
+))
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled by this worker",
+))
+
+# ----------------------------------------------------------------------
+# Outbound integrations
+# ----------------------------------------------------------------------
+INTEGRATION_DURATION = REGISTRY.register(Histogram(
+    "integration_request_duration_seconds",
+    "Outbound call latency by integration and operation",
+    ("integration", "operation", "outcome"),
+))
+INTEGRATION_IN_FLIGHT = REGISTRY.register(Gauge(
+    "integration_requests_in_flight",
+    "Outbound calls currently awaiting a response",
+    ("integration",),
+))
+
+# ----------------------------------------------------------------------
+# Catalogue sync
+# ----------------------------------------------------------------------
+SYNC_RUNS = REGISTRY.register(Counter(
+    "sync_runs_total",
+    "Completed catalogue sync runs",
+    ("source", "mode"),
+))
+SYNC_ITEMS = REGISTRY.register(Counter(
+    "sync_items_total",
+    "Catalogue items processed by sync runs",
+    ("source", "result"),
+))
+SYNC_DURATION = REGISTRY.register(Histogram(
+    "sync_duration_seconds",
+    "Wall time of catalogue sync runs",
+    ("source", "mode"),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+))
+
+
+class track_integration:
+    """Time an outbound call: `with track_integration("shippo", "POST shipments") as call:`.
+
+    The outcome is "error" if the block raises or `call.status` is set to an
+    HTTP status >= 400, otherwise "ok".
+    """
+
+    __slots__ = ("integration", "operation", "status", "_started")
+
+    def __init__(self, integration: str, operation: str):
+        self.integration = integration
+        self.operation = operation
+        self.status: Optional[int] = None
+
+    def __enter__(self):
+        INTEGRATION_IN_FLIGHT.labels(self.integration).inc()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._started
+        INTEGRATION_IN_FLIGHT.labels(self.integration).dec()
+        failed = exc_type is not None or (self.status is not None and self.status >= 400)
+        INTEGRATION_DURATION.labels(
+            self.integration, self.operation, "error" if failed else "ok"
+        ).observe(elapsed)
+        return False
+
+
+def record_sync(source: str, mode: str, seconds: float, items: Dict[str, int]):
+    """Count one finished sync run and its per-result item totals."""
+    SYNC_RUNS.labels(source, mode).inc()
+    SYNC_DURATION.labels(source, mode).observe(seconds)
+    for result, count in items.items():
+        if count:
+            SYNC_ITEMS.labels(source, result).inc(count)
@@ -1,55 +1,197 @@
-import logging
+import asyncio
 import json
+import logging
+import os
+import threading
+import time
 from datetime import datetime
-from fastapi import Request
-from google.cloud import firestore
-from starlette.middleware.base import BaseHTTPMiddleware
+
 from analytics_service import AnalyticsService
+from db_instrumentation import track_db_ops
+from loop_monitor import tag_current_task
+from metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT
+from profiler import StackSampler, get_profile_store
+from repository import read_scope
+from trace_capture import get_trace_recorder
 
 logger = logging.getLogger(__name__)
 
-class AuditMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, db_client_getter):
-        super().__init__(app)
-        self.db_client_getter = db_client_getter
-        self.analytics = AnalyticsService()
+AUDITED_METHODS = frozenset({"POST", "PUT", "DELETE", "PATCH"})
+AUDITED_PATHS = ("/admin/", "/vendor/", "/auth/")
+
+# Emit X-DB-* response headers with per-request Firestore op counts
+DB_OPS_HEADERS = os.getenv("DB_OPS_HEADERS", "false").lower() == "true"
+# Warn when one request issues this many reads/queries against one collection
+DB_NPLUS1_THRESHOLD = int(os.getenv("DB_NPLUS1_THRESHOLD", "10"))
+# Requests sent with "X-Profile: <ADMIN_API_KEY>" are sampled; slow ones keep the profile
+PROFILE_REQUESTS_ENABLED = os.getenv("PROFILE_REQUESTS_ENABLED", "false").lower() == "true"
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "500"))
+
+
+class AuditMiddleware:
+    """
+    Pure ASGI middleware for access logging, audit capture and request timing.
+
+    Unlike `BaseHTTPMiddleware` it does not spawn a task or wrap the response
+    body stream per request; it only observes the response start message to
+    record the status code. Timing uses `time.perf_counter` and feeds the
+    per-route latency histogram served at `/metrics`. Firestore operations
+    are counted per request and reported in the access log.
+
+    When request profiling is enabled, an admin can send `X-Profile` to
+    sample the event loop thread for that request. If it runs longer than
+    `PROFILE_SLOW_REQUEST_MS`, the profile is stored and its id returned in
+    `X-Profile-Id` (fetch it from `/api/admin/profiles/{id}`).
+
+    While a trace capture is running (see `trace_capture`), sampled requests
+    are also handed to the recorder with the body the app read, for replay
+    with `benchmarks/replay.py`.
+    """
+
+    def __init__(self, app, analytics: AnalyticsService = None):
+        self.app = app
+        self.analytics = analytics or AnalyticsService()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+        db_ops = None
+        tag_current_task(f"{scope['method']} {scope['path']}")
+        sampler = None
+        if PROFILE_REQUESTS_ENABLED and self._wants_profile(scope):
+            sampler = StackSampler(thread_ids=[threading.get_ident()]).start()
+        app_receive = receive
+        recorder = get_trace_recorder()
+        if recorder.should_capture(scope):
+            wall_started = time.time()
+            body_parts = []
+            body_size = 0
+
+            async def receive_with_capture():
+                nonlocal body_size
+                message = await receive()
+                if message["type"] == "http.request":
+                    chunk = message.get("body", b"")
+                    body_size += len(chunk)
+                    if body_size <= recorder.max_body_bytes:
+                        body_parts.append(chunk)
+                return message
+
+            app_receive = receive_with_capture
+        else:
+            recorder = None
+
+        async def send_with_status(message):
+            nonlocal status_code, sampler
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if sampler is not None:
+                    profiled, sampler = sampler, None
+                    profile_id = await self._finish_profile(profiled, scope, time.perf_counter() - started)
+                    if profile_id:
+                        message["headers"] = list(message.get("headers", [])) + [
+                            (b"x-profile-id", profile_id.encode())
+                        ]
+                if DB_OPS_HEADERS and db_ops is not None:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-db-reads", str(db_ops.reads).encode()),
+                        (b"x-db-queries", str(db_ops.queries).encode()),
+                        (b"x-db-writes", str(db_ops.writes).encode()),
+                        (b"x-db-docs", str(db_ops.docs).encode()),
+                    ]
+            await send(message)
 
-    async def dispatch(self, request: Request, call_next):
         # Only log write methods to sensitive endpoints
-        if request.method in ["POST", "PUT", "DELETE", "PATCH"]:
-            path = request.url.path
-            if any(p in path for p in ["/admin/", "/vendor/", "/auth/"]):
-                await self._log_action(request)
-        
-        response = await call_next(request)
-        return response
-
-    async def _log_action(self, request: Request):
+        if scope["method"] in AUDITED_METHODS and any(p in scope["path"] for p in AUDITED_PATHS):
+            await self._log_action(scope)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
         try:
-            # Extract user info if available (from auth middleware)
-            # Note: This runs before auth in the stack, so we might not have user yet
-            # In a real app, we'd use a context var or check auth header manually
-            user_id = "anonymous"
-            auth_header = request.headers.get("Authorization")
-            if auth_header:
-                user_id = "authenticated_user" # Placeholder for decoded token
+            # Coalesce repository reads made while handling this request
+            with read_scope(), track_db_ops() as db_ops:
+                await self.app(scope, app_receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            if sampler is not None:
+                # Failed before a response started; keep the profile if it was slow
+                await self._finish_profile(sampler, scope, duration)
+            # The router stores the matched route on the scope; label by its template
+            route_path = getattr(scope.get("route"), "path", "<unmatched>")
+            HTTP_REQUEST_DURATION.labels(scope["method"], route_path, str(status_code)).observe(duration)
+            if recorder is not None:
+                body = b"".join(body_parts) if body_size <= recorder.max_body_bytes else None
+                recorder.record(scope, body, wall_started, status_code, duration, route_path)
+            if db_ops is not None:
+                for kind, collection, count in db_ops.repeated(DB_NPLUS1_THRESHOLD):
+                    logger.warning(
+                        "Possible N+1: %s %s issued %s %s calls on %s",
+                        scope["method"], route_path, count, kind, collection,
+                    )
+            if logger.isEnabledFor(logging.INFO):
+                client = scope.get("client")
+                logger.info(
+                    json.dumps(
+                        {
+                            "method": scope["method"],
+                            "path": scope["path"],
+                            "status_code": status_code,
+                            "duration": round(duration, 6),
+                            "ip": client[0] if client else None,
+                            "db": db_ops.as_dict() if db_ops is not None else None,
+                        }
+                    )
+                )
 
+    @staticmethod
+    def _wants_profile(scope) -> bool:
+        admin_key = os.getenv("ADMIN_API_KEY")
+        if not admin_key:
+            return False
+        for name, value in scope.get("headers") or ():
+            if name == b"x-profile":
+                return value.decode("latin-1") == admin_key
+        return False
+
+    @staticmethod
+    async def _finish_profile(sampler: StackSampler, scope, elapsed: float):
+        # Signal from the loop, but join the sampler thread off it
+        sampler.signal_stop()
+        await asyncio.to_thread(sampler.stop)
+        if elapsed * 1000 < PROFILE_SLOW_REQUEST_MS:
+            return None
+        profile_id = get_profile_store().add(
+            sampler,
+            method=scope["method"],
+            path=scope["path"],
+            elapsed_ms=round(elapsed * 1000, 1),
+            captured_at=datetime.utcnow().isoformat(),
+        )
+        logger.info("Stored profile %s for slow request %s %s", profile_id, scope["method"], scope["path"])
+        return profile_id
+
+    async def _log_action(self, scope):
+        try:
+            headers = dict(scope.get("headers") or [])
+            client = scope.get("client")
+            # Auth runs inside the endpoint, so only the presence of a token is known here
             log_entry = {
-                "timestamp": datetime.utcnow(),
-                "method": request.method,
-                "path": request.url.path,
-                "ip_address": request.client.host,
-                "user_agent": request.headers.get("user-agent"),
-                "user_id": user_id
+                "timestamp": datetime.utcnow().isoformat(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "ip_address": client[0] if client else None,
+                "user_agent": headers.get(b"user-agent", b"").decode("latin-1") or None,
+                "user_id": "authenticated_user" if b"authorization" in headers else "anonymous",
             }
-            
-            # We need to get the DB client. In a middleware this is tricky.
-            # For now, we'll just log to stdout which is captured by Cloud Logging
-            # In production, we'd fire-and-forget to a Pub/Sub topic
-            logger.info(f"AUDIT: {json.dumps(log_entry, default=str)}")
-            
-            # Stream to BigQuery via AnalyticsService
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("AUDIT: %s", json.dumps(log_entry))
+
+            # Buffered and streamed to BigQuery in the background by the event sink
             await self.analytics.log_event("platform_logs", "audit_events", log_entry)
-            
+
         except Exception as e:
             logger.error(f"Failed to write audit log: {e}")
@@ -0,0 +1,133 @@
+"""
+Low-overhead stack-sampling profiler for live workers.
+
+A daemon thread wakes every `interval` seconds, reads every thread's current
+frame via `sys._current_frames()` and counts the collapsed stack. Nothing is
+installed in the profiled code (no `sys.setprofile`), so the cost is one
+stack walk per thread per sample on the sampler thread. Output is in the
+collapsed-stack format understood by flamegraph.pl, speedscope and inferno:
+
+    MainThread;main.py:get_products;main.py:get_best_price 42
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class StackSampler:
+    """Sample thread stacks on a background thread until `stop()`.
+
+    `thread_ids` limits sampling to those threads (e.g. the event loop thread
+    for a single request); by default every thread except the sampler's own
+    is sampled, which covers the loop and the Stripe/bcrypt executor pools.
+    """
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        thread_ids: Optional[Iterable[int]] = None,
+        max_depth: int = 128,
+    ):
+        self.interval = interval or float(os.getenv("PROFILER_INTERVAL_MS", "5")) / 1000
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+        self.duration = 0.0
+
+    def start(self) -> "StackSampler":
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def signal_stop(self) -> "StackSampler":
+        """Tell the sampling thread to exit without waiting for it."""
+        if self._thread is not None and not self._stop.is_set():
+            self._stop.set()
+            self.duration = time.perf_counter() - self._started
+        return self
+
+    def stop(self) -> "StackSampler":
+        """Stop sampling and join the thread; blocks for up to one interval."""
+        if self._thread is not None:
+            self.signal_stop()
+            self._thread.join()
+            self._thread = None
+        return self
+
+    def collapsed(self) -> str:
+        lines = [f"{stack} {count}" for stack, count in self._stacks.most_common()]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def summary(self, top: int = 20) -> Dict[str, Any]:
+        return {
+            "samples": self.samples,
+            "interval_ms": round(self.interval * 1000, 3),
+            "duration_seconds": round(self.duration, 3),
+            "top_stacks": [
+                {"stack": stack, "samples": count} for stack, count in self._stacks.most_common(top)
+            ],
+        }
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names: Dict[int, str] = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, frame in frames.items():
+                if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                name = names.get(thread_id)
+                if name is None:
+                    names.update({t.ident: t.name for t in threading.enumerate()})
+                    name = names.get(thread_id, str(thread_id))
+                self._stacks[self._collapse(name, frame)] += 1
+            self.samples += 1
+            del frames
+
+    def _collapse(self, thread_name: str, frame) -> str:
+        parts: List[str] = []
+        while frame is not None and len(parts) < self.max_depth:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        parts.append(thread_name)
+        return ";".join(reversed(parts))
+
+
+class ProfileStore:
+    """Most recent slow-request profiles, fetched later by id."""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or int(os.getenv("PROFILER_MAX_STORED", "50"))
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def add(self, sampler: StackSampler, **meta: Any) -> str:
+        profile_id = uuid.uuid4().hex[:16]
+        self._profiles[profile_id] = {"collapsed": sampler.collapsed(), **sampler.summary(), **meta}
+        while len(self._profiles) > self.max_entries:
+            self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [
+            {"id": profile_id, **{k: v for k, v in profile.items() if k not in ("collapsed", "top_stacks")}}
+            for profile_id, profile in reversed(self._profiles.items())
+        ]
+
+
+@lru_cache(maxsize=1)
+def get_profile_store() -> ProfileStore:
+    return ProfileStore()
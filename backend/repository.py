@@ -0,0 +1,268 @@
+"""
+Async repository layer over the shared Firestore client.
+
+Every call awaits the AsyncClient (or the mock), so services never block the
+event loop or drop a write by forgetting to await it. Reads made inside a
+`read_scope()` (one per HTTP request) are coalesced: concurrent and repeated
+gets of the same document share a single RPC.
+"""
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from google.api_core import exceptions as gcp_exceptions
+
+from database import db
+
+Filter = Tuple[str, str, Any]
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+_read_cache: ContextVar[Optional[Dict[Tuple[str, str], asyncio.Future]]] = ContextVar(
+    "firestore_read_cache", default=None
+)
+
+
+@contextmanager
+def read_scope():
+    """Coalesce document reads for the duration of the block."""
+    token = _read_cache.set({})
+    try:
+        yield
+    finally:
+        _read_cache.reset(token)
+
+
+@contextmanager
+def no_read_scope():
+    """Read straight from Firestore, e.g. in background work started inside a request."""
+    token = _read_cache.set(None)
+    try:
+        yield
+    finally:
+        _read_cache.reset(token)
+
+
+def _forget(collection: str, doc_id: str):
+    cache = _read_cache.get()
+    if cache is not None:
+        cache.pop((collection, doc_id), None)
+
+
+async def _fetch(collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+    snapshot = await db.collection(collection).document(doc_id).get()
+    if not snapshot.exists:
+        return None
+    return dict(snapshot.to_dict() or {})
+
+
+# ----------------------------------------------------------------------
+# Reads
+# ----------------------------------------------------------------------
+async def get_doc(collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+    """Return a copy of the document data, or None if it does not exist."""
+    cache = _read_cache.get()
+    if cache is None:
+        return await _fetch(collection, doc_id)
+
+    key = (collection, doc_id)
+    pending = cache.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(_fetch(collection, doc_id))
+        cache[key] = pending
+    try:
+        data = await asyncio.shield(pending)
+    except Exception:
+        cache.pop(key, None)
+        raise
+    return dict(data) if data is not None else None
+
+
+async def get_many(collection: str, doc_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Fetch several documents in one `get_all` round trip; missing ids are omitted."""
+    wanted = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id]
+    cache = _read_cache.get()
+    found: Dict[str, Dict[str, Any]] = {}
+    if cache is not None:
+        cached = [doc_id for doc_id in wanted if (collection, doc_id) in cache]
+        for doc_id in cached:
+            data = await get_doc(collection, doc_id)
+            if data is not None:
+                found[doc_id] = data
+        wanted = [doc_id for doc_id in wanted if doc_id not in cached]
+    if not wanted:
+        return found
+
+    col = db.collection(collection)
+    refs = [col.document(doc_id) for doc_id in wanted]
+    async for snapshot in db.get_all(refs):
+        data = (snapshot.to_dict() or {}) if snapshot.exists else None
+        if cache is not None:
+            done = asyncio.get_running_loop().create_future()
+            done.set_result(data)
+            cache[(collection, snapshot.id)] = done
+        if data is not None:
+            found[snapshot.id] = dict(data)
+    return found
+
+
+def _build_query(
+    collection: str,
+    filters: Sequence[Filter],
+    order_by: Optional[str],
+    descending: bool,
+    limit: Optional[int],
+):
+    query = db.collection(collection)
+    for field, op, value in filters:
+        query = query.where(field, op, value)
+    if order_by:
+        query = query.order_by(order_by, direction="DESCENDING" if descending else "ASCENDING")
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+async def stream(
+    collection: str,
+    filters: Sequence[Filter] = (),
+    order_by: Optional[str] = None,
+    descending: bool = False,
+    limit: Optional[int] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Iterate matching documents as dicts with their `id` added."""
+    query = _build_query(collection, filters, order_by, descending, limit)
+    async for snapshot in query.stream():
+        data = dict(snapshot.to_dict() or {})
+        data["id"] = snapshot.id
+        yield data
+
+
+async def query(
+    collection: str,
+    filters: Sequence[Filter] = (),
+    order_by: Optional[str] = None,
+    descending: bool = False,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Collect matching documents as dicts with their `id` added."""
+    return [doc async for doc in stream(collection, filters, order_by, descending, limit)]
+
+
+async def find_one(collection: str, filters: Sequence[Filter]) -> Optional[Dict[str, Any]]:
+    docs = await query(collection, filters, limit=1)
+    return docs[0] if docs else None
+
+
+# ----------------------------------------------------------------------
+# Writes
+# ----------------------------------------------------------------------
+async def set_doc(collection: str, doc_id: str, data: Dict[str, Any], merge: bool = False):
+    _forget(collection, doc_id)
+    await db.collection(collection).document(doc_id).set(data, merge=merge)
+
+
+async def update_doc(collection: str, doc_id: str, data: Dict[str, Any]):
+    """Partial update; raises NotFound if the document does not exist."""
+    _forget(collection, doc_id)
+    await db.collection(collection).document(doc_id).update(data)
+
+
+async def delete_doc(collection: str, doc_id: str):
+    _forget(collection, doc_id)
+    await db.collection(collection).document(doc_id).delete()
+
+
+async def add_doc(collection: str, data: Dict[str, Any]) -> str:
+    """Create a document with a generated id and return the id."""
+    ref = db.collection(collection).document()
+    await ref.set(data)
+    return ref.id
+
+
+# ----------------------------------------------------------------------
+# Conditional writes (optimistic concurrency on the document update time)
+# ----------------------------------------------------------------------
+async def get_versioned(collection: str, doc_id: str) -> Tuple[Optional[Dict[str, Any]], Any]:
+    """Document data and its update time; always read from Firestore, never coalesced."""
+    snapshot = await db.collection(collection).document(doc_id).get()
+    if not snapshot.exists:
+        return None, None
+    return dict(snapshot.to_dict() or {}), snapshot.update_time
+
+
+async def create_doc(collection: str, doc_id: str, data: Dict[str, Any]) -> Any:
+    """Create the document; returns its update time, or None if it already exists."""
+    _forget(collection, doc_id)
+    try:
+        result = await db.collection(collection).document(doc_id).create(data)
+    except gcp_exceptions.AlreadyExists:
+        return None
+    return result.update_time
+
+
+async def update_if_unchanged(
+    collection: str, doc_id: str, data: Dict[str, Any], update_time: Any
+) -> Any:
+    """Update only if nobody wrote since `update_time`; returns the new time or None."""
+    _forget(collection, doc_id)
+    option = db.write_option(last_update_time=update_time)
+    try:
+        result = await db.collection(collection).document(doc_id).update(data, option=option)
+    except (gcp_exceptions.FailedPrecondition, gcp_exceptions.NotFound):
+        return None
+    return result.update_time
+
+
+async def delete_if_unchanged(collection: str, doc_id: str, update_time: Any) -> bool:
+    """Delete only if nobody wrote since `update_time`."""
+    _forget(collection, doc_id)
+    option = db.write_option(last_update_time=update_time)
+    try:
+        await db.collection(collection).document(doc_id).delete(option=option)
+    except (gcp_exceptions.FailedPrecondition, gcp_exceptions.NotFound):
+        return False
+    return True
+
+
+class Batch:
+    """Buffered writes committed atomically, split into Firestore-sized chunks."""
+
+    def __init__(self):
+        self._ops: List[Tuple[str, str, str, Optional[Dict[str, Any]], bool]] = []
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    def set(self, collection: str, doc_id: Optional[str], data: Dict[str, Any], merge: bool = False) -> str:
+        doc_id = doc_id or db.collection(collection).document().id
+        self._ops.append(("set", collection, doc_id, data, merge))
+        return doc_id
+
+    def update(self, collection: str, doc_id: str, data: Dict[str, Any]):
+        self._ops.append(("update", collection, doc_id, data, False))
+
+    def delete(self, collection: str, doc_id: str):
+        self._ops.append(("delete", collection, doc_id, None, False))
+
+    async def commit(self):
+        """Commit the buffered writes; only atomic when they fit in one chunk."""
+        ops, self._ops = self._ops, []
+        for start in range(0, len(ops), MAX_BATCH_WRITES):
+            batch = db.batch()
+            for action, collection, doc_id, data, merge in ops[start:start + MAX_BATCH_WRITES]:
+                _forget(collection, doc_id)
+                ref = db.collection(collection).document(doc_id)
+                if action == "set":
+                    batch.set(ref, data, merge=merge)
+                elif action == "update":
+                    batch.update(ref, data)
+                else:
+                    batch.delete(ref)
+            await batch.commit()
+
+
+def batch() -> Batch:
+    return Batch()
@@ -7,6 +7,8 @@ from typing import Any, Dict, List, Optional
 
 import httpx
 
+from metrics import track_integration
+
 logger = logging.getLogger(__name__)
 
 
@@ -15,7 +17,7 @@ class ShippoService:
 
     def __init__(self):
         self.api_token = os.getenv("SHIPPO_API_KEY")
-        self.base_url = "https://api.goshippo.com"
+        self.base_url = os.getenv("SHIPPO_API_BASE_URL", "https://api.goshippo.com").rstrip("/")
         self.default_from = {
             "name": os.getenv("SHIPPO_FROM_NAME", "GeoCheapest Vendor"),
             "street1": os.getenv("SHIPPO_FROM_STREET", "123 Front St W"),
@@ -246,7 +248,10 @@ class ShippoService:
             "Content-Type": "application/json",
         }
         async with httpx.AsyncClient(timeout=30) as client:
-            response = await client.request(method, url, headers=headers, json=json)
+            # Label by resource, not the full path, to keep ids out of the metric
+            with track_integration("shippo", f"{method} {path.strip('/').split('/')[0]}") as call:
+                response = await client.request(method, url, headers=headers, json=json)
+                call.status = response.status_code
             if response.status_code >= 400:
                 logger.warning("Shippo request %s failed: %s %s", path, response.status_code, response.text[:200])
                 return {}
@@ -6,21 +6,28 @@ import gzip
 import json
 import os
 import logging
-from datetime import datetime
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional
 
 import httpx
+from google.api_core import exceptions as google_exceptions
 from google.cloud import firestore
 
-from database import PRODUCTS, SHOPIFY_LISTINGS, STORES, db
+from change_detection import WriteTracker, set_if_changed
+import repository
+from database import INVENTORY_ITEM_INDEX, PRODUCTS, SHOPIFY_LISTINGS, STORES
+from metrics import record_sync, track_integration
 from security import TokenCipher, get_token_cipher
 from search_service import SearchService
 from agent_service import AgentService
+from deal_service import get_deal_service
 
 logger = logging.getLogger(__name__)
-BULK_PRODUCTS_QUERY = """
+_BULK_PRODUCTS_TEMPLATE = """
 {
-  products {
+  products__FILTER__ {
     edges {
       node {
         id
@@ -65,8 +72,42 @@ BULK_PRODUCTS_QUERY = """
 }
 """
 
+
+
+def build_bulk_products_query(updated_since: Optional[datetime] = None) -> str:
+    """Bulk products query, optionally limited to products updated after a watermark."""
+    product_filter = ""
+    if updated_since:
+        stamp = updated_since.strftime("%Y-%m-%dT%H:%M:%SZ")
+        product_filter = f"(query: \"updated_at:>'{stamp}'\")"
+    return _BULK_PRODUCTS_TEMPLATE.replace("__FILTER__", product_filter)
+
+
+BULK_PRODUCTS_QUERY = build_bulk_products_query()
+
 WEBHOOK_TOPICS = ["products/update", "inventory_levels/update"]
 
+# Sync states whose bulk operation can be picked up again by the next sync
+RESUMABLE_SYNC_STATUSES = ("running", "interrupted", "timed_out")
+
+BULK_FINISHED_STATUSES = ("COMPLETED", "FAILED", "CANCELED", "EXPIRED")
+
+BULK_OPERATION_QUERY = """
+query BulkOp($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation {
+      id
+      status
+      url
+      errorCode
+      objectCount
+      completedAt
+      createdAt
+    }
+  }
+}
+"""
+
 
 class ShopifyService:
     """Handle Shopify API interactions (OAuth, product sync, webhooks)."""
@@ -74,9 +115,22 @@ class ShopifyService:
     def __init__(self):
         self.search_service = SearchService()
         self.agent_service = AgentService()
+        self.deal_service = get_deal_service()
         self.api_version = os.getenv("SHOPIFY_API_VERSION", "2024-01")
+        # e.g. http://localhost:9100/shopify to run against the fake servers in `fakes`
+        self.api_base_url = os.getenv("SHOPIFY_API_BASE_URL", "").rstrip("/")
         self.backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
         self.token_cipher = get_token_cipher()
+        self.bulk_poll_initial = float(os.getenv("SHOPIFY_BULK_POLL_INITIAL_SECONDS", "1"))
+        self.bulk_poll_max = float(os.getenv("SHOPIFY_BULK_POLL_MAX_SECONDS", "30"))
+        self.bulk_timeout = float(os.getenv("SHOPIFY_BULK_TIMEOUT_SECONDS", "1800"))
+        self.full_reconcile_hours = float(os.getenv("SHOPIFY_FULL_RECONCILE_HOURS", "168"))
+        self.watermark_skew = timedelta(
+            seconds=int(os.getenv("SHOPIFY_WATERMARK_SKEW_SECONDS", "300"))
+        )
+        self.sync_checkpoint_every = int(os.getenv("SHOPIFY_SYNC_CHECKPOINT_EVERY", "250"))
+        self.inventory_cache_size = int(os.getenv("SHOPIFY_INVENTORY_CACHE_SIZE", "10000"))
+        self._inventory_index: "OrderedDict[str, List[str]]" = OrderedDict()
 
     # ------------------------------------------------------------------
     # OAuth helpers
@@ -90,45 +144,144 @@ class ShopifyService:
     # ------------------------------------------------------------------
     # Public API
     # ------------------------------------------------------------------
-    async def sync_products(self, shop: str):
-        """Run a Shopify GraphQL bulk sync for the given shop."""
-        store_doc = db.collection(STORES).document(shop).get()
-        if not store_doc.exists:
+    async def sync_products(self, shop: str, mode: str = "auto"):
+        """Run a Shopify GraphQL bulk sync for the given shop.
+
+        `mode` is "full", "delta" or "auto". Delta syncs only fetch products
+        updated since the stored watermark and merge them into existing
+        listings; auto falls back to a full sync when there is no watermark or
+        the last full reconciliation is older than `full_reconcile_hours`.
+        Full syncs mark listings that no longer exist in Shopify inactive.
+
+        Progress is checkpointed on the store doc; a sync that was interrupted
+        or timed out resumes its bulk operation and skips records already
+        processed instead of starting over.
+        """
+        started = time.perf_counter()
+        store_data = await repository.get_doc(STORES, shop)
+        if store_data is None:
             return 0
 
-        store_data = store_doc.to_dict()
         try:
-            access_token = self._get_store_token(store_doc, store_data)
+            access_token = await self._get_store_token(shop, store_data)
         except ValueError:
             return 0
 
-        bulk_id = await self._run_products_bulk_query(shop, access_token)
+        bulk_id = None
+        resume_from = 0
+        if store_data.get("sync_status") in RESUMABLE_SYNC_STATUSES:
+            bulk_id = store_data.get("bulk_operation_id")
+            resume_from = int(store_data.get("sync_processed") or 0) if bulk_id else 0
+        if bulk_id:
+            operation = await self._get_bulk_operation(shop, access_token, bulk_id)
+            if not operation or operation.get("status") in ("FAILED", "CANCELED", "EXPIRED"):
+                # Nothing left to resume; the checkpoint belongs to the old export
+                logger.info("Bulk operation %s for %s is gone; starting a new sync", bulk_id, shop)
+                bulk_id = None
+                resume_from = 0
+        if bulk_id:
+            mode = store_data.get("sync_mode") or "full"
+            next_watermark = store_data.get("sync_pending_watermark") or datetime.utcnow()
+            logger.info("Resuming %s bulk operation %s for %s at record %s", mode, bulk_id, shop, resume_from)
+        else:
+            mode = self._choose_sync_mode(store_data, mode)
+            next_watermark = datetime.utcnow() - self.watermark_skew
+            updated_since = store_data.get("sync_watermark") if mode == "delta" else None
+            bulk_id = await self._run_products_bulk_query(
+                shop, access_token, build_bulk_products_query(updated_since)
+            )
         if not bulk_id:
+            await repository.update_doc(
+                STORES, shop, {"sync_status": "failed", "sync_error": "Bulk query was rejected"}
+            )
             return 0
 
-        bulk_result = await self._wait_for_bulk_operation(shop, access_token)
-        if not bulk_result or not bulk_result.get("url"):
+        await repository.update_doc(
+            STORES,
+            shop,
+            {
+                "sync_status": "running",
+                "sync_mode": mode,
+                "bulk_operation_id": bulk_id,
+                "sync_processed": resume_from,
+                "sync_pending_watermark": next_watermark,
+                "sync_started_at": store_data.get("sync_started_at") if resume_from else datetime.utcnow(),
+                "sync_heartbeat_at": datetime.utcnow(),
+                "sync_error": None,
+            }
+        )
+
+        bulk_result = await self._wait_for_bulk_operation(shop, access_token, bulk_id)
+        if not bulk_result:
+            await repository.update_doc(
+                STORES,
+                shop,
+                {"sync_status": "timed_out", "sync_error": "Bulk operation did not finish in time"},
+            )
+            return 0
+        if bulk_result.get("status") != "COMPLETED":
+            await repository.update_doc(
+                STORES,
+                shop,
+                {
+                    "sync_status": "failed",
+                    "sync_error": bulk_result.get("errorCode"),
+                    "bulk_operation_id": None,
+                }
+            )
             return 0
 
         processed = 0
-        async for record in self._stream_bulk_file(bulk_result["url"]):
-            if record.get("__typename") != "Product":
+        seen = 0
+        seen_listing_ids = set()
+        tracker = WriteTracker()
+        # A completed operation with no matching products has no result file
+        records = self._iter_bulk_products(bulk_result["url"]) if bulk_result.get("url") else _empty()
+        async for record in records:
+            seen += 1
+            seen_listing_ids.update(self._listing_ids_from_graphql(shop, record))
+            if seen <= resume_from:
+                processed += 1
                 continue
 
             normalized = self._normalize_from_graphql(record, store_data)
-            if not normalized:
-                continue
-
-            product_id = self._upsert_product(normalized)
-            self._upsert_listings(store_data, shop, product_id, normalized)
-            processed += 1
-
-        store_doc.reference.update(
+            if normalized:
+                product_id = await self._upsert_product(normalized)
+                listings = await self._upsert_listings(
+                    store_data, shop, product_id, normalized, tracker
+                )
+                await self._observe_deals(product_id, listings)
+                processed += 1
+
+            if seen % self.sync_checkpoint_every == 0:
+                await repository.update_doc(
+                    STORES, shop, {"sync_processed": seen, "sync_heartbeat_at": datetime.utcnow()}
+                )
+
+        update = {
+            "last_sync_at": datetime.utcnow(),
+            "sync_status": "completed",
+            "sync_processed": seen,
+            "sync_watermark": next_watermark,
+            "bulk_operation_id": None,
+            "last_sync_stats": {"mode": mode, "products": processed, **tracker.as_dict()},
+        }
+        if mode == "full":
+            deactivated = await self._deactivate_missing_listings(shop, seen_listing_ids)
+            update["total_products"] = processed
+            update["last_full_sync_at"] = update["last_sync_at"]
+            update["last_sync_stats"]["deactivated"] = deactivated
+        await repository.update_doc(STORES, shop, update)
+        logger.info("Shopify %s sync for %s: %s", mode, shop, update["last_sync_stats"])
+        record_sync(
+            "shopify",
+            mode,
+            time.perf_counter() - started,
             {
-                "last_sync_at": datetime.utcnow(),
-                "total_products": processed,
-                "sync_status": "completed",
-            }
+                "written": tracker.written,
+                "skipped": tracker.skipped,
+                "deactivated": update["last_sync_stats"].get("deactivated", 0),
+            },
         )
         return processed
 
@@ -155,29 +308,32 @@ class ShopifyService:
             "ai_tags": normalized.get("tags", [])
         })
         """Handle product update webhook payload."""
-        store_doc = db.collection(STORES).document(shop).get()
-        if not store_doc.exists:
+        store_data = await repository.get_doc(STORES, shop)
+        if store_data is None:
             return
 
-        store_data = store_doc.to_dict()
         normalized = self._normalize_from_rest(product_data, store_data)
         if not normalized:
             return
 
-        product_id = self._upsert_product(normalized)
-        self._upsert_listings(store_data, shop, product_id, normalized)
+        product_id = await self._upsert_product(normalized)
+        listings = await self._upsert_listings(store_data, shop, product_id, normalized)
+        await self._observe_deals(product_id, listings)
 
     async def delete_product(self, shop: str, product_id: str):
         """Mark Shopify listings as deleted when a product is removed."""
-        listings = (
-            db.collection(SHOPIFY_LISTINGS)
-            .where("store_id", "==", shop)
-            .where("shopify_product_id", "==", str(product_id))
-            .stream()
+        listings = await repository.query(
+            SHOPIFY_LISTINGS,
+            [("store_id", "==", shop), ("shopify_product_id", "==", str(product_id))],
         )
         for listing in listings:
-            listing.reference.update(
-                {"status": "deleted", "updated_at": datetime.utcnow()}
+            await repository.update_doc(
+                SHOPIFY_LISTINGS,
+                listing["id"],
+                {"status": "deleted", "content_hash": None, "updated_at": datetime.utcnow()},
+            )
+            await self.deal_service.observe_listing(
+                listing.get("product_id"), listing["id"], None, False, {}
             )
 
     async def handle_inventory_level_update(
@@ -188,35 +344,52 @@ class ShopifyService:
         if not inventory_item_id:
             return
 
-        listing_docs = (
-            db.collection(SHOPIFY_LISTINGS)
-            .where("store_id", "==", shop)
-            .where("inventory_item_id", "==", str(inventory_item_id))
-            .stream()
-        )
-        for doc in listing_docs:
-            doc.reference.update(
-                {"quantity": payload.get("available", 0), "updated_at": datetime.utcnow()}
-            )
+        listing_ids = await self._get_inventory_listings(shop, str(inventory_item_id))
+        update = {
+            "quantity": payload.get("available", 0),
+            "content_hash": None,
+            "updated_at": datetime.utcnow(),
+        }
+        for listing_id in listing_ids:
+            try:
+                await repository.update_doc(SHOPIFY_LISTINGS, listing_id, update)
+            except google_exceptions.NotFound:
+                self._inventory_index.pop(self._inventory_key(shop, str(inventory_item_id)), None)
+
+    def webhook_coalesce_key(
+        self, shop: str, topic: str, payload: Dict[str, Any]
+    ) -> Optional[str]:
+        """Key that groups bursty webhooks touching the same product or inventory item."""
+        if topic in ("products/create", "products/update", "products/delete"):
+            product_id = payload.get("id")
+            return f"{shop}:product:{product_id}" if product_id else None
+        if topic == "inventory_levels/update":
+            item_id = payload.get("inventory_item_id")
+            return f"{shop}:inventory:{item_id}" if item_id else None
+        return None
 
     async def get_shop_details(self, shop: str, access_token: str) -> Dict[str, Any]:
         """Fetch metadata about the Shopify store."""
-        endpoint = f"https://{shop}/admin/api/{self.api_version}/shop.json"
+        endpoint = self.admin_api_url(shop, "shop.json")
         headers = self._rest_headers(access_token)
         async with httpx.AsyncClient(timeout=20) as client:
-            response = await client.get(endpoint, headers=headers)
+            with track_integration("shopify_rest", "GET shop") as call:
+                response = await client.get(endpoint, headers=headers)
+                call.status = response.status_code
             if response.status_code == 200:
                 return response.json().get("shop", {})
         return {}
 
     async def ensure_webhooks(self, shop: str, access_token: str):
         """Create or update webhook subscriptions for the vendor."""
-        endpoint = f"https://{shop}/admin/api/{self.api_version}/webhooks.json"
+        endpoint = self.admin_api_url(shop, "webhooks.json")
         headers = self._rest_headers(access_token)
         callback_url = f"{self.backend_url}/api/shopify/webhook"
 
         async with httpx.AsyncClient(timeout=20) as client:
-            existing_resp = await client.get(endpoint, headers=headers)
+            with track_integration("shopify_rest", "GET webhooks") as call:
+                existing_resp = await client.get(endpoint, headers=headers)
+                call.status = existing_resp.status_code
             existing = existing_resp.json().get("webhooks", []) if existing_resp.is_success else []
             existing_map = {hook["topic"]: hook for hook in existing}
 
@@ -232,15 +405,19 @@ class ShopifyService:
                 if hook and hook.get("address") == callback_url:
                     continue
                 if hook:
-                    update_url = f"https://{shop}/admin/api/{self.api_version}/webhooks/{hook['id']}.json"
-                    await client.put(update_url, headers=headers, json=payload)
+                    update_url = self.admin_api_url(shop, f"webhooks/{hook['id']}.json")
+                    with track_integration("shopify_rest", "PUT webhook") as call:
+                        response = await client.put(update_url, headers=headers, json=payload)
+                        call.status = response.status_code
                 else:
-                    await client.post(endpoint, headers=headers, json=payload)
+                    with track_integration("shopify_rest", "POST webhook") as call:
+                        response = await client.post(endpoint, headers=headers, json=payload)
+                        call.status = response.status_code
 
     # ------------------------------------------------------------------
     # Token helpers
     # ------------------------------------------------------------------
-    def _get_store_token(self, store_doc, store_data) -> str:
+    async def _get_store_token(self, shop: str, store_data: Dict[str, Any]) -> str:
         encrypted = store_data.get("access_token_encrypted")
         if encrypted:
             return self.decrypt_token(encrypted)
@@ -250,18 +427,33 @@ class ShopifyService:
             raise ValueError("Shopify access token missing for store")
 
         encrypted = self.encrypt_token(legacy)
-        store_doc.reference.update(
+        await repository.update_doc(
+            STORES,
+            shop,
             {
                 "access_token_encrypted": encrypted,
                 "access_token_migrated_at": datetime.utcnow(),
-            }
+            },
         )
         return legacy
 
     # ------------------------------------------------------------------
     # Bulk operation helpers
     # ------------------------------------------------------------------
-    async def _run_products_bulk_query(self, shop: str, token: str) -> Optional[str]:
+    def _choose_sync_mode(self, store_data: Dict[str, Any], requested: str) -> str:
+        if requested == "full" or not store_data.get("sync_watermark"):
+            return "full"
+        if requested == "delta":
+            return "delta"
+        last_full = store_data.get("last_full_sync_at")
+        if not isinstance(last_full, datetime):
+            return "full"
+        age = datetime.utcnow() - last_full.replace(tzinfo=None)
+        return "full" if age > timedelta(hours=self.full_reconcile_hours) else "delta"
+
+    async def _run_products_bulk_query(
+        self, shop: str, token: str, bulk_query: str = BULK_PRODUCTS_QUERY
+    ) -> Optional[str]:
         mutation = """
         mutation RunBulk($query: String!) {
           bulkOperationRunQuery(query: $query) {
@@ -270,8 +462,8 @@ class ShopifyService:
           }
         }
         """
-        payload = {"query": mutation, "variables": {"query": BULK_PRODUCTS_QUERY}}
-        response = await self._graphql_request(shop, token, payload)
+        payload = {"query": mutation, "variables": {"query": bulk_query}}
+        response = await self._graphql_request(shop, token, payload, "bulkOperationRunQuery")
         data = response.get("data", {}).get("bulkOperationRunQuery", {})
         errors = data.get("userErrors")
         if errors:
@@ -279,36 +471,52 @@ class ShopifyService:
         operation = data.get("bulkOperation")
         return operation.get("id") if operation else None
 
-    async def _wait_for_bulk_operation(self, shop: str, token: str) -> Optional[Dict[str, Any]]:
-        query = """
-        query CurrentBulkOp {
-          currentBulkOperation {
-            id
-            status
-            url
-            errorCode
-            objectCount
-            completedAt
-            createdAt
-          }
-        }
+    async def _get_bulk_operation(
+        self, shop: str, token: str, bulk_id: str
+    ) -> Optional[Dict[str, Any]]:
+        """Fetch a bulk operation by id, or None if Shopify no longer knows it.
+
+        Looked up with `node(id:)` rather than `currentBulkOperation`, which
+        only reports the shop's latest operation.
         """
-        for _ in range(60):
-            response = await self._graphql_request(shop, token, {"query": query})
-            operation = response.get("data", {}).get("currentBulkOperation")
-            if not operation:
-                await asyncio.sleep(2)
-                continue
+        payload = {"query": BULK_OPERATION_QUERY, "variables": {"id": bulk_id}}
+        response = await self._graphql_request(shop, token, payload, "bulkOperation")
+        operation = (response.get("data") or {}).get("node")
+        return operation if operation and operation.get("id") == bulk_id else None
 
-            status = operation.get("status")
-            if status in ("COMPLETED", "FAILED", "CANCELED"):
+    async def _wait_for_bulk_operation(
+        self, shop: str, token: str, bulk_id: str
+    ) -> Optional[Dict[str, Any]]:
+        """Poll until the bulk operation finishes, backing off between polls.
+
+        Returns None (and logs) if it is still running after `bulk_timeout`.
+        An operation that disappears is reported as finished with errorCode
+        NOT_FOUND so the sync fails instead of waiting out the timeout.
+        """
+        delay = self.bulk_poll_initial
+        deadline = time.monotonic() + self.bulk_timeout
+        while True:
+            operation = await self._get_bulk_operation(shop, token, bulk_id)
+            if operation is None:
+                logger.error("Bulk operation %s for %s no longer exists", bulk_id, shop)
+                return {"id": bulk_id, "status": "FAILED", "errorCode": "NOT_FOUND"}
+            if operation.get("status") in BULK_FINISHED_STATUSES:
                 return operation
-            await asyncio.sleep(2)
-        return None
+
+            if time.monotonic() + delay > deadline:
+                logger.error(
+                    "Bulk operation %s for %s still running after %ss",
+                    bulk_id, shop, self.bulk_timeout,
+                )
+                return None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.bulk_poll_max)
 
     async def _stream_bulk_file(self, url: str):
         async with httpx.AsyncClient(timeout=None) as client:
-            response = await client.get(url)
+            with track_integration("shopify_bulk", "download") as call:
+                response = await client.get(url)
+                call.status = response.status_code
             response.raise_for_status()
             raw = response.content
             try:
@@ -321,13 +529,38 @@ class ShopifyService:
                     continue
                 yield json.loads(line.decode("utf-8"))
 
+    async def _iter_bulk_products(self, url: str):
+        """Reassemble bulk JSONL rows into product records.
+
+        Bulk operations flatten nested connections: each variant and image is
+        its own row carrying `__parentId`, written after its parent product.
+        Children are folded back into `variants`/`images` edges so the
+        records match the shape `_normalize_from_graphql` expects.
+        """
+        product = None
+        async for row in self._stream_bulk_file(url):
+            parent_id = row.get("__parentId")
+            if parent_id is None:
+                if product is not None:
+                    yield product
+                product = row
+                continue
+            if product is None or parent_id != product.get("id"):
+                continue
+            field = "variants" if "/ProductVariant/" in str(row.get("id", "")) else "images"
+            product.setdefault(field, {}).setdefault("edges", []).append({"node": row})
+        if product is not None:
+            yield product
+
     async def _graphql_request(
-        self, shop: str, token: str, payload: Dict[str, Any]
+        self, shop: str, token: str, payload: Dict[str, Any], operation: str = "graphql"
     ) -> Dict[str, Any]:
-        endpoint = f"https://{shop}/admin/api/{self.api_version}/graphql.json"
+        endpoint = self.admin_api_url(shop, "graphql.json")
         headers = self._graphql_headers(token)
         async with httpx.AsyncClient(timeout=30) as client:
-            response = await client.post(endpoint, headers=headers, json=payload)
+            with track_integration("shopify_graphql", operation) as call:
+                response = await client.post(endpoint, headers=headers, json=payload)
+                call.status = response.status_code
             response.raise_for_status()
             return response.json()
 
@@ -467,29 +700,23 @@ class ShopifyService:
     # ------------------------------------------------------------------
     # Firestore persistence
     # ------------------------------------------------------------------
-    def _upsert_product(self, normalized: Dict[str, Any]) -> str:
-        products_query = (
-            db.collection(PRODUCTS)
-            .where("name", "==", normalized["title"])
-            .limit(1)
-            .stream()
-        )
-        product_id = None
-        for doc in products_query:
-            product_id = doc.id
-            doc.reference.update(
+    async def _upsert_product(self, normalized: Dict[str, Any]) -> str:
+        existing = await repository.find_one(PRODUCTS, [("name", "==", normalized["title"])])
+        if existing:
+            product_id = existing["id"]
+            await repository.update_doc(
+                PRODUCTS,
+                product_id,
                 {
                     "updated_at": datetime.utcnow(),
                     "image_url": normalized["images"][0] if normalized["images"] else None,
                     "category": normalized["game"],
                     "segment": normalized["segment"],
-                }
+                },
             )
-            break
-
-        if not product_id:
-            ref = db.collection(PRODUCTS).document()
-            ref.set(
+        else:
+            product_id = await repository.add_doc(
+                PRODUCTS,
                 {
                     "name": normalized["title"],
                     "description": normalized.get("description"),
@@ -499,19 +726,21 @@ class ShopifyService:
                     "created_at": datetime.utcnow(),
                     "updated_at": datetime.utcnow(),
                     "total_sales": 0,
-                }
+                },
             )
-            product_id = ref.id
 
         return product_id
 
-    def _upsert_listings(
+    async def _upsert_listings(
         self,
         store_data: Dict[str, Any],
         shop: str,
         product_id: str,
         normalized: Dict[str, Any],
-    ):
+        tracker: Optional[WriteTracker] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """Write the product's variant listings; returns only those that changed."""
+        written: Dict[str, Dict[str, Any]] = {}
         for variant in normalized["variants"]:
             listing_id = f"{shop}_{variant['id']}"
             listing_data = {
@@ -529,15 +758,116 @@ class ShopifyService:
                 "is_preorder": not variant["available"],
                 "status": "active" if normalized["status"] == "active" else "inactive",
                 "images": normalized["images"],
-                "updated_at": datetime.utcnow(),
             }
-            listing_ref = db.collection(SHOPIFY_LISTINGS).document(listing_id)
-            existing = listing_ref.get()
-            if existing.exists:
-                listing_data["created_at"] = existing.to_dict().get("created_at")
-            else:
-                listing_data["created_at"] = datetime.utcnow()
-            listing_ref.set(listing_data)
+            if not await set_if_changed(SHOPIFY_LISTINGS, listing_id, listing_data, tracker):
+                continue
+            written[listing_id] = listing_data
+            if variant.get("inventory_item_id"):
+                await self._index_inventory_item(shop, variant["inventory_item_id"], listing_id)
+        return written
+
+    async def _observe_deals(self, product_id: str, listings: Dict[str, Dict[str, Any]]):
+        for listing_id, listing in listings.items():
+            await self.deal_service.observe_listing(
+                product_id,
+                listing_id,
+                listing["price"],
+                listing["status"] == "active",
+                listing,
+            )
+
+    def _listing_ids_from_graphql(self, shop: str, record: Dict[str, Any]) -> List[str]:
+        return [
+            f"{shop}_{self._gid_to_id((edge.get('node') or {}).get('id'))}"
+            for edge in (record.get("variants") or {}).get("edges", [])
+            if (edge.get("node") or {}).get("id")
+        ]
+
+    async def _deactivate_missing_listings(self, shop: str, seen_listing_ids: set) -> int:
+        """Mark active listings absent from a full sync inactive."""
+        deactivated = 0
+        active = repository.stream(
+            SHOPIFY_LISTINGS, [("store_id", "==", shop), ("status", "==", "active")]
+        )
+        async for listing in active:
+            if listing["id"] in seen_listing_ids:
+                continue
+            await repository.update_doc(
+                SHOPIFY_LISTINGS,
+                listing["id"],
+                {"status": "inactive", "content_hash": None, "updated_at": datetime.utcnow()},
+            )
+            await self.deal_service.observe_listing(
+                listing.get("product_id"), listing["id"], None, False, {}
+            )
+            deactivated += 1
+        if deactivated:
+            logger.info("Deactivated %s vanished listings for %s", deactivated, shop)
+        return deactivated
+
+    # ------------------------------------------------------------------
+    # Inventory item lookup
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _inventory_key(shop: str, inventory_item_id: str) -> str:
+        return f"{shop}_{inventory_item_id}"
+
+    def _cache_inventory(self, key: str, listing_ids: List[str]):
+        self._inventory_index[key] = listing_ids
+        self._inventory_index.move_to_end(key)
+        if len(self._inventory_index) > self.inventory_cache_size:
+            self._inventory_index.popitem(last=False)
+
+    async def _index_inventory_item(self, shop: str, inventory_item_id: str, listing_id: str):
+        """Map (shop, inventory_item_id) to its listing; written only when it changes."""
+        key = self._inventory_key(shop, inventory_item_id)
+        if self._inventory_index.get(key) == [listing_id]:
+            self._inventory_index.move_to_end(key)
+            return
+        await repository.set_doc(
+            INVENTORY_ITEM_INDEX,
+            key,
+            {
+                "store_id": shop,
+                "inventory_item_id": inventory_item_id,
+                "listing_ids": [listing_id],
+                "updated_at": datetime.utcnow(),
+            },
+        )
+        self._cache_inventory(key, [listing_id])
+
+    async def _get_inventory_listings(self, shop: str, inventory_item_id: str) -> List[str]:
+        key = self._inventory_key(shop, inventory_item_id)
+        cached = self._inventory_index.get(key)
+        if cached is not None:
+            self._inventory_index.move_to_end(key)
+            return cached
+
+        index = await repository.get_doc(INVENTORY_ITEM_INDEX, key)
+        if index is not None:
+            listing_ids = index.get("listing_ids") or []
+            self._cache_inventory(key, listing_ids)
+            return listing_ids
+
+        # Listings synced before the index existed: query once, then backfill
+        listings = await repository.query(
+            SHOPIFY_LISTINGS,
+            [("store_id", "==", shop), ("inventory_item_id", "==", inventory_item_id)],
+        )
+        listing_ids = [listing["id"] for listing in listings]
+        if listing_ids:
+            await repository.set_doc(
+                INVENTORY_ITEM_INDEX,
+                key,
+                {
+                    "store_id": shop,
+                    "inventory_item_id": inventory_item_id,
+                    "listing_ids": listing_ids,
+                    "updated_at": datetime.utcnow(),
+                },
+            )
+            self._cache_inventory(key, listing_ids)
+        return listing_ids
 
     # ------------------------------------------------------------------
     # Classification
@@ -579,6 +909,15 @@ class ShopifyService:
     # ------------------------------------------------------------------
     # Utilities
     # ------------------------------------------------------------------
+    def shop_url(self, shop: str, path: str) -> str:
+        """URL on the shop's domain, or on SHOPIFY_API_BASE_URL when set."""
+        if self.api_base_url:
+            return f"{self.api_base_url}/{shop}/{path}"
+        return f"https://{shop}/{path}"
+
+    def admin_api_url(self, shop: str, path: str) -> str:
+        return self.shop_url(shop, f"admin/api/{self.api_version}/{path}")
+
     def _rest_headers(self, token: str) -> Dict[str, str]:
         return {
             "X-Shopify-Access-Token": token,
@@ -599,3 +938,8 @@ class ShopifyService:
         if gid.isdigit():
             return gid
         return gid.split("/")[-1]
+
+
+async def _empty():
+    return
+    yield
@@ -0,0 +1,105 @@
+"""
+Non-blocking access to the synchronous Stripe SDK.
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+import stripe
+
+from metrics import INTEGRATION_DURATION, INTEGRATION_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+
+class StripeClient:
+    """Run Stripe SDK calls on a bounded thread pool with per-call timeouts.
+
+    A call that exceeds its timeout raises `stripe.error.APIConnectionError`,
+    so existing `StripeError` handlers cover it. The worker thread keeps going
+    until the SDK's own HTTP timeout, which is set to the same value.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, timeout: Optional[float] = None):
+        self.max_workers = max_workers or int(os.getenv("STRIPE_MAX_WORKERS", "8"))
+        self.timeout = timeout or float(os.getenv("STRIPE_CALL_TIMEOUT_SECONDS", "20"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="stripe"
+        )
+        self._in_flight = 0
+        self._calls: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"calls": 0, "errors": 0, "timeouts": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+        )
+        if os.getenv("STRIPE_API_BASE"):
+            # e.g. http://localhost:9100/stripe to run against the fake servers in `fakes`
+            stripe.api_base = os.getenv("STRIPE_API_BASE").rstrip("/")
+        if stripe.default_http_client is None:
+            stripe.default_http_client = stripe.http_client.new_default_http_client(
+                timeout=self.timeout
+            )
+
+    async def call(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+        """Run `fn(*args, **kwargs)` off the event loop, e.g. `call(stripe.Refund.create, ...)`."""
+        name = self._call_name(fn)
+        stats = self._calls[name]
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self._in_flight += 1
+        INTEGRATION_IN_FLIGHT.labels("stripe").inc()
+        outcome = "error"
+        try:
+            future = loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+            result = await asyncio.wait_for(future, timeout or self.timeout)
+            outcome = "ok"
+            return result
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            logger.warning("Stripe %s timed out after %.1fs", name, timeout or self.timeout)
+            raise stripe.error.APIConnectionError(f"Stripe {name} timed out")
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            elapsed = time.perf_counter() - started
+            INTEGRATION_IN_FLIGHT.labels("stripe").dec()
+            INTEGRATION_DURATION.labels("stripe", name, outcome).observe(elapsed)
+            stats["calls"] += 1
+            stats["total_seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "in_flight": self._in_flight,
+            "timeout_seconds": self.timeout,
+            "calls": {
+                name: {
+                    "calls": int(s["calls"]),
+                    "errors": int(s["errors"]),
+                    "timeouts": int(s["timeouts"]),
+                    "avg_ms": round(s["total_seconds"] / s["calls"] * 1000, 1) if s["calls"] else 0.0,
+                    "max_ms": round(s["max_seconds"] * 1000, 1),
+                }
+                for name, s in self._calls.items()
+            },
+        }
+
+    @staticmethod
+    def _call_name(fn: Callable[..., Any]) -> str:
+        owner = getattr(fn, "__self__", None)
+        if isinstance(owner, type):
+            return f"{getattr(owner, 'OBJECT_NAME', owner.__name__)}.{fn.__name__}"
+        return getattr(fn, "__qualname__", repr(fn))
+
+
+@lru_cache(maxsize=1)
+def get_stripe_client() -> StripeClient:
+    """Shared pool so every Stripe caller is bounded by the same worker limit."""
+    return StripeClient()
@@ -1,6 +1,7 @@
 """
 Stripe integration service for payments and payouts
 """
+import asyncio
 import json
 import logging
 import os
@@ -12,8 +13,10 @@ from uuid import uuid4
 
 import stripe
 
+import repository
+from stripe_client import get_stripe_client
+from user_cache import get_user_cache
 from database import (
-    db,
     SHOPIFY_LISTINGS,
     STORES,
     PRODUCTS,
@@ -29,6 +32,7 @@ class StripeService:
 
     def __init__(self):
         stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+        self.stripe_client = get_stripe_client()
         self.frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
         self.sealed_categories = {
             "pokemon",
@@ -70,7 +74,8 @@ class StripeService:
         profile_url = business_url or f"https://{shop}"
 
         try:
-            account = stripe.Account.create(
+            account = await self.stripe_client.call(
+                stripe.Account.create,
                 type="express",
                 country="CA",
                 email=email,
@@ -126,7 +131,8 @@ class StripeService:
     ) -> Optional[str]:
         """Generate onboarding link for vendor Connect account"""
         try:
-            link = stripe.AccountLink.create(
+            link = await self.stripe_client.call(
+                stripe.AccountLink.create,
                 account=account_id,
                 refresh_url=refresh_url or f"{self.frontend_url}/vendor/connect/retry",
                 return_url=return_url or f"{self.frontend_url}/vendor/dashboard",
@@ -139,18 +145,19 @@ class StripeService:
 
     async def ensure_platform_customer(self, user_id: str, email: str) -> str:
         """Create or re-use a platform Stripe Customer for registered users"""
-        user_ref = db.collection(USERS).document(user_id)
-        doc = user_ref.get()
-        user_data = doc.to_dict() if doc.exists else {}
+        user_data = await repository.get_doc(USERS, user_id) or {}
         customer_id = user_data.get("stripe_customer_id")
 
         if not customer_id:
-            customer = stripe.Customer.create(
+            customer = await self.stripe_client.call(
+                stripe.Customer.create,
                 email=email,
                 metadata={"user_id": user_id, "type": "buyer"},
             )
             customer_id = customer.id
-            user_ref.set(
+            await repository.set_doc(
+                USERS,
+                user_id,
                 {
                     "email": email,
                     "stripe_customer_id": customer_id,
@@ -161,8 +168,11 @@ class StripeService:
             )
         else:
             if email and user_data.get("email") != email:
-                stripe.Customer.modify(customer_id, email=email)
-                user_ref.update({"email": email, "updated_at": datetime.utcnow()})
+                await self.stripe_client.call(stripe.Customer.modify, customer_id, email=email)
+                await repository.update_doc(
+                    USERS, user_id, {"email": email, "updated_at": datetime.utcnow()}
+                )
+                get_user_cache().invalidate(user_id)
 
         return customer_id
 
@@ -173,7 +183,8 @@ class StripeService:
     ) -> Dict[str, str]:
         """Create SetupIntent so registered users can save payment methods"""
         customer_id = await self.ensure_platform_customer(user_id, email)
-        setup_intent = stripe.SetupIntent.create(
+        setup_intent = await self.stripe_client.call(
+            stripe.SetupIntent.create,
             customer=customer_id,
             payment_method_types=["card"],
             usage="off_session",
@@ -204,6 +215,8 @@ class StripeService:
         platform_commission_total = Decimal("0")
         order_gross_total = Decimal("0")
 
+        listings, stores, products = await self._load_checkout_docs(items)
+
         for item in items:
             listing_id = item.get("listing_id")
             product_id = item.get("product_id")
@@ -211,29 +224,24 @@ class StripeService:
             if not listing_id or not product_id:
                 continue
 
-            listing_doc = (
-                db.collection(SHOPIFY_LISTINGS).document(listing_id).get()
-            )
-            if not listing_doc.exists:
+            listing = listings.get(listing_id)
+            if listing is None:
                 continue
-            listing = listing_doc.to_dict()
 
             store_id = item.get("store_id") or listing.get("store_id")
             if not store_id:
                 continue
 
-            store_doc = db.collection(STORES).document(store_id).get()
-            if not store_doc.exists:
+            store = stores.get(store_id)
+            if store is None:
                 continue
-            store = store_doc.to_dict()
             stripe_account_id = store.get("stripe_account_id")
             if not stripe_account_id:
                 raise RuntimeError(f"Store {store_id} is missing Stripe Connect details")
 
-            product_doc = db.collection(PRODUCTS).document(product_id).get()
-            if not product_doc.exists:
+            product = products.get(product_id)
+            if product is None:
                 continue
-            product = product_doc.to_dict()
 
             unit_price = self._to_decimal(listing.get("price"))
             product_total = unit_price * Decimal(quantity)
@@ -337,31 +345,48 @@ class StripeService:
         else:
             checkout_payload["customer_email"] = customer_email
 
-        session = stripe.checkout.Session.create(**checkout_payload)
+        session = await self.stripe_client.call(stripe.checkout.Session.create, **checkout_payload)
         return session
 
-    async def process_commission(
+    async def _load_checkout_docs(
+        self, items: List[Dict[str, Any]]
+    ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """Fetch every listing, store and product in the cart with one batched read each."""
+        lines = [item for item in items if item.get("listing_id") and item.get("product_id")]
+        listings, products = await asyncio.gather(
+            repository.get_many(SHOPIFY_LISTINGS, [item["listing_id"] for item in lines]),
+            repository.get_many(PRODUCTS, [item["product_id"] for item in lines]),
+        )
+        store_ids = [
+            item.get("store_id") or listings[item["listing_id"]].get("store_id")
+            for item in lines
+            if item["listing_id"] in listings
+        ]
+        stores = await repository.get_many(STORES, store_ids)
+        return listings, stores, products
+
+    def build_payouts(
         self,
         order_id: str,
         metadata: Dict[str, Any],
-        payment_intent: Optional[stripe.PaymentIntent]
-    ):
+        payment_intent: Optional[stripe.PaymentIntent],
+    ) -> List[Dict[str, Any]]:
         """
-        Calculate and record commissions based on vendor tiers
+        Per-vendor payout placeholders for an order.
+
+        Each payout has a deterministic `id` ({order_id}_{store_id}) so it can
+        be written in the same batch as the order and retried safely.
         """
-        # Logic to fetch vendor tier and apply dynamic rate
-        # This is a simplified placeholder for the complex logic
-        pass
         items_raw = metadata.get("items")
         if not items_raw:
             logger.warning("Stripe metadata missing items for order %s", order_id)
-            return
+            return []
 
         try:
             items = json.loads(items_raw)
         except json.JSONDecodeError:
             logger.error("Invalid Stripe metadata JSON for order %s", order_id)
-            return
+            return []
 
         vendor_totals: Dict[str, Dict[str, Any]] = defaultdict(
             lambda: {
@@ -398,6 +423,7 @@ class StripeService:
             payment_intent, order_gross_total
         )
 
+        payouts = []
         for store_id, vendor in vendor_totals.items():
             gross = vendor["product_total"] + vendor["shipping_total"]
             if gross <= 0:
@@ -415,43 +441,137 @@ class StripeService:
                 )
                 continue
 
-            transfer_id = await self.transfer_to_vendor(
-                vendor.get("stripe_account_id"),
-                vendor_payout,
-                metadata.get("transfer_group") or order_id,
+            payouts.append(
+                {
+                    "id": f"{order_id}_{store_id}",
+                    "store_id": store_id,
+                    "order_id": order_id,
+                    "amount": float(gross),
+                    "commission_amount": float(vendor["platform_commission"]),
+                    "stripe_fee": float(fee_share),
+                    "net_payout": float(vendor_payout),
+                    "stripe_account_id": vendor.get("stripe_account_id"),
+                    "transfer_group": metadata.get("transfer_group") or order_id,
+                    "status": "awaiting_transfer",
+                    "stripe_transfer_id": None,
+                    "created_at": datetime.utcnow(),
+                }
             )
+        return payouts
 
-            payout_data = {
-                "store_id": store_id,
-                "order_id": order_id,
-                "amount": float(gross),
-                "commission_amount": float(vendor["platform_commission"]),
-                "stripe_fee": float(fee_share),
-                "net_payout": float(vendor_payout),
-                "status": "processing" if transfer_id else "pending",
+    def stage_payouts(self, batch: repository.Batch, payouts: List[Dict[str, Any]]):
+        """Add payout placeholders to a write batch."""
+        for payout in payouts:
+            data = {key: value for key, value in payout.items() if key != "id"}
+            batch.set(SELLER_PAYOUTS, payout["id"], data)
+
+    async def process_commission(
+        self,
+        order_id: str,
+        metadata: Dict[str, Any],
+        payment_intent: Optional[stripe.PaymentIntent],
+        payouts: Optional[List[Dict[str, Any]]] = None,
+    ):
+        """
+        Transfer each vendor's share of an order and record the outcome.
+
+        `payouts` are the placeholders already written with the order. When
+        omitted they are loaded from Firestore (or created for orders recorded
+        without them), and only those still awaiting a transfer are retried.
+        A failed transfer stays awaiting transfer with its error and attempt
+        count recorded, and the call then raises so the webhook queue retries
+        the job with backoff. Transfers run concurrently with per-payout
+        idempotency keys, so a retry never pays a vendor twice.
+        """
+        if payouts is None:
+            existing = await repository.query(SELLER_PAYOUTS, [("order_id", "==", order_id)])
+            if existing:
+                payouts = [p for p in existing if p.get("status") == "awaiting_transfer"]
+            else:
+                payouts = self.build_payouts(order_id, metadata, payment_intent)
+                batch = repository.batch()
+                self.stage_payouts(batch, payouts)
+                await batch.commit()
+        if not payouts:
+            return
+
+        outcomes = await asyncio.gather(
+            *(
+                self._transfer_payout(payout, payout.get("transfer_group") or order_id)
+                for payout in payouts
+            )
+        )
+
+        batch = repository.batch()
+        for payout, (transfer_id, error) in zip(payouts, outcomes):
+            update = {
                 "stripe_transfer_id": transfer_id,
-                "created_at": datetime.utcnow(),
+                "transfer_attempts": int(payout.get("transfer_attempts") or 0) + 1,
+                "updated_at": datetime.utcnow(),
             }
-            db.collection(SELLER_PAYOUTS).document().set(payout_data)
+            if transfer_id:
+                update.update(status="processing", last_transfer_error=None)
+            else:
+                # Left awaiting transfer so the retried job re-issues it under the same key
+                update.update(status="awaiting_transfer", last_transfer_error=error)
+            batch.update(SELLER_PAYOUTS, payout["id"], update)
+        await batch.commit()
+
+        failed = [payout["id"] for payout, (transfer_id, _) in zip(payouts, outcomes) if not transfer_id]
+        if failed:
+            raise RuntimeError(f"Vendor transfers still awaiting retry: {', '.join(failed)}")
+
+    async def _transfer_payout(
+        self, payout: Dict[str, Any], transfer_group: str
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """Transfer one payout; returns (transfer id, None) or (None, error)."""
+        stripe_account_id = payout.get("stripe_account_id")
+        amount = self._to_decimal(payout.get("net_payout"))
+        if not stripe_account_id:
+            return None, "Vendor has no connected Stripe account"
+        if amount <= 0:
+            return None, "Net payout is not positive"
+        try:
+            transfer_id = await self._create_transfer(
+                stripe_account_id, amount, transfer_group, f"payout-{payout['id']}"
+            )
+        except stripe.error.StripeError as exc:
+            logger.error("Stripe transfer error to %s: %s", stripe_account_id, exc)
+            return None, str(exc) or type(exc).__name__
+        return transfer_id, None
+
+    async def _create_transfer(
+        self,
+        stripe_account_id: str,
+        amount: Decimal,
+        transfer_group: str,
+        idempotency_key: Optional[str],
+    ) -> str:
+        transfer = await self.stripe_client.call(
+            stripe.Transfer.create,
+            amount=self._decimal_to_cents(amount),
+            currency="cad",
+            destination=stripe_account_id,
+            transfer_group=transfer_group,
+            idempotency_key=idempotency_key,
+        )
+        return transfer.id
 
     async def transfer_to_vendor(
         self,
         stripe_account_id: Optional[str],
         amount: Decimal,
         transfer_group: str,
+        idempotency_key: Optional[str] = None,
     ) -> Optional[str]:
         """Transfer funds to vendor via Stripe Connect"""
         if not stripe_account_id or amount <= 0:
             return None
 
         try:
-            transfer = stripe.Transfer.create(
-                amount=self._decimal_to_cents(amount),
-                currency="cad",
-                destination=stripe_account_id,
-                transfer_group=transfer_group,
+            return await self._create_transfer(
+                stripe_account_id, amount, transfer_group, idempotency_key
             )
-            return transfer.id
         except stripe.error.StripeError as exc:
             logger.error(
                 "Stripe transfer error to %s: %s", stripe_account_id, exc
@@ -466,21 +586,22 @@ class StripeService:
         """Process refund for returned items"""
         try:
             refund_amount = sum(item["total_price"] for item in items)
-            refund = stripe.Refund.create(
+            refund = await self.stripe_client.call(
+                stripe.Refund.create,
                 payment_intent=payment_intent_id,
                 amount=self._decimal_to_cents(Decimal(refund_amount)),
             )
 
             order_ids = {item.get("order_id") for item in items if item.get("order_id")}
             for order_id in order_ids:
-                payout_docs = (
-                    db.collection(SELLER_PAYOUTS)
-                    .where("order_id", "==", order_id)
-                    .stream()
+                payouts = await repository.query(
+                    SELLER_PAYOUTS, [("order_id", "==", order_id)]
                 )
-                for doc in payout_docs:
-                    doc.reference.update(
-                        {"status": "reversed", "reversed_at": datetime.utcnow()}
+                for payout in payouts:
+                    await repository.update_doc(
+                        SELLER_PAYOUTS,
+                        payout["id"],
+                        {"status": "reversed", "reversed_at": datetime.utcnow()},
                     )
 
             return refund.id
@@ -504,13 +625,15 @@ class StripeService:
 
         billing_customer_id = store.get("stripe_billing_customer_id")
         if not billing_customer_id:
-            customer = stripe.Customer.create(
+            customer = await self.stripe_client.call(
+                stripe.Customer.create,
                 email=contact_email,
                 metadata={"store_id": store_id, "type": "vendor_billing"},
             )
             billing_customer_id = customer.id
 
-        session = stripe.checkout.Session.create(
+        session = await self.stripe_client.call(
+            stripe.checkout.Session.create,
             customer=billing_customer_id,
             mode="subscription",
             line_items=[{"price": price_id, "quantity": 1}],
@@ -541,7 +664,8 @@ class StripeService:
         if not billing_customer_id:
             raise RuntimeError("Vendor is not subscribed yet")
 
-        session = stripe.billing_portal.Session.create(
+        session = await self.stripe_client.call(
+            stripe.billing_portal.Session.create,
             customer=billing_customer_id,
             return_url=return_url or f"{self.frontend_url}/vendor/dashboard",
         )
@@ -0,0 +1,198 @@
+"""
+Shopify sync orchestration: bounded concurrency, one sync per shop, nightly runs.
+
+Every worker process runs the nightly loop, so a sync first takes the shop's
+lease document in `syncLeases`. The lease is created atomically, renewed
+while the sync runs and taken over only once it has expired, using
+update-time preconditions, so two workers can never both hold it.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+import repository
+from database import STORES, SYNC_LEASES
+from shopify_service import ShopifyService
+
+logger = logging.getLogger(__name__)
+
+
+class SyncOrchestrator:
+    """Schedule `ShopifyService.sync_products` runs on a global worker pool."""
+
+    def __init__(self, shopify_service: ShopifyService):
+        self.shopify_service = shopify_service
+        self.max_concurrency = int(os.getenv("SHOPIFY_SYNC_CONCURRENCY", "4"))
+        self.lease_seconds = int(os.getenv("SHOPIFY_SYNC_LEASE_SECONDS", "300"))
+        self.nightly_hour_utc = int(os.getenv("SHOPIFY_NIGHTLY_SYNC_HOUR_UTC", "7"))
+        self.nightly_window = int(os.getenv("SHOPIFY_NIGHTLY_SYNC_WINDOW_SECONDS", "14400"))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._running: set = set()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def schedule(self, shop: str, mode: str = "auto") -> bool:
+        """Queue a sync for `shop`; returns False if one is already queued or running."""
+        task = self._tasks.get(shop)
+        if task and not task.done():
+            return False
+        self._tasks[shop] = asyncio.create_task(self._run(shop, mode))
+        return True
+
+    async def status(self, shop: str) -> Optional[Dict[str, Any]]:
+        store = await repository.get_doc(STORES, shop)
+        if store is None:
+            return None
+        task = self._tasks.get(shop)
+        if shop in self._running:
+            state = "running"
+        elif task and not task.done():
+            state = "queued"
+        else:
+            state = store.get("sync_status") or "idle"
+        return {
+            "shop": shop,
+            "status": state,
+            "processed": store.get("sync_processed", 0),
+            "total_products": store.get("total_products", 0),
+            "bulk_operation_id": store.get("bulk_operation_id"),
+            "started_at": store.get("sync_started_at"),
+            "heartbeat_at": store.get("sync_heartbeat_at"),
+            "mode": store.get("sync_mode"),
+            "last_sync_at": store.get("last_sync_at"),
+            "last_full_sync_at": store.get("last_full_sync_at"),
+            "watermark": store.get("sync_watermark"),
+            "last_sync_stats": store.get("last_sync_stats"),
+            "error": store.get("sync_error"),
+        }
+
+    async def sync_all_active(self, window_seconds: Optional[float] = None) -> Dict[str, int]:
+        """Sync every active store, giving up on whatever is unfinished after the window.
+
+        Interrupted syncs keep their bulk operation and checkpoint on the store
+        doc, so the next run resumes them.
+        """
+        window = window_seconds or self.nightly_window
+        shops = [doc["id"] async for doc in repository.stream(STORES, [("status", "==", "active")])]
+
+        for shop in shops:
+            self.schedule(shop)
+        tasks = [self._tasks[shop] for shop in shops if shop in self._tasks]
+        if not tasks:
+            return {"stores": 0, "completed": 0, "interrupted": 0}
+
+        started = time.monotonic()
+        done, pending = await asyncio.wait(tasks, timeout=window)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        summary = {"stores": len(shops), "completed": len(done), "interrupted": len(pending)}
+        logger.info(
+            "Nightly Shopify sync finished in %.0fs: %s", time.monotonic() - started, summary
+        )
+        return summary
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    async def _run(self, shop: str, mode: str = "auto") -> int:
+        # Scheduled from a request: the sync outlives it and must not see its cached reads
+        with repository.no_read_scope():
+            return await self._sync(shop, mode)
+
+    async def _sync(self, shop: str, mode: str) -> int:
+        async with self._semaphore:
+            lease = {"token": await self._acquire_lease(shop), "lost": False}
+            if lease["token"] is None:
+                # The holder owns sync_status too; leave it alone
+                logger.info("Skipping sync for %s: another worker holds the lease", shop)
+                return 0
+            renewal = asyncio.create_task(self._renew_lease(shop, lease))
+            self._running.add(shop)
+            try:
+                return await self.shopify_service.sync_products(shop, mode)
+            except asyncio.CancelledError:
+                if not lease["lost"]:
+                    await repository.update_doc(STORES, shop, {"sync_status": "interrupted"})
+                raise
+            except Exception as exc:
+                logger.exception("Shopify sync failed for %s: %s", shop, exc)
+                if not lease["lost"]:
+                    await repository.update_doc(
+                        STORES, shop, {"sync_status": "failed", "sync_error": str(exc)[:500]}
+                    )
+                return 0
+            finally:
+                self._running.discard(shop)
+                renewal.cancel()
+                if not lease["lost"]:
+                    await repository.delete_if_unchanged(SYNC_LEASES, shop, lease["token"])
+
+    def _lease_data(self) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        return {
+            "owner": self.owner,
+            "renewed_at": now,
+            "expires_at": now + timedelta(seconds=self.lease_seconds),
+        }
+
+    async def _acquire_lease(self, shop: str) -> Any:
+        """Take the shop's sync lease; returns its update time, or None if it is held."""
+        token = await repository.create_doc(SYNC_LEASES, shop, self._lease_data())
+        if token is not None:
+            return token
+        current, update_time = await repository.get_versioned(SYNC_LEASES, shop)
+        if current is None:
+            # Released in between
+            return await repository.create_doc(SYNC_LEASES, shop, self._lease_data())
+        expires_at = current.get("expires_at")
+        if isinstance(expires_at, datetime) and expires_at.replace(tzinfo=None) > datetime.utcnow():
+            return None
+        # The holder died without releasing it; only one taker wins the precondition
+        return await repository.update_if_unchanged(
+            SYNC_LEASES, shop, self._lease_data(), update_time
+        )
+
+    async def _renew_lease(self, shop: str, lease: Dict[str, Any]):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                token = await repository.update_if_unchanged(
+                    SYNC_LEASES, shop, self._lease_data(), lease["token"]
+                )
+            except Exception as exc:
+                logger.warning("Could not renew the sync lease for %s: %s", shop, exc)
+                continue
+            if token is None:
+                lease["lost"] = True
+                logger.warning("Lost the sync lease for %s to another worker", shop)
+                return
+            lease["token"] = token
+
+    def seconds_until_nightly_run(self, now: Optional[datetime] = None) -> float:
+        now = now or datetime.utcnow()
+        next_run = now.replace(hour=self.nightly_hour_utc, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+
+async def nightly_sync_loop(orchestrator: SyncOrchestrator):
+    """Background cron loop that syncs all active Shopify stores once a day."""
+    while True:
+        await asyncio.sleep(orchestrator.seconds_until_nightly_run())
+        try:
+            await orchestrator.sync_all_active()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.exception("Nightly Shopify sync error: %s", exc)
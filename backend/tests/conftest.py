@@ -1,4 +1,6 @@
 import pytest
+import pytest_asyncio
+from contextlib import contextmanager
 from httpx import AsyncClient
 from unittest.mock import MagicMock, AsyncMock
 import sys
@@ -8,6 +10,7 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from app.main import app, get_db
+from db_instrumentation import track_db_ops
 
 @pytest.fixture
 def mock_firestore():
@@ -27,7 +30,7 @@ def mock_firestore():
     
     return mock_client
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def client(mock_firestore):
     # Override the dependency
     app.dependency_overrides[get_db] = lambda: mock_firestore
@@ -37,3 +40,30 @@ async def client(mock_firestore):
     
     # Clean up
     app.dependency_overrides = {}
+
+@pytest.fixture
+def mock_db(monkeypatch):
+    """Fresh in-memory Firestore behind `database.db` for service-level tests."""
+    import database
+
+    database._mock_db_data.clear()
+    database._mock_update_times.clear()
+    monkeypatch.setattr(database, "_db_client", database.MockFirestoreClient())
+    yield database._mock_db_data
+    database._mock_db_data.clear()
+    database._mock_update_times.clear()
+
+
+@pytest.fixture
+def db_budget():
+    """`with db_budget(reads=1, queries=2): ...` fails if the block uses more Firestore ops."""
+
+    @contextmanager
+    def budget(**limits):
+        with track_db_ops() as ops:
+            yield ops
+        used = ops.as_dict()
+        over = {op: f"{used[op]} > {limit}" for op, limit in limits.items() if used[op] > limit}
+        assert not over, f"Firestore op budget exceeded: {over} (used {used})"
+
+    return budget
@@ -0,0 +1,48 @@
+import json
+import logging
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+from middleware.audit import AuditMiddleware
+
+
+class RecordingAnalytics:
+    def __init__(self):
+        self.events = []
+
+    async def log_event(self, dataset, table, entry):
+        self.events.append((dataset, table, entry))
+
+
+@pytest.mark.asyncio
+async def test_access_log_and_audit_capture(caplog):
+    analytics = RecordingAnalytics()
+    app = FastAPI()
+    app.add_middleware(AuditMiddleware, analytics=analytics)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.post("/api/admin/thing")
+    async def admin_thing():
+        return {"ok": True}
+
+    with caplog.at_level(logging.INFO, logger="middleware.audit"):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            assert (await ac.get("/ping")).status_code == 200
+            assert (await ac.post("/api/admin/thing", headers={"Authorization": "Bearer x"})).status_code == 200
+            assert (await ac.get("/missing")).status_code == 404
+
+    access = [json.loads(r.message) for r in caplog.records if r.message.startswith("{")]
+    assert [(a["method"], a["path"], a["status_code"]) for a in access] == [
+        ("GET", "/ping", 200),
+        ("POST", "/api/admin/thing", 200),
+        ("GET", "/missing", 404),
+    ]
+    assert all(a["duration"] >= 0 for a in access)
+    assert len(analytics.events) == 1
+    assert analytics.events[0][2]["path"] == "/api/admin/thing"
+    assert analytics.events[0][2]["user_id"] == "authenticated_user"
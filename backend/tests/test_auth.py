@@ -1,4 +1,6 @@
 import pytest
+from unittest.mock import MagicMock
+
 from httpx import AsyncClient
 
 @pytest.mark.asyncio
@@ -15,3 +17,29 @@ async def test_protected_route_without_token(client: AsyncClient):
     # For now, we expect 404 because the route isn't there, 
     # but once implemented it should be 401
     assert response.status_code in [401, 404]
+
+@pytest.mark.asyncio
+async def test_current_user_is_cached_until_invalidated(client: AsyncClient, mock_firestore):
+    from security import create_access_token
+    from user_cache import get_user_cache
+
+    cache = get_user_cache()
+    cache.clear()
+    # collection() is synchronous on the real client
+    mock_firestore.collection = MagicMock(return_value=mock_firestore.collection.return_value)
+    doc = mock_firestore.collection.return_value.document.return_value
+    snapshot = doc.get.return_value
+    snapshot.id = "u1"
+    snapshot.to_dict.return_value = {"email": "buyer@example.com", "hashed_password": "x"}
+    headers = {"Authorization": f"Bearer {create_access_token('buyer@example.com', user_id='u1')}"}
+
+    for _ in range(2):
+        response = await client.get("/api/users/me", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["id"] == "u1"
+    assert doc.get.await_count == 1
+
+    cache.invalidate("u1")
+    await client.get("/api/users/me", headers=headers)
+    assert doc.get.await_count == 2
+    cache.clear()
@@ -0,0 +1,90 @@
+import os
+import sys
+
+import pytest
+from httpx import AsyncClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import harness  # noqa: E402
+from app.main import app, dedupe_products, get_current_user, shippo_service  # noqa: E402
+from models import User  # noqa: E402
+
+
+def _results(**medians):
+    return {
+        "benchmarks": {
+            name: {"median": value, "min": value, "mean": value, "p95": value, "tolerance": 0.15}
+            for name, value in medians.items()
+        }
+    }
+
+
+def test_compare_flags_slowdowns_beyond_tolerance():
+    baseline = _results(**{"micro.a": 1.0, "micro.b": 1.0, "micro.gone": 1.0})
+    current = _results(**{"micro.a": 1.1, "micro.b": 1.3, "micro.new": 1.0})
+
+    rows, regressions = harness.compare(baseline, current)
+
+    assert regressions == ["micro.b"]
+    status = {row["name"]: row["status"] for row in rows}
+    assert status == {"micro.a": "ok", "micro.b": "REGRESSION", "micro.gone": "missing", "micro.new": "new"}
+
+
+def test_compare_max_regression_overrides_tolerance():
+    baseline, current = _results(**{"micro.a": 1.0}), _results(**{"micro.a": 1.1})
+    assert harness.compare(baseline, current, max_regression=0.05)[1] == ["micro.a"]
+    assert harness.compare(baseline, current, max_regression=0.5)[1] == []
+
+
+def test_compare_gates_on_the_baseline_p95():
+    baseline = _results(**{"micro.noisy": 1.0, "micro.steady": 1.0})
+    baseline["benchmarks"]["micro.noisy"]["p95"] = 1.2
+    current = _results(**{"micro.noisy": 1.3, "micro.steady": 1.3})
+
+    rows, regressions = harness.compare(baseline, current)
+
+    # 30% over the median but within 15% of a baseline round
+    assert regressions == ["micro.steady"]
+    assert rows[0]["change"] == pytest.approx(0.3) and rows[0]["status"] == "ok"
+
+
+def test_measure_reports_one_sample_per_round():
+    calls = []
+    samples = harness.measure(lambda: calls.append(1), number=3, rounds=4)
+    assert len(samples) == 4
+    assert len(calls) == 3 * 5  # warm-up round included
+    assert harness.summarize(samples)["min"] <= harness.summarize(samples)["median"]
+
+
+def test_dedupe_products_keeps_cheapest_in_stock_entry():
+    products = [
+        {"id": "a", "name": "Pokemon TCG: 151 Booster Box", "best_price": 150.0, "in_stock": True},
+        {"id": "b", "name": "POKEMON TCG - 151  Booster Box", "best_price": 140.0, "in_stock": True},
+        {"id": "c", "name": "Other", "upc": "1", "best_price": 10.0, "in_stock": False},
+        {"id": "d", "name": "Other renamed", "upc": "1", "best_price": 20.0, "in_stock": True},
+    ]
+    assert [p["id"] for p in dedupe_products(products)] == ["b", "d"]
+
+
+@pytest.mark.asyncio
+async def test_cart_optimize_accepts_shipping_address_model(mock_db, monkeypatch):
+    monkeypatch.setattr(shippo_service, "api_token", None)
+    mock_db["shopifyListings"] = {
+        "l1": {"product_id": "p1", "status": "active", "store_id": "shop", "store_name": "Shop",
+               "price": 10.0, "quantity": 2},
+    }
+    mock_db["affiliateProducts"] = {}
+    app.dependency_overrides[get_current_user] = lambda: User(id="u1", email="u@example.com", hashed_password="-")
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/api/cart/optimize", json={
+                "items": [{"product_id": "p1", "quantity": 1}],
+                "shipping_address": {"name": "A", "street": "1 St", "city": "Victoria", "province": "BC",
+                                     "postal_code": "V8W 1A1"},
+            })
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+
+    assert response.status_code == 200
+    assert response.json()["total_amount"] == pytest.approx(10.0 + 11.0 * 1.3)
@@ -0,0 +1,97 @@
+import pytest
+from httpx import AsyncClient
+
+import repository
+from app import main
+from catalog_cache import CatalogETags
+from db_instrumentation import add_write_listener, remove_write_listener
+
+
+@pytest.fixture
+def etags(monkeypatch):
+    fresh = CatalogETags(ttl_seconds=60)
+    monkeypatch.setattr(main, "get_catalog_etags", lambda: fresh)
+    add_write_listener(fresh.on_write)
+    yield fresh
+    remove_write_listener(fresh.on_write)
+
+
+def _seed(mock_db):
+    mock_db["products"] = {"p1": {"name": "Box 1", "category": "Pokemon"}, "p2": {"name": "Box 2", "category": "Pokemon"}}
+    mock_db["shopifyListings"] = {
+        "l1": {"product_id": "p1", "status": "active", "store_id": "shop", "store_name": "Shop", "price": 10.0, "quantity": 3},
+        "l2": {"product_id": "p2", "status": "active", "store_id": "shop", "store_name": "Shop", "price": 20.0, "quantity": 1},
+    }
+    mock_db["affiliateProducts"] = {}
+
+
+@pytest.mark.asyncio
+async def test_product_detail_revalidates_without_firestore_io(mock_db, db_budget, etags):
+    _seed(mock_db)
+    async with AsyncClient(app=main.app, base_url="http://test") as client:
+        first = await client.get("/api/products/p1")
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"].startswith("public, max-age=")
+        assert "stale-while-revalidate" in first.headers["cache-control"]
+
+        with db_budget(reads=0, queries=0):
+            cached = await client.get("/api/products/p1", headers={"If-None-Match": f'W/{etag}, "other"'})
+        assert cached.status_code == 304
+        assert cached.headers["etag"] == etag and cached.content == b""
+
+        # A price change from a sync or webhook bumps the product's version
+        await repository.update_doc("shopifyListings", "l1", {"price": 9.0, "content_hash": None})
+        changed = await client.get("/api/products/p1", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+        assert changed.json()["best_price"] == 9.0
+
+        # Unrelated products keep their versions
+        other = await client.get("/api/products/p2")
+        await repository.set_doc("shopifyListings", "l1", {**mock_db["shopifyListings"]["l1"], "quantity": 0})
+        with db_budget(reads=0, queries=0):
+            assert (await client.get("/api/products/p2", headers={"If-None-Match": other.headers["etag"]})).status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_expired_version_still_answers_304_for_unchanged_content(mock_db, db_budget, etags):
+    _seed(mock_db)
+    async with AsyncClient(app=main.app, base_url="http://test") as client:
+        first = await client.get("/api/products", params={"limit": 10})
+        etag = first.headers["etag"]
+        with db_budget(queries=0):
+            assert (await client.get("/api/products", params={"limit": 10}, headers={"If-None-Match": etag})).status_code == 304
+
+        # Another page size is another page
+        assert (await client.get("/api/products", params={"limit": 1}, headers={"If-None-Match": etag})).status_code == 200
+
+        # A write that leaves the content as it was re-renders the page under the same strong ETag
+        versions = etags.pages_version()
+        await repository.set_doc("products", "p2", dict(mock_db["products"]["p2"]))
+        assert etags.pages_version() != versions
+        with db_budget() as ops:
+            same = await client.get("/api/products", params={"limit": 10}, headers={"If-None-Match": etag})
+        assert same.status_code == 304
+        assert ops.queries > 0
+
+        await repository.set_doc("products", "p3", {"name": "Box 3", "category": "Lorcana"})
+        changed = await client.get("/api/products", params={"limit": 10}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["total"] == 3
+
+
+def test_listing_writes_bump_the_products_they_touch():
+    etags = CatalogETags(ttl_seconds=60)
+    etags._remember(etags.product_key("p1"), etags.product_version("p1"), '"a"', ("l1",))
+    before_p1, before_p2, pages = etags.product_version("p1"), etags.product_version("p2"), etags.pages_version()
+
+    etags.on_write("shopifyListings", "l1", {"quantity": 0})
+    assert etags.product_version("p1") != before_p1
+    assert etags.product_version("p2") == before_p2
+    assert etags.pages_version() != pages
+
+    etags.on_write("shopifyListings", "l9", {"status": "active"})
+    assert etags.product_version("p2") != before_p2
+    etags.on_write("stores", "shop", {"store_name": "Renamed"})
+    assert etags.stats()["products_generation"] == 1
@@ -0,0 +1,28 @@
+import pytest
+from httpx import AsyncClient
+
+from app import main
+from database import AFFILIATE_PRODUCTS
+
+
+@pytest.mark.asyncio
+async def test_readding_an_unchanged_ebay_listing_skips_the_write(mock_db, monkeypatch):
+    monkeypatch.setenv("ADMIN_API_KEY", "admin")
+    body = {
+        "admin_key": "admin",
+        "affiliate_url": "https://www.ebay.ca/itm/123",
+        "product_name": "Surging Sparks Booster Box",
+        "price": 189.99,
+        "upc": "0820650853",
+    }
+    async with AsyncClient(app=main.app, base_url="http://test") as client:
+        first = (await client.post("/api/admin/products/ebay/add", json=body)).json()
+        listing = dict(mock_db[AFFILIATE_PRODUCTS][first["listing_id"]])
+        assert (await client.post("/api/admin/products/ebay/add", json=body)).status_code == 200
+        assert mock_db[AFFILIATE_PRODUCTS][first["listing_id"]] == listing
+
+        changed = await client.post("/api/admin/products/ebay/add", json={**body, "price": 179.99})
+    stored = mock_db[AFFILIATE_PRODUCTS][changed.json()["listing_id"]]
+    assert stored["price"] == 179.99
+    assert stored["created_at"] == listing["created_at"]
+    assert stored["content_hash"] != listing["content_hash"]
@@ -0,0 +1,73 @@
+import logging
+
+import pytest
+from httpx import AsyncClient
+
+import middleware.audit
+from app.main import app
+from database import db
+from db_instrumentation import add_write_listener, remove_write_listener
+
+
+def _seed_catalogue(mock_db, products):
+    mock_db["products"] = {f"p{i}": {"name": f"Box {i}", "category": "Pokemon"} for i in range(products)}
+    mock_db["shopifyListings"] = {
+        f"l{i}": {
+            "product_id": f"p{i}", "status": "active", "store_id": "shop", "store_name": "Shop",
+            "price": 10.0 + i, "quantity": 3,
+        }
+        for i in range(products)
+    }
+    mock_db["affiliateProducts"] = {}
+
+
+@pytest.mark.asyncio
+async def test_product_detail_stays_within_budget(mock_db, db_budget, monkeypatch):
+    _seed_catalogue(mock_db, 3)
+    monkeypatch.setattr(middleware.audit, "DB_OPS_HEADERS", True)
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        with db_budget(reads=1, queries=2, writes=0) as ops:
+            response = await ac.get("/api/products/p1")
+
+    assert response.status_code == 200
+    assert ops.as_dict() == {"reads": 1, "queries": 2, "writes": 0, "docs": 2}
+    assert response.headers["x-db-reads"] == "1"
+    assert response.headers["x-db-queries"] == "2"
+
+
+@pytest.mark.asyncio
+async def test_per_product_fan_out_is_flagged(mock_db, db_budget, caplog):
+    _seed_catalogue(mock_db, 12)
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        with pytest.raises(AssertionError, match="queries"):
+            with db_budget(queries=3):
+                with caplog.at_level(logging.WARNING, logger="middleware.audit"):
+                    response = await ac.get("/api/products")
+                assert response.status_code == 200
+
+    assert any("Possible N+1" in r.message and "shopifyListings" in r.message for r in caplog.records)
+
+
+@pytest.mark.asyncio
+async def test_writes_through_snapshot_references_are_counted(mock_db, db_budget):
+    _seed_catalogue(mock_db, 2)
+    written = []
+
+    def listener(collection, doc_id, data):
+        written.append((collection, doc_id))
+
+    add_write_listener(listener)
+    try:
+        with db_budget() as ops:
+            async for doc in db.collection("products").where("name", "==", "Box 1").stream():
+                await doc.reference.update({"image_url": "box.png"})
+            snapshot = await db.collection("shopifyListings").document("l0").get()
+            await snapshot.reference.update({"quantity": 2})
+    finally:
+        remove_write_listener(listener)
+
+    assert ops.writes == 2
+    assert written == [("products", "p1"), ("shopifyListings", "l0")]
+    assert mock_db["products"]["p1"]["image_url"] == "box.png"
@@ -0,0 +1,62 @@
+import pytest
+
+from database import DEALS, PRICE_STATS
+from deal_service import DealService, PriceDistribution
+
+
+def test_distribution_tracks_vendor_median_and_history():
+    dist = PriceDistribution(history_size=3)
+    dist.observe("a", 100.0)
+    dist.observe("b", 120.0)
+    dist.observe("c", 80.0)
+    assert dist.median() == 100.0
+
+    # Re-pricing a vendor replaces its live price and ages out old history
+    dist.observe("c", 140.0)
+    assert dist.median() == 120.0
+    assert list(dist.history) == [120.0, 80.0, 140.0]
+    assert dist.observe("c", 140.0) is False
+
+    dist.remove("b")
+    assert dist.median() == 120.0
+
+
+@pytest.mark.asyncio
+async def test_listing_below_market_is_indexed_and_cleared(mock_db):
+    service = DealService()
+    listing = {"product_name": "151 Booster Box", "product_game": "Pokemon", "store_name": "A"}
+    for listing_id, price in [("s_1", 200.0), ("s_2", 210.0), ("s_3", 205.0)]:
+        await service.observe_listing("p1", listing_id, price, True, listing)
+    assert not mock_db.get(DEALS)
+
+    await service.observe_listing("p1", "s_4", 150.0, True, listing)
+    deals = await service.get_deals()
+    assert [d["listing_id"] for d in deals] == ["s_4"]
+    assert deals[0]["market_price"] == 202.5
+    assert mock_db[PRICE_STATS]["p1"]["deals"] == {"s_4": True}
+
+    await service.observe_listing("p1", "s_4", None, False, listing)
+    assert await service.get_deals() == []
+
+
+@pytest.mark.asyncio
+async def test_instances_write_only_the_entries_they_change(mock_db):
+    first, second = DealService(), DealService()
+    first.history_size = second.history_size = 3
+    await first.observe_listing("p1", "s_1", 200.0, True, {})
+    # The second instance caches the distribution before the first writes again
+    await second.observe_listing("p1", "s_2", 210.0, True, {})
+    await first.observe_listing("p1", "s_3", 205.0, True, {})
+    await second.observe_listing("p1", "s_2", 190.0, True, {})
+
+    stats = mock_db[PRICE_STATS]["p1"]
+    assert stats["vendors"] == {"s_1": 200.0, "s_2": 190.0, "s_3": 205.0}
+    # Each instance trims only the history it knows about; readers keep the newest window
+    assert len(stats["history"]) == 4
+    assert list(PriceDistribution.from_dict(stats, history_size=3).history) == [210.0, 205.0, 190.0]
+
+    second._distributions.clear()  # as when the cached copy expires
+    await second.observe_listing("p1", "s_1", None, False, {})
+    stats = mock_db[PRICE_STATS]["p1"]
+    assert stats["vendors"] == {"s_2": 190.0, "s_3": 205.0}
+    assert len(stats["history"]) == 3
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from event_sink import DROP_NEWEST, EventSink
+
+
+class FlakyWriter:
+    def __init__(self):
+        self.available = True
+        self.batches = []
+
+    async def __call__(self, dataset, table, rows):
+        if not self.available:
+            raise ConnectionError("sink unavailable")
+        await asyncio.sleep(0)
+        self.batches.append((dataset, table, list(rows)))
+
+
+@pytest.mark.asyncio
+async def test_batches_by_table_and_drops_when_full(tmp_path):
+    writer = FlakyWriter()
+    sink = EventSink(writer, capacity=3, batch_size=10, spill_dir=str(tmp_path))
+
+    for i in range(4):
+        sink.emit("platform_logs", "audit_events", {"n": i})
+    await sink.flush()
+
+    assert writer.batches == [("platform_logs", "audit_events", [{"n": 1}, {"n": 2}, {"n": 3}])]
+    stats = sink.stats()
+    assert stats["dropped"] == 1
+    assert stats["flushed"] == {"platform_logs.audit_events": 3}
+
+    newest = EventSink(writer, capacity=1, spill_dir=str(tmp_path), drop_policy=DROP_NEWEST)
+    assert newest.emit("d", "t", {"n": 1}) is True
+    assert newest.emit("d", "t", {"n": 2}) is False
+
+
+@pytest.mark.asyncio
+async def test_spills_to_ndjson_and_replays_on_recovery(tmp_path):
+    writer = FlakyWriter()
+    writer.available = False
+    sink = EventSink(writer, batch_size=2, spill_dir=str(tmp_path))
+
+    for i in range(3):
+        sink.emit("user_behavior", "chat_queries", {"n": i})
+    await sink.flush()
+
+    assert writer.batches == []
+    assert sink.stats()["spilled"] == 3
+    assert len(os.listdir(tmp_path)) == 2
+
+    writer.available = True
+    await sink._replay_spills()
+
+    assert sorted(row["n"] for _, _, rows in writer.batches for row in rows) == [0, 1, 2]
+    assert os.listdir(tmp_path) == []
+    assert sink.stats()["replayed"] == 3
+
+
+async def _spill_rows(directory, count):
+    writer = FlakyWriter()
+    writer.available = False
+    sink = EventSink(writer, batch_size=1, spill_dir=str(directory))
+    for i in range(count):
+        sink.emit("platform_logs", "audit_events", {"n": i})
+    await sink.flush()
+
+
+@pytest.mark.asyncio
+async def test_workers_sharing_a_spill_dir_replay_each_file_once(tmp_path):
+    await _spill_rows(tmp_path, 6)
+    writer = FlakyWriter()
+    workers = [EventSink(writer, spill_dir=str(tmp_path)) for _ in range(3)]
+
+    await asyncio.gather(*(worker._replay_spills() for worker in workers))
+
+    assert sorted(row["n"] for _, _, rows in writer.batches for row in rows) == list(range(6))
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_started_sink_replays_earlier_spills_from_its_worker(tmp_path):
+    await _spill_rows(tmp_path, 3)
+    writer = FlakyWriter()
+    sink = EventSink(writer, spill_dir=str(tmp_path))
+    await sink.start()
+    for _ in range(100):
+        if not os.listdir(tmp_path):
+            break
+        await asyncio.sleep(0.01)
+    await sink.stop()
+
+    assert sorted(row["n"] for _, _, rows in writer.batches for row in rows) == [0, 1, 2]
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_failed_replay_releases_its_claim_and_stale_claims_are_taken_over(tmp_path):
+    await _spill_rows(tmp_path, 2)
+    writer = FlakyWriter()
+    writer.available = False
+    sink = EventSink(writer, spill_dir=str(tmp_path))
+    await sink._replay_spills()
+    assert len(sink._spill_files()) == 2
+
+    # A worker that crashed mid-replay leaves its claim behind
+    abandoned = f"{sink._spill_files()[0]}.replaying.999999"
+    os.rename(sink._spill_files()[0], abandoned)
+    writer.available = True
+    await sink._replay_spills()
+    assert os.listdir(tmp_path) == [os.path.basename(abandoned)]
+
+    old = time.time() - sink.claim_timeout - 1
+    os.utime(abandoned, (old, old))
+    await sink._replay_spills()
+    assert os.listdir(tmp_path) == []
+    assert sink.stats()["replayed"] == 2
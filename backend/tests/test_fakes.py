@@ -0,0 +1,58 @@
+import gzip
+import json
+
+import pytest
+from httpx import AsyncClient
+
+from fakes import create_app
+from fakes.faults import FaultConfig, FaultInjector
+from shopify_service import ShopifyService
+
+
+@pytest.mark.asyncio
+async def test_fake_shopify_bulk_export_round_trip(monkeypatch):
+    monkeypatch.setenv("FAKE_SHOPIFY_PRODUCTS", "40")
+    monkeypatch.setenv("FAKE_SHOPIFY_VARIANTS", "2")
+    shop = "fake-shop.myshopify.com"
+
+    async with AsyncClient(app=create_app(), base_url="http://fakes") as ac:
+        graphql = f"/shopify/{shop}/admin/api/2024-01/graphql.json"
+        run = await ac.post(graphql, json={"query": "mutation { bulkOperationRunQuery }", "variables": {"query": "{}"}})
+        bulk_id = run.json()["data"]["bulkOperationRunQuery"]["bulkOperation"]["id"]
+        current = (await ac.post(graphql, json={"query": "{ currentBulkOperation { id } }"})).json()
+        operation = current["data"]["currentBulkOperation"]
+        by_id = {"query": "query BulkOp($id: ID!) { node(id: $id) { id } }", "variables": {"id": bulk_id}}
+        node = (await ac.post(graphql, json=by_id)).json()["data"]["node"]
+        export = await ac.get(operation["url"].replace("http://fakes", ""))
+
+    assert operation["id"] == bulk_id and operation["status"] == "COMPLETED"
+    assert node["id"] == bulk_id and node["url"] == operation["url"]
+    rows = [json.loads(line) for line in gzip.decompress(export.content).splitlines()]
+    products = [row for row in rows if "__parentId" not in row]
+    assert len(products) == 40
+    assert len(rows) == 40 * 4  # product, two variants, one image
+
+    record = dict(products[0], variants={"edges": [{"node": r} for r in rows[1:3]]})
+    normalized = ShopifyService()._normalize_from_graphql(record, {})
+    assert normalized["segment"] == "sealed" and len(normalized["variants"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_fault_injection_rate_limits():
+    faults = FaultInjector({"shippo": FaultConfig(rate_limit_rate=1.0, retry_after_seconds=3)}, seed=1)
+
+    async with AsyncClient(app=create_app(faults), base_url="http://fakes") as ac:
+        limited = await ac.post("/shippo/shipments/", json={"parcels": [{"weight": 2}]})
+        healthy = await ac.get("/rapidapi/search", params={"query": "pokemon"})
+
+    assert limited.status_code == 429
+    assert limited.headers["retry-after"] == "3"
+    assert healthy.status_code == 200 and healthy.json()["results"]
+
+
+def test_shopify_base_url_is_switchable(monkeypatch):
+    monkeypatch.setenv("SHOPIFY_API_BASE_URL", "http://localhost:9100/shopify/")
+
+    url = ShopifyService().admin_api_url("a.myshopify.com", "graphql.json")
+
+    assert url == "http://localhost:9100/shopify/a.myshopify.com/admin/api/2024-01/graphql.json"
@@ -0,0 +1,84 @@
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from enum import Enum
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from httpx import AsyncClient
+from pydantic import BaseModel
+
+import fast_json
+from fast_json import FastJSONResponse, trusted_json
+
+
+class Segment(str, Enum):
+    SEALED = "sealed"
+
+
+class Price(BaseModel):
+    amount: Decimal
+    updated_at: datetime
+
+
+PAYLOAD = {
+    "naive": datetime(2024, 1, 2, 3, 4, 5, 123),
+    "aware": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=-5))),
+    "firestore": DatetimeWithNanoseconds(2024, 1, 2, 3, 4, 5, nanosecond=123456789, tzinfo=timezone.utc),
+    "day": date(2024, 1, 2),
+    "prices": [Decimal("19.99"), Decimal("20"), 12.5, 3],
+    "segment": Segment.SEALED,
+    "id": uuid.UUID(int=7),
+    "tags": {"sealed"},
+    "pair": (1, 2),
+    "counts": {1: "one"},
+    "model": Price(amount=Decimal("4.50"), updated_at=datetime(2024, 5, 6)),
+    "name": "Pokémon Booster Box",
+    "missing": None,
+}
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_render_matches_default_json_response(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(fast_json, "orjson", None)
+    expected = JSONResponse(jsonable_encoder(PAYLOAD)).body
+    assert FastJSONResponse(PAYLOAD).body == expected
+    # The default route path pre-encodes; rendering that must not change anything either
+    assert FastJSONResponse(jsonable_encoder(PAYLOAD)).body == expected
+
+
+@pytest.mark.asyncio
+async def test_trusted_json_skips_response_model_validation():
+    app = FastAPI(default_response_class=FastJSONResponse)
+
+    async def page_size() -> int:
+        return 2
+
+    @app.get("/validated", response_model=Price)
+    async def validated():
+        return {"amount": "4.50", "updated_at": datetime(2024, 5, 6), "internal": True}
+
+    @app.get("/trusted", response_model=Price)
+    @trusted_json
+    async def trusted(limit: int = Depends(page_size)):
+        return {"amount": Decimal("4.50"), "updated_at": datetime(2024, 5, 6), "limit": limit}
+
+    @app.get("/trusted-sync")
+    @trusted_json
+    def trusted_sync(q: str = "x"):
+        return {"q": q}
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        assert (await client.get("/validated")).json() == {"amount": "4.50", "updated_at": "2024-05-06T00:00:00"}
+        # Returned as built: no model filtering, Decimal rendered like jsonable_encoder
+        assert (await client.get("/trusted")).json() == {
+            "amount": 4.5, "updated_at": "2024-05-06T00:00:00", "limit": 2,
+        }
+        assert (await client.get("/trusted-sync", params={"q": "y"})).json() == {"q": "y"}
+        schema = (await client.get("/openapi.json")).json()
+    assert "Price" in schema["components"]["schemas"]
+    assert "limit" not in str(schema["paths"]["/trusted"])
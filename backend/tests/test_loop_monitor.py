@@ -0,0 +1,33 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from loop_monitor import LoopLagMonitor, tag_current_task
+
+
+def blocking_call(seconds):
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_blocking_call_is_reported_with_stack_and_request(caplog):
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+    await monitor.start()
+    try:
+        await asyncio.sleep(0.03)
+        tag_current_task("GET /api/slow")
+        with caplog.at_level(logging.WARNING, logger="loop_monitor"):
+            blocking_call(0.3)
+            await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+
+    stats = monitor.stats()
+    assert stats["max_lag_ms"] >= 200
+    stall = stats["stalls"][0]
+    assert stall["request"] == "GET /api/slow"
+    assert stall["blocked_ms"] >= 200
+    assert any("blocking_call" in line for line in stall["stack"])
+    assert any("Event loop was blocked" in r.message for r in caplog.records)
@@ -0,0 +1,52 @@
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+import metrics
+from database import db
+from middleware.audit import AuditMiddleware
+
+
+def _sample(text, prefix):
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_histogram_renders_cumulative_buckets():
+    hist = metrics.Histogram("test_latency_seconds", "Test", ("route",), buckets=(0.1, 1.0))
+    child = hist.labels("/a")
+    for value in (0.05, 0.1, 0.5, 3.0):
+        child.observe(value)
+
+    lines = hist.render()
+
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 2' in lines
+    assert 'test_latency_seconds_bucket{route="/a",le="1"} 3' in lines
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_count{route="/a"} 4' in lines
+
+
+@pytest.mark.asyncio
+async def test_routes_and_firestore_ops_are_recorded(mock_db):
+    app = FastAPI()
+    app.add_middleware(AuditMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        await db.collection("items").document(item_id).get()
+        return {"id": item_id}
+
+    route_prefix = 'http_request_duration_seconds_count{method="GET",route="/items/{item_id}",status="200"}'
+    get_prefix = 'integration_request_duration_seconds_count{integration="firestore",operation="get",outcome="ok"}'
+    before = metrics.REGISTRY.render()
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        await ac.get("/items/1")
+        await ac.get("/items/2")
+
+    after = metrics.REGISTRY.render()
+    assert _sample(after, route_prefix) - _sample(before, route_prefix) == 2
+    assert _sample(after, get_prefix) - _sample(before, get_prefix) == 2
+    assert _sample(after, "http_requests_in_flight ") == 0
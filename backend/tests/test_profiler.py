@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+import middleware.audit
+from middleware.audit import AuditMiddleware
+from profiler import StackSampler, get_profile_store
+
+
+def busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_sampler_collapses_worker_thread_stacks():
+    worker = threading.Thread(target=busy_wait, args=(0.2,), name="busy-worker")
+    sampler = StackSampler(interval=0.002).start()
+    worker.start()
+    worker.join()
+    sampler.stop()
+
+    stacks = sampler.collapsed().splitlines()
+    assert sampler.samples > 0
+    assert any(line.startswith("busy-worker;") and "test_profiler.py:busy_wait" in line for line in stacks)
+
+
+@pytest.mark.asyncio
+async def test_slow_request_with_profile_header_stores_profile(monkeypatch):
+    monkeypatch.setenv("ADMIN_API_KEY", "secret")
+    monkeypatch.setattr(middleware.audit, "PROFILE_REQUESTS_ENABLED", True)
+    monkeypatch.setattr(middleware.audit, "PROFILE_SLOW_REQUEST_MS", 50)
+    app = FastAPI()
+    app.add_middleware(AuditMiddleware)
+
+    @app.get("/slow")
+    async def slow():
+        busy_wait(0.1)
+        return {"ok": True}
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        plain = await ac.get("/slow")
+        profiled = await ac.get("/slow", headers={"X-Profile": "secret"})
+
+    assert "x-profile-id" not in plain.headers
+    profile = get_profile_store().get(profiled.headers["x-profile-id"])
+    assert profile["path"] == "/slow"
+    assert "busy_wait" in profile["collapsed"]
+
+
+@pytest.mark.asyncio
+async def test_profiled_request_joins_the_sampler_off_the_event_loop(monkeypatch):
+    monkeypatch.setenv("ADMIN_API_KEY", "secret")
+    monkeypatch.setattr(middleware.audit, "PROFILE_REQUESTS_ENABLED", True)
+    monkeypatch.setattr(middleware.audit, "PROFILE_SLOW_REQUEST_MS", 0)
+    joined_on = []
+    stop = StackSampler.stop
+
+    def recording_stop(self):
+        joined_on.append(threading.get_ident())
+        return stop(self)
+
+    monkeypatch.setattr(StackSampler, "stop", recording_stop)
+    app = FastAPI()
+    app.add_middleware(AuditMiddleware)
+
+    @app.get("/fast")
+    async def fast():
+        return {"ok": True}
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/fast", headers={"X-Profile": "secret"})
+
+    assert joined_on and threading.get_ident() not in joined_on
+    assert get_profile_store().get(response.headers["x-profile-id"])["path"] == "/fast"
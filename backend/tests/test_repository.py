@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+import database
+import repository
+
+
+@pytest.mark.asyncio
+async def test_reads_are_coalesced_within_scope(mock_db, monkeypatch):
+    mock_db["stores"] = {"shop-a": {"store_name": "A"}}
+    calls = []
+    original_get = database.MockDocument.get
+
+    async def counting_get(self):
+        calls.append(self.id)
+        return await original_get(self)
+
+    monkeypatch.setattr(database.MockDocument, "get", counting_get)
+
+    with repository.read_scope():
+        first, second = await asyncio.gather(
+            repository.get_doc("stores", "shop-a"), repository.get_doc("stores", "shop-a")
+        )
+        first["store_name"] = "mutated"
+        assert (await repository.get_doc("stores", "shop-a"))["store_name"] == "A"
+        await repository.update_doc("stores", "shop-a", {"store_name": "B"})
+        assert (await repository.get_doc("stores", "shop-a"))["store_name"] == "B"
+
+    assert second == {"store_name": "A"}
+    assert calls == ["shop-a", "shop-a"]
+
+
+@pytest.mark.asyncio
+async def test_get_many_and_batch(mock_db):
+    batch = repository.batch()
+    batch.set("products", "p1", {"name": "Box"})
+    new_id = batch.set("products", None, {"name": "Tin"})
+    batch.update("products", "p1", {"price": 10})
+    await batch.commit()
+
+    found = await repository.get_many("products", ["p1", new_id, "missing", "p1"])
+    assert found == {"p1": {"name": "Box", "price": 10}, new_id: {"name": "Tin"}}
@@ -0,0 +1,165 @@
+import pytest
+
+from database import INVENTORY_ITEM_INDEX, SHOPIFY_LISTINGS
+from shopify_service import ShopifyService
+
+SHOP = "vendor.myshopify.com"
+
+
+def _normalized(price=100.0, quantity=5):
+    return {
+        "title": "151 Booster Box",
+        "segment": "sealed",
+        "game": "Pokemon",
+        "status": "active",
+        "images": [],
+        "shopify_product_id": "10",
+        "variants": [
+            {
+                "id": "20",
+                "price": price,
+                "inventory_quantity": quantity,
+                "available": True,
+                "inventory_item_id": "30",
+            }
+        ],
+    }
+
+
+@pytest.mark.asyncio
+async def test_inventory_webhook_updates_listing_through_index(mock_db):
+    service = ShopifyService()
+    await service._upsert_listings({"store_name": "Vendor"}, SHOP, "p1", _normalized())
+    assert mock_db[INVENTORY_ITEM_INDEX][f"{SHOP}_30"]["listing_ids"] == [f"{SHOP}_20"]
+
+    await service.handle_inventory_level_update(SHOP, {"inventory_item_id": 30, "available": 2})
+    assert mock_db[SHOPIFY_LISTINGS][f"{SHOP}_20"]["quantity"] == 2
+
+    # The partial update invalidates the hash so a resync restores the catalogue quantity
+    written = await service._upsert_listings({"store_name": "Vendor"}, SHOP, "p1", _normalized())
+    assert f"{SHOP}_20" in written
+    assert mock_db[SHOPIFY_LISTINGS][f"{SHOP}_20"]["quantity"] == 5
+
+
+@pytest.mark.asyncio
+async def test_inventory_webhook_backfills_index_for_legacy_listings(mock_db):
+    mock_db[SHOPIFY_LISTINGS] = {
+        f"{SHOP}_20": {"store_id": SHOP, "inventory_item_id": "30", "quantity": 5}
+    }
+    service = ShopifyService()
+    await service.handle_inventory_level_update(SHOP, {"inventory_item_id": 30, "available": 0})
+
+    assert mock_db[SHOPIFY_LISTINGS][f"{SHOP}_20"]["quantity"] == 0
+    assert mock_db[INVENTORY_ITEM_INDEX][f"{SHOP}_30"]["listing_ids"] == [f"{SHOP}_20"]
+
+
+def _bulk_rows(variant_ids):
+    rows = [{"id": "gid://shopify/Product/10", "title": "151 Booster Box", "status": "ACTIVE", "tags": []}]
+    for variant_id in variant_ids:
+        rows.append(
+            {
+                "id": f"gid://shopify/ProductVariant/{variant_id}",
+                "price": "100.00",
+                "inventoryQuantity": 5,
+                "inventoryItem": {"id": "gid://shopify/InventoryItem/30"},
+                "__parentId": "gid://shopify/Product/10",
+            }
+        )
+    return rows
+
+
+@pytest.mark.asyncio
+async def test_sync_products_delta_then_full_reconcile(mock_db, monkeypatch):
+    mock_db["stores"] = {SHOP: {"store_name": "Vendor", "access_token": "token"}}
+    service = ShopifyService()
+    queries = []
+    rows = _bulk_rows(["20", "21"])
+
+    async def run_query(shop, token, bulk_query):
+        queries.append(bulk_query)
+        return "gid://shopify/BulkOperation/1"
+
+    async def wait(shop, token, bulk_id=None):
+        return {"status": "COMPLETED", "url": "https://example.com/bulk.jsonl"}
+
+    async def stream(url):
+        for row in rows:
+            yield dict(row)
+
+    monkeypatch.setattr(service, "_run_products_bulk_query", run_query)
+    monkeypatch.setattr(service, "_wait_for_bulk_operation", wait)
+    monkeypatch.setattr(service, "_stream_bulk_file", stream)
+
+    assert await service.sync_products(SHOP) == 1
+    store = mock_db["stores"][SHOP]
+    assert "updated_at" not in queries[0]
+    assert store["sync_mode"] == "full" and store["sync_watermark"]
+    assert mock_db[SHOPIFY_LISTINGS][f"{SHOP}_21"]["status"] == "active"
+
+    assert store["last_sync_stats"]["written"] == 2
+    first_write = mock_db[SHOPIFY_LISTINGS][f"{SHOP}_20"]["updated_at"]
+
+    await service.sync_products(SHOP)
+    assert "updated_at:>" in queries[1]
+    assert mock_db["stores"][SHOP]["sync_mode"] == "delta"
+    assert mock_db["stores"][SHOP]["last_sync_stats"]["skipped"] == 2
+    assert mock_db[SHOPIFY_LISTINGS][f"{SHOP}_20"]["updated_at"] == first_write
+
+    rows = _bulk_rows(["20"])
+    await service.sync_products(SHOP, mode="full")
+    assert mock_db[SHOPIFY_LISTINGS][f"{SHOP}_21"]["status"] == "inactive"
+    assert mock_db[SHOPIFY_LISTINGS][f"{SHOP}_20"]["status"] == "active"
+    assert mock_db["stores"][SHOP]["last_sync_stats"]["deactivated"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_bulk_operation_starts_a_new_sync(mock_db, monkeypatch):
+    mock_db["stores"] = {SHOP: {
+        "store_name": "Vendor",
+        "access_token": "token",
+        "sync_status": "interrupted",
+        "bulk_operation_id": "gid://shopify/BulkOperation/old",
+        "sync_processed": 5,
+    }}
+    service = ShopifyService()
+    service.bulk_timeout = 1800
+    requests = []
+
+    async def graphql(shop, token, payload, operation="graphql"):
+        requests.append(operation)
+        if "bulkOperationRunQuery" in payload["query"]:
+            return {"data": {"bulkOperationRunQuery": {
+                "bulkOperation": {"id": "gid://shopify/BulkOperation/new"}, "userErrors": [],
+            }}}
+        if payload["variables"]["id"] != "gid://shopify/BulkOperation/new":
+            # Shopify has moved on; the old id is not the current operation
+            return {"data": {"node": None}}
+        return {"data": {"node": {
+            "id": "gid://shopify/BulkOperation/new", "status": "COMPLETED", "url": "https://example.com/b.jsonl",
+        }}}
+
+    async def stream(url):
+        for row in _bulk_rows(["20"]):
+            yield dict(row)
+
+    monkeypatch.setattr(service, "_graphql_request", graphql)
+    monkeypatch.setattr(service, "_stream_bulk_file", stream)
+
+    assert await service.sync_products(SHOP) == 1
+    assert requests == ["bulkOperation", "bulkOperationRunQuery", "bulkOperation"]
+    store = mock_db["stores"][SHOP]
+    assert store["sync_status"] == "completed" and store["bulk_operation_id"] is None
+    assert store["sync_processed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_wait_for_a_vanished_bulk_operation_fails_fast(monkeypatch):
+    service = ShopifyService()
+    service.bulk_timeout = 1800
+
+    async def graphql(shop, token, payload, operation="graphql"):
+        return {"data": {"node": None}}
+
+    monkeypatch.setattr(service, "_graphql_request", graphql)
+    result = await service._wait_for_bulk_operation(SHOP, "token", "gid://shopify/BulkOperation/gone")
+    assert result["status"] == "FAILED" and result["errorCode"] == "NOT_FOUND"
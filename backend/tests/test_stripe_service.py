@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+
+import pytest
+import stripe
+
+from database import MockFirestoreClient, PRODUCTS, SHOPIFY_LISTINGS, STORES
+from stripe_client import StripeClient
+from stripe_service import StripeService
+
+
+@pytest.mark.asyncio
+async def test_checkout_reads_each_collection_once(mock_db, monkeypatch):
+    mock_db[STORES] = {"shop": {"store_name": "Vendor", "stripe_account_id": "acct_1"}}
+    mock_db[PRODUCTS] = {"p1": {"name": "Booster Box", "category": "Pokemon"}}
+    mock_db[SHOPIFY_LISTINGS] = {
+        f"l{i}": {"store_id": "shop", "price": 10 + i} for i in range(3)
+    }
+    batched_reads = []
+    original_get_all = MockFirestoreClient.get_all
+
+    def counting_get_all(self, references):
+        batched_reads.append(len(references))
+        return original_get_all(self, references)
+
+    monkeypatch.setattr(MockFirestoreClient, "get_all", counting_get_all)
+    monkeypatch.setattr(stripe.checkout.Session, "create", lambda **payload: payload)
+
+    items = [{"listing_id": f"l{i}", "product_id": "p1", "quantity": 1} for i in range(3)]
+    session = await StripeService().create_checkout_session(items, "buyer@example.com", {})
+
+    assert sorted(batched_reads) == [1, 1, 3]
+    assert len(json.loads(session["metadata"]["items"])) == 3
+    assert [line["price_data"]["unit_amount"] for line in session["line_items"]] == [1000, 1100, 1200]
+
+
+@pytest.mark.asyncio
+async def test_commission_transfers_once_per_payout(mock_db, monkeypatch):
+    transfers = []
+
+    def create_transfer(**kwargs):
+        transfers.append(kwargs["idempotency_key"])
+        return stripe.Transfer.construct_from({"id": f"tr_{len(transfers)}"}, "sk_test")
+
+    monkeypatch.setattr(stripe.Transfer, "create", create_transfer)
+    items = [
+        {"store_id": "a", "stripe_account_id": "acct_a", "product_total": "50", "platform_commission": "2"},
+        {"store_id": "b", "stripe_account_id": None, "product_total": "30", "platform_commission": "1"},
+    ]
+    metadata = {"items": json.dumps(items), "order_gross_total": "80", "transfer_group": "order-1"}
+    service = StripeService()
+
+    for _ in range(2):
+        # Vendor b has no connected account, so the job keeps failing and being retried
+        with pytest.raises(RuntimeError, match="o1_b"):
+            await service.process_commission("o1", metadata, None)
+
+    assert transfers == ["payout-o1_a"]
+    payouts = mock_db["sellerPayouts"]
+    assert payouts["o1_a"]["status"] == "processing"
+    assert payouts["o1_a"]["stripe_transfer_id"] == "tr_1"
+    assert payouts["o1_b"]["status"] == "awaiting_transfer"
+    assert payouts["o1_b"]["transfer_attempts"] == 2
+    assert payouts["o1_b"]["last_transfer_error"]
+
+
+@pytest.mark.asyncio
+async def test_failed_transfer_is_retried_under_the_same_key(mock_db, monkeypatch):
+    attempts = []
+
+    def create_transfer(**kwargs):
+        attempts.append(kwargs["idempotency_key"])
+        if len(attempts) == 1:
+            raise stripe.error.APIConnectionError("connection reset")
+        return stripe.Transfer.construct_from({"id": "tr_retry"}, "sk_test")
+
+    monkeypatch.setattr(stripe.Transfer, "create", create_transfer)
+    items = [{"store_id": "a", "stripe_account_id": "acct_a", "product_total": "50", "platform_commission": "2"}]
+    metadata = {"items": json.dumps(items), "order_gross_total": "50"}
+    service = StripeService()
+
+    with pytest.raises(RuntimeError, match="o2_a"):
+        await service.process_commission("o2", metadata, None)
+    payout = mock_db["sellerPayouts"]["o2_a"]
+    assert payout["status"] == "awaiting_transfer"
+    assert payout["last_transfer_error"] == "connection reset"
+
+    # The queue's retry of the job picks the payout up again
+    await service.process_commission("o2", metadata, None)
+    payout = mock_db["sellerPayouts"]["o2_a"]
+    assert attempts == ["payout-o2_a", "payout-o2_a"]
+    assert payout["status"] == "processing" and payout["stripe_transfer_id"] == "tr_retry"
+    assert payout["transfer_attempts"] == 2 and payout["last_transfer_error"] is None
+
+
+@pytest.mark.asyncio
+async def test_stripe_client_times_out_without_blocking_the_loop():
+    client = StripeClient(max_workers=2, timeout=0.05)
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    with pytest.raises(stripe.error.APIConnectionError):
+        await asyncio.gather(client.call(time.sleep, 0.2), ticker())
+
+    assert len(ticks) == 5
+    assert client.stats()["calls"]["sleep"]["timeouts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_events_for_a_session_record_one_order(mock_db, monkeypatch):
+    from app.main import record_order_from_session
+    from database import db
+
+    transfers = []
+
+    def create_transfer(**kwargs):
+        transfers.append(kwargs["idempotency_key"])
+        return stripe.Transfer.construct_from({"id": f"tr_{len(transfers)}"}, "sk_test")
+
+    monkeypatch.setattr(stripe.Transfer, "create", create_transfer)
+    items = [{"store_id": "a", "stripe_account_id": "acct_a", "product_total": "50", "quantity": 2}]
+    session = {
+        "id": "cs_test_1", "amount_total": 5000, "payment_intent": None,
+        "metadata": {"items": json.dumps(items), "order_gross_total": "50"},
+    }
+
+    order_ids = await asyncio.gather(
+        record_order_from_session(db, session), record_order_from_session(db, session)
+    )
+
+    assert order_ids == ["cs_test_1", "cs_test_1"]
+    assert list(mock_db["orders"]) == ["cs_test_1"]
+    assert list(mock_db["orderItems"]) == ["cs_test_1_0"]
+    assert list(mock_db["sellerPayouts"]) == ["cs_test_1_a"]
+    assert set(transfers) == {"payout-cs_test_1_a"}
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import repository
+from database import STORES, SYNC_LEASES
+from sync_orchestrator import SyncOrchestrator
+
+
+class FakeShopifyService:
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.calls = []
+        self.seen_status = []
+        self.active = 0
+        self.peak = 0
+
+    async def sync_products(self, shop, mode="auto"):
+        self.calls.append(shop)
+        self.seen_status.append((await repository.get_doc(STORES, shop) or {}).get("sync_status"))
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return 1
+
+
+@pytest.mark.asyncio
+async def test_one_sync_per_shop_and_bounded_pool(mock_db):
+    mock_db[STORES] = {f"shop{i}.myshopify.com": {"status": "active"} for i in range(5)}
+    service = FakeShopifyService()
+    orchestrator = SyncOrchestrator(service)
+    orchestrator._semaphore = asyncio.Semaphore(2)
+
+    assert orchestrator.schedule("shop0.myshopify.com") is True
+    assert orchestrator.schedule("shop0.myshopify.com") is False
+
+    summary = await orchestrator.sync_all_active(window_seconds=5)
+    assert summary == {"stores": 5, "completed": 5, "interrupted": 0}
+    assert sorted(service.calls) == sorted(mock_db[STORES])
+    assert service.peak == 2
+
+
+@pytest.mark.asyncio
+async def test_window_interrupts_unfinished_syncs(mock_db):
+    mock_db[STORES] = {"slow.myshopify.com": {"status": "active"}}
+    orchestrator = SyncOrchestrator(FakeShopifyService(delay=5))
+
+    summary = await orchestrator.sync_all_active(window_seconds=0.05)
+    assert summary["interrupted"] == 1
+    assert mock_db[STORES]["slow.myshopify.com"]["sync_status"] == "interrupted"
+
+
+@pytest.mark.asyncio
+async def test_live_lease_elsewhere_blocks_sync_and_keeps_its_status(mock_db):
+    mock_db[STORES] = {"busy.myshopify.com": {"sync_status": "running"}}
+    mock_db[SYNC_LEASES] = {
+        "busy.myshopify.com": {"owner": "other", "expires_at": datetime.utcnow() + timedelta(minutes=5)}
+    }
+    service = FakeShopifyService()
+    orchestrator = SyncOrchestrator(service)
+    orchestrator.schedule("busy.myshopify.com")
+    await orchestrator._tasks["busy.myshopify.com"]
+    assert service.calls == []
+    assert mock_db[STORES]["busy.myshopify.com"]["sync_status"] == "running"
+    assert mock_db[SYNC_LEASES]["busy.myshopify.com"]["owner"] == "other"
+
+
+@pytest.mark.asyncio
+async def test_workers_waking_together_run_one_sync(mock_db):
+    shop = "shop.myshopify.com"
+    mock_db[STORES] = {shop: {"status": "active"}}
+    service = FakeShopifyService()
+    workers = [SyncOrchestrator(service) for _ in range(3)]
+    await asyncio.gather(*(worker.sync_all_active(window_seconds=5) for worker in workers))
+
+    assert service.calls == [shop]
+    # Released when done, so the next run can take it
+    assert shop not in mock_db[SYNC_LEASES]
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_taken_over_once(mock_db):
+    shop = "crashed.myshopify.com"
+    mock_db[STORES] = {shop: {"status": "active", "sync_status": "running"}}
+    mock_db[SYNC_LEASES] = {shop: {"owner": "dead", "expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+    service = FakeShopifyService()
+    workers = [SyncOrchestrator(service) for _ in range(2)]
+    await asyncio.gather(*(worker.sync_all_active(window_seconds=5) for worker in workers))
+    assert service.calls == [shop]
+
+
+@pytest.mark.asyncio
+async def test_sync_scheduled_from_a_request_reads_fresh_store_state(mock_db):
+    mock_db[STORES] = {"shop.myshopify.com": {"sync_status": "idle"}}
+    service = FakeShopifyService()
+    orchestrator = SyncOrchestrator(service)
+    with repository.read_scope():
+        assert (await orchestrator.status("shop.myshopify.com"))["status"] == "idle"
+        # A previous sync is marked interrupted after the request read the store
+        mock_db[STORES]["shop.myshopify.com"] = {"sync_status": "interrupted"}
+        orchestrator.schedule("shop.myshopify.com")
+    await orchestrator._tasks["shop.myshopify.com"]
+    assert service.seen_status == ["interrupted"]
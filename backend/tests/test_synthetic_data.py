@@ -0,0 +1,58 @@
+from dataclasses import replace
+
+import pytest
+
+from app.main import normalize_product_name
+from fakes import synthetic
+from fakes.synthetic import SyntheticConfig
+
+CONFIG = SyntheticConfig(stores=5, products=300, listings=1_500, orders=60, duplicate_rate=0.3)
+
+
+def test_documents_are_deterministic():
+    first = list(synthetic.documents(CONFIG))
+    second = list(synthetic.documents(CONFIG))
+    assert first == second
+    assert list(synthetic.documents(replace(CONFIG, seed=2))) != first
+
+
+def test_duplicates_mix_recoverable_and_unrecoverable_noise():
+    recoverable = unrecoverable = shared_upc = 0
+    for index in range(CONFIG.products):
+        root = synthetic.canonical_index(CONFIG, index)
+        if root == index:
+            continue
+        duplicate, original = synthetic.product(CONFIG, index), synthetic.product(CONFIG, root)
+        assert duplicate["name"] != original["name"]
+        if normalize_product_name(duplicate["name"]) == normalize_product_name(original["name"]):
+            recoverable += 1
+        else:
+            unrecoverable += 1
+        shared_upc += duplicate["upc"] == original["upc"]
+    assert recoverable and unrecoverable and shared_upc
+
+
+@pytest.mark.asyncio
+async def test_seed_writes_a_consistent_data_set(mock_db):
+    counts = await synthetic.seed(CONFIG, concurrency=4)
+
+    assert counts["stores"] == 5
+    assert counts["products"] == 300
+    assert counts["shopifyListings"] == 1_500
+    assert counts["orders"] == 60
+    for collection, count in counts.items():
+        assert len(mock_db[collection]) == count
+
+    for listing_id, listing in mock_db["shopifyListings"].items():
+        assert listing["product_id"] in mock_db["products"]
+        assert listing["store_id"] in mock_db["stores"]
+        assert listing_id == f"{listing['store_id']}_{listing['shopify_variant_id']}"
+
+    items_by_order = {}
+    for item in mock_db["orderItems"].values():
+        assert item["listing_id"] in mock_db["shopifyListings"]
+        items_by_order.setdefault(item["order_id"], []).append(item)
+    for order_id, order in mock_db["orders"].items():
+        items = items_by_order[order_id]
+        expected = sum(item["total_price"] + item["shipping_total"] for item in items)
+        assert abs(order["total_amount"] - expected) < 0.01
@@ -0,0 +1,165 @@
+import json
+import os
+import sys
+
+import pytest
+import stripe
+from fastapi import FastAPI, HTTPException, Request
+from httpx import AsyncClient
+
+from middleware.audit import AuditMiddleware
+from trace_capture import REDACTED, Sanitizer, encode_body, get_trace_recorder, read_traces
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+import replay  # noqa: E402
+
+WEBHOOK_SECRET = "whsec_replay_test"
+
+
+class NullAnalytics:
+    async def log_event(self, dataset, table, entry):
+        return None
+
+
+def _app():
+    app = FastAPI()
+    app.add_middleware(AuditMiddleware, analytics=NullAnalytics())
+
+    @app.get("/api/products/{product_id}")
+    async def product(product_id: str):
+        return {"id": product_id}
+
+    @app.post("/api/cart/optimize")
+    async def optimize(request: Request):
+        body = await request.json()
+        return {"items": len(body["items"])}
+
+    @app.post("/api/stripe/webhook")
+    async def webhook(request: Request):
+        try:
+            event = stripe.Webhook.construct_event(
+                await request.body(), request.headers.get("stripe-signature"), WEBHOOK_SECRET
+            )
+        except stripe.error.SignatureVerificationError:
+            raise HTTPException(status_code=400, detail="Invalid signature")
+        return {"id": event["id"]}
+
+    return app
+
+
+def test_sanitizer_redacts_credentials_and_personal_data():
+    sanitizer = Sanitizer(salt="fixed")
+
+    headers = sanitizer.headers([
+        (b"authorization", b"Bearer secret-jwt"),
+        (b"cookie", b"session=abc"),
+        (b"stripe-signature", b"t=1,v1=abc"),
+        (b"content-type", b"application/json"),
+    ])
+    assert headers == {"authorization": f"Bearer {REDACTED}", "content-type": "application/json"}
+    assert sanitizer.query(b"admin_key=s3cret&limit=48") == [["admin_key", REDACTED], ["limit", "48"]]
+
+    body = sanitizer.value("", {
+        "email": "Buyer@Example.com",
+        "password": "hunter2",
+        "shipping_address": {"name": "Jane Buyer", "street": "1 Main St", "province": "ON", "postal_code": "M5V"},
+        "items": [{"name": "Pokemon Booster Box", "quantity": 2}],
+    })
+    assert body["email"] == sanitizer.value("email", "buyer@example.com")
+    assert body["email"].endswith("@example.invalid")
+    assert body["password"] == REDACTED
+    assert body["shipping_address"]["province"] == "ON"
+    assert "Jane" not in body["shipping_address"]["name"] and "Main" not in body["shipping_address"]["street"]
+    assert body["items"] == [{"name": "Pokemon Booster Box", "quantity": 2}]
+
+    form = sanitizer.body(b"username=a%40b.com&password=x", "application/x-www-form-urlencoded")
+    assert encode_body(form).startswith(b"username=user-")
+    assert encode_body(form).endswith(b"&password=%3Credacted%3E")
+
+
+def test_sanitizer_redacts_a_stripe_checkout_session():
+    sanitizer = Sanitizer(salt="fixed")
+    address = {
+        "city": "Toronto", "country": "CA", "line1": "1 Main St", "line2": "Unit 4",
+        "postal_code": "M5V 2T6", "state": "ON",
+    }
+    event = {
+        "id": "evt_1OqX2bKx",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "data": {"object": {
+            "id": "cs_test_a1b2",
+            "object": "checkout.session",
+            "amount_total": 15998,
+            "currency": "cad",
+            "customer_details": {
+                "address": address, "email": "jane@example.com", "name": "Jane Buyer",
+                "phone": "+14165550100", "tax_exempt": "none", "tax_ids": [],
+            },
+            "customer_email": None,
+            "metadata": {"order_id": "order_1"},
+            "payment_intent": "pi_3OqX2b",
+            "payment_status": "paid",
+            "shipping_details": {"address": address, "name": "Jane Buyer"},
+            "status": "complete",
+        }},
+    }
+    # Shippo addresses spell the street differently
+    shippo = {"address_to": {"name": "Jane Buyer", "street1": "1 Main St", "street2": "Unit 4", "city": "Toronto"}}
+
+    sanitized = sanitizer.body(json.dumps(event).encode(), "application/json")["json"]
+    session = sanitized["data"]["object"]
+    rendered = json.dumps([sanitized, sanitizer.value("", shippo)])
+    for personal in ("Jane", "Main St", "Unit 4", "Toronto", "M5V", "4165550100", "jane@"):
+        assert personal not in rendered
+    assert session["customer_details"]["address"]["country"] == "CA"
+    assert session["shipping_details"]["name"].startswith("redacted-")
+    assert session["amount_total"] == 15998 and session["metadata"] == {"order_id": "order_1"}
+    assert sanitized["type"] == "checkout.session.completed"
+
+
+@pytest.mark.asyncio
+async def test_capture_then_replay_with_local_signatures(tmp_path, monkeypatch):
+    recorder = get_trace_recorder()
+    monkeypatch.setattr(recorder, "directory", str(tmp_path))
+    app = _app()
+    payload = '{"id": "evt_1", "object": "event", "type": "checkout.session.completed"}'
+    try:
+        recorder.start(sample_rate=1.0)
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            assert (await client.get("/api/products/p1", headers={"Cookie": "a=b"})).status_code == 200
+            cart = {"items": [{"product_id": "p1"}], "shipping_address": {"name": "Jane Buyer", "province": "ON"}}
+            assert (await client.post("/api/cart/optimize", json=cart)).status_code == 200
+            signed = stripe.WebhookSignature._compute_signature
+            timestamp = 1700000000
+            signature = f"t={timestamp},v1={signed(f'{timestamp}.{payload}', 'whsec_production')}"
+            # Signed with the production secret: rejected here, but the body is still captured
+            response = await client.post(
+                "/api/stripe/webhook", content=payload,
+                headers={"stripe-signature": signature, "content-type": "application/json"},
+            )
+            assert response.status_code == 400
+    finally:
+        stats = recorder.stop()
+    assert stats["written"] == 3
+
+    records = read_traces([stats["path"]])
+    assert [(r["method"], r["route"], r["status"]) for r in records] == [
+        ("GET", "/api/products/{product_id}", 200),
+        ("POST", "/api/cart/optimize", 200),
+        ("POST", "/api/stripe/webhook", 400),
+    ]
+    assert "cookie" not in records[0]["headers"]
+    assert "Jane" not in records[1]["json"]["shipping_address"]["name"]
+    assert records[2]["signature"] == "stripe"
+    assert "stripe-signature" not in records[2]["headers"]
+
+    replayer = replay.Replayer(stripe_secret=WEBHOOK_SECRET, run_id="run1")
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        results = await replay.replay(records, client, replayer, speed=0)
+    assert sorted(result["status"] for result in results) == [200, 200, 200]
+
+    summary = replay.summarize(results)
+    assert summary["ALL"]["count"] == 3
+    assert summary["POST /api/stripe/webhook"]["status_mismatches"] == 1
+    assert summary["GET /api/products/{product_id}"]["p50_ms"] >= 0
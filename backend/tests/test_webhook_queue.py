@@ -0,0 +1,169 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from webhook_queue import WebhookQueue
+
+
+@pytest.mark.asyncio
+async def test_jobs_are_drained_by_workers_and_counted(tmp_path):
+    queue = WebhookQueue(path=str(tmp_path / "queue.sqlite3"), workers=2)
+    seen = []
+
+    async def handler(topic, payload):
+        seen.append((topic, payload["n"]))
+
+    queue.register("shopify", handler)
+    await queue.start()
+    try:
+        for n in range(5):
+            await queue.enqueue("shopify", "products/update", {"n": n})
+        assert await queue.drain()
+    finally:
+        await queue.stop()
+
+    assert sorted(n for _, n in seen) == [0, 1, 2, 3, 4]
+    stats = queue.stats()
+    assert stats["depth"] == 0
+    assert stats["topics"]["shopify:products/update"]["processed"] == 5
+
+
+@pytest.mark.asyncio
+async def test_pending_jobs_survive_restart(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    queue = WebhookQueue(path=path, workers=1)
+    await queue.enqueue("stripe", "checkout.session.completed", {"id": "evt_1"})
+    await queue.stop()
+
+    recovered = WebhookQueue(path=path, workers=1)
+    handled = []
+
+    async def handler(topic, payload):
+        handled.append(payload["id"])
+
+    recovered.register("stripe", handler)
+    await recovered.start()
+    try:
+        assert await recovered.drain()
+    finally:
+        await recovered.stop()
+    assert handled == ["evt_1"]
+
+
+@pytest.mark.asyncio
+async def test_failed_jobs_are_retried(tmp_path):
+    queue = WebhookQueue(path=str(tmp_path / "queue.sqlite3"), workers=1)
+    queue.retry_backoff = 0
+    attempts = []
+
+    async def flaky(topic, payload):
+        attempts.append(payload["id"])
+        if len(attempts) == 1:
+            raise RuntimeError("downstream unavailable")
+
+    queue.register("stripe", flaky)
+    await queue.start()
+    try:
+        await queue.enqueue("stripe", "invoice.payment_failed", {"id": "evt_2"})
+        assert await queue.drain()
+    finally:
+        await queue.stop()
+
+    assert attempts == ["evt_2", "evt_2"]
+    assert queue.stats()["topics"]["stripe:invoice.payment_failed"]["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_bursts_are_coalesced_and_redeliveries_dropped(tmp_path):
+    queue = WebhookQueue(path=str(tmp_path / "queue.sqlite3"), workers=1)
+    queue.coalesce_window = 0.05
+    queue.poll_interval = 0.01
+    seen = []
+
+    async def handler(topic, payload):
+        seen.append(payload["title"])
+
+    queue.register("shopify", handler)
+    key = "shop.myshopify.com:product:1"
+    await queue.enqueue("shopify", "products/update", {"title": "v1"},
+                        dedup_id="w1", coalesce_key=key, version="2024-01-01T00:00:01")
+    await queue.enqueue("shopify", "products/update", {"title": "v3"},
+                        dedup_id="w3", coalesce_key=key, version="2024-01-01T00:00:03")
+    # Delivered late: older than the pending payload, so it must not win
+    await queue.enqueue("shopify", "products/update", {"title": "v2"},
+                        dedup_id="w2", coalesce_key=key, version="2024-01-01T00:00:02")
+    assert await queue.enqueue("shopify", "products/update", {"title": "v3"},
+                               dedup_id="w3", coalesce_key=key) is None
+
+    await queue.start()
+    try:
+        assert await queue.drain()
+    finally:
+        await queue.stop()
+
+    assert seen == ["v3"]
+    topic_stats = queue.stats()["topics"]["shopify:products/update"]
+    assert topic_stats["coalesced"] == 2
+    assert topic_stats["deduplicated"] == 1
+
+
+@pytest.mark.asyncio
+async def test_processes_sharing_a_file_claim_each_job_once(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    first, second = WebhookQueue(path=path, workers=1), WebhookQueue(path=path, workers=1)
+    for n in range(20):
+        await first.enqueue("stripe", "charge.refunded", {"n": n})
+
+    def claim_all(queue):
+        jobs = []
+        while (job := queue._claim()) is not None:
+            jobs.append(job[0])
+        return jobs
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        claimed = list(pool.map(claim_all, [first, second]))
+    assert sorted(claimed[0] + claimed[1]) == list(range(1, 21))
+
+    # A second process starting up leaves the other's in-flight jobs alone
+    handled = []
+
+    async def handler(topic, payload):
+        handled.append(payload["n"])
+
+    third = WebhookQueue(path=path, workers=1)
+    third.register("stripe", handler)
+    await third.start()
+    try:
+        await asyncio.sleep(0.05)
+    finally:
+        await third.stop()
+    assert handled == []
+    assert first.stats()["in_flight"] == 20
+    await first.stop()
+    await second.stop()
+
+
+@pytest.mark.asyncio
+async def test_jobs_with_an_expired_lease_are_requeued(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    crashed = WebhookQueue(path=path, workers=1)
+    crashed.lease_seconds = 0.01
+    await crashed.enqueue("stripe", "payout.paid", {"id": "evt_3"})
+    assert crashed._claim() is not None
+    await crashed.stop()
+
+    recovered = WebhookQueue(path=path, workers=1)
+    handled = []
+
+    async def handler(topic, payload):
+        handled.append(payload["id"])
+
+    recovered.register("stripe", handler)
+    await asyncio.sleep(0.02)
+    await recovered.start()
+    try:
+        assert await recovered.drain()
+    finally:
+        await recovered.stop()
+    assert handled == ["evt_3"]
@@ -0,0 +1,351 @@
+"""
+Request trace capture for replaying production traffic locally.
+
+While a capture is running, `AuditMiddleware` hands each sampled request
+(method, path, query, headers, body, status, latency) to the recorder. The
+request path only enqueues the raw pieces; a daemon writer thread sanitizes
+them and appends one JSON object per line to a gzip file:
+
+    {"ts": 1760870400.123, "method": "POST", "path": "/api/stripe/webhook",
+     "route": "/api/stripe/webhook", "query": [], "headers": {...},
+     "json": {...}, "signature": "stripe", "status": 200, "duration_ms": 12.4}
+
+Sanitizing drops cookies and unknown headers, keeps only the scheme of an
+`Authorization` header, and replaces secrets and personal data in query
+strings and bodies with stable placeholders (the same e-mail always maps to
+the same fake address within one capture). Webhook bodies are kept, but
+their signature headers are dropped: the body no longer matches the
+original signature anyway, so `benchmarks/replay.py` re-signs it with the
+local Stripe/Shopify secrets.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+logger = logging.getLogger(__name__)
+
+STRIPE = "stripe"
+SHOPIFY = "shopify"
+WEBHOOK_PATHS = {"/api/stripe/webhook": STRIPE, "/api/shopify/webhook": SHOPIFY}
+
+KEPT_HEADERS = frozenset({
+    "accept",
+    "accept-encoding",
+    "accept-language",
+    "content-type",
+    "if-modified-since",
+    "if-none-match",
+    "user-agent",
+    "x-shopify-api-version",
+    "x-shopify-shop-domain",
+    "x-shopify-topic",
+    "x-shopify-webhook-id",
+})
+# A key with one of these words (e.g. admin_key, access_token) is a credential and never leaves the worker
+SECRET_WORDS = frozenset({
+    "password", "secret", "token", "key", "apikey", "hmac", "signature", "code", "state", "card", "cvc",
+})
+# Personal data: replaced by a placeholder that is stable within one capture
+EMAIL_KEYS = frozenset({"email", "customer_email", "contact_email", "username"})
+PERSONAL_KEYS = frozenset({
+    "name", "first_name", "last_name", "phone", "street", "street1", "street2", "address1", "address2",
+    "line1", "line2", "city", "postal_code", "zip", "ip", "client_ip", "browser_ip",
+})
+# Keys whose "name" is a person rather than a product
+PERSON_CONTAINERS = frozenset({
+    "shipping_address", "billing_address", "customer", "customer_details", "address", "default_address",
+    "shipping", "shipping_details", "billing_details", "address_from", "address_to",
+})
+REDACTED = "<redacted>"
+
+
+def webhook_kind(path: str) -> Optional[str]:
+    return WEBHOOK_PATHS.get(path)
+
+
+class Sanitizer:
+    """Redacts one capture's requests; `salt` keeps placeholders stable but unlinkable across captures."""
+
+    def __init__(self, salt: Optional[str] = None):
+        self.salt = (salt or secrets.token_hex(16)).encode()
+
+    def _digest(self, value: str) -> str:
+        return hashlib.blake2b(value.encode(), key=self.salt, digest_size=5).hexdigest()
+
+    def headers(self, raw: Iterable[Tuple[bytes, bytes]]) -> Dict[str, str]:
+        kept: Dict[str, str] = {}
+        for name, value in raw:
+            key = name.decode("latin-1").lower()
+            if key == "authorization":
+                scheme = value.decode("latin-1").split(" ", 1)[0]
+                kept[key] = f"{scheme} {REDACTED}"
+            elif key in KEPT_HEADERS:
+                kept[key] = value.decode("latin-1")
+        return kept
+
+    def query(self, query_string: bytes) -> List[List[str]]:
+        pairs = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+        return [[key, self.value(key, value)] for key, value in pairs]
+
+    def value(self, key: str, value: Any, person: bool = False) -> Any:
+        lowered = key.lower()
+        if isinstance(value, dict):
+            child_person = lowered in PERSON_CONTAINERS
+            return {k: self.value(k, v, child_person) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.value(key, item, person) for item in value]
+        if value is None or isinstance(value, bool):
+            return value
+        if lowered in EMAIL_KEYS or lowered.endswith("email"):
+            return f"user-{self._digest(str(value).lower())}@example.invalid"
+        if lowered in PERSONAL_KEYS and (person or lowered != "name"):
+            return f"redacted-{self._digest(str(value))}"
+        if SECRET_WORDS.intersection(re.split(r"[_\-]", lowered)):
+            return REDACTED
+        return value
+
+    def body(self, body: bytes, content_type: str) -> Dict[str, Any]:
+        """Sanitized body as {"json": ...} or {"form": [...]}; other payloads keep only their size."""
+        if not body:
+            return {}
+        if content_type.startswith("application/json"):
+            try:
+                return {"json": self.value("", json.loads(body))}
+            except ValueError:
+                pass
+        elif content_type.startswith("application/x-www-form-urlencoded"):
+            return {"form": self.query(body)}
+        return {"body_bytes": len(body)}
+
+
+class TraceRecorder:
+    """Writes sanitized request traces to gzip NDJSON from a background thread."""
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        sample_rate: Optional[float] = None,
+        max_records: Optional[int] = None,
+        max_body_bytes: Optional[int] = None,
+        excluded_paths: Optional[Iterable[str]] = None,
+    ):
+        self.directory = directory or os.getenv("TRACE_CAPTURE_DIR", "traces")
+        self.sample_rate = sample_rate if sample_rate is not None else float(
+            os.getenv("TRACE_CAPTURE_SAMPLE_RATE", "1.0")
+        )
+        self.max_records = max_records or int(os.getenv("TRACE_CAPTURE_MAX_RECORDS", "100000"))
+        self.max_body_bytes = max_body_bytes or int(os.getenv("TRACE_CAPTURE_MAX_BODY_BYTES", "262144"))
+        if excluded_paths is None:
+            excluded_paths = os.getenv("TRACE_CAPTURE_EXCLUDE", "/metrics,/health,/api/admin/").split(",")
+        self.excluded_paths = tuple(p for p in excluded_paths if p)
+
+        self.path: Optional[str] = None
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._closing = threading.Event()
+        self._capturing = False
+        self._deadline: Optional[float] = None
+        self._started_at: Optional[str] = None
+        self._accepted = 0
+        self._written = 0
+        self._dropped = 0
+
+    @property
+    def active(self) -> bool:
+        return self._capturing
+
+    # ------------------------------------------------------------------
+    # Capture lifecycle
+    # ------------------------------------------------------------------
+    def start(
+        self,
+        seconds: Optional[float] = None,
+        sample_rate: Optional[float] = None,
+        max_records: Optional[int] = None,
+    ) -> str:
+        """Start a capture into a new file; it ends after `seconds` or `max_records`, or on `stop()`."""
+        if self.active:
+            raise RuntimeError(f"A trace capture is already running ({self.path})")
+        # Join the writer of a capture that ended on its own
+        self.stop()
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if max_records is not None:
+            self.max_records = max_records
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        self.path = os.path.join(self.directory, f"trace-{stamp}-{os.getpid()}.ndjson.gz")
+        self._deadline = time.monotonic() + seconds if seconds else None
+        self._started_at = datetime.utcnow().isoformat(timespec="seconds")
+        self._accepted = self._written = self._dropped = 0
+        # Bounded so a stalled disk drops records instead of growing memory
+        self._queue = queue.Queue(maxsize=10000)
+        self._closing = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(self.path, self._queue, self._closing, Sanitizer()),
+            name="trace-writer", daemon=True,
+        )
+        self._thread.start()
+        self._capturing = True
+        logger.info("Trace capture started: %s (sample rate %s)", self.path, self.sample_rate)
+        return self.path
+
+    def stop(self) -> Dict[str, Any]:
+        """End the capture and wait for the writer to flush and close the file."""
+        self._capturing = False
+        thread = self._thread
+        if thread is not None:
+            self._closing.set()
+            thread.join()
+            self._thread = None
+            logger.info("Trace capture finished: %s (%s requests)", self.path, self._written)
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "path": self.path,
+            "started_at": self._started_at,
+            "sample_rate": self.sample_rate,
+            "max_records": self.max_records,
+            "accepted": self._accepted,
+            "written": self._written,
+            "dropped": self._dropped,
+        }
+
+    def files(self) -> List[Dict[str, Any]]:
+        """Capture files in the trace directory, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name for name in os.listdir(self.directory) if name.endswith(".ndjson.gz")]
+        return [
+            {"name": name, "bytes": os.path.getsize(os.path.join(self.directory, name))}
+            for name in sorted(names, reverse=True)
+        ]
+
+    def file_path(self, name: str) -> Optional[str]:
+        """Path of a listed capture file; None for anything else (no path traversal)."""
+        if name not in {entry["name"] for entry in self.files()}:
+            return None
+        return os.path.join(self.directory, name)
+
+    # ------------------------------------------------------------------
+    # Request path (event loop)
+    # ------------------------------------------------------------------
+    def should_capture(self, scope) -> bool:
+        if not self._capturing:
+            return False
+        if self._accepted >= self.max_records or (self._deadline and time.monotonic() > self._deadline):
+            # The writer drains and closes the file on its own; the next start/stop joins it
+            self._capturing = False
+            self._closing.set()
+            return False
+        if scope["path"].startswith(self.excluded_paths):
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(self, scope, body: Optional[bytes], started_at: float, status: int, duration: float, route: str):
+        """Queue one finished request (`body` None when over the size limit); never blocks."""
+        try:
+            self._queue.put_nowait((
+                started_at,
+                scope["method"],
+                scope["path"],
+                route,
+                scope.get("query_string", b""),
+                list(scope.get("headers") or ()),
+                body,
+                status,
+                duration,
+            ))
+            self._accepted += 1
+        except queue.Full:
+            self._dropped += 1
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+    def _run(self, path: str, pending: "queue.Queue", closing: threading.Event, sanitizer: Sanitizer):
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as handle:
+            while True:
+                try:
+                    item = pending.get(timeout=0.2)
+                except queue.Empty:
+                    if closing.is_set():
+                        break
+                    continue
+                try:
+                    handle.write(json.dumps(self._entry(sanitizer, *item), separators=(",", ":")))
+                    handle.write("\n")
+                    self._written += 1
+                except Exception as exc:
+                    self._dropped += 1
+                    logger.warning("Failed to write trace record: %s", exc)
+
+    def _entry(self, sanitizer, started_at, method, path, route, query_string, headers, body, status, duration):
+        kept_headers = sanitizer.headers(headers)
+        entry: Dict[str, Any] = {
+            "ts": round(started_at, 6),
+            "method": method,
+            "path": path,
+            "route": route,
+            "query": sanitizer.query(query_string),
+            "headers": kept_headers,
+        }
+        if body is None:
+            entry["body_truncated"] = True
+        else:
+            entry.update(sanitizer.body(body, kept_headers.get("content-type", "")))
+        kind = webhook_kind(path)
+        if kind:
+            entry["signature"] = kind
+        entry["status"] = status
+        entry["duration_ms"] = round(duration * 1000, 3)
+        return entry
+
+
+def read_traces(paths: Iterable[str]) -> List[Dict[str, Any]]:
+    """Records from one or more capture files (e.g. one per worker), ordered by start time."""
+    records = []
+    for path in paths:
+        records.extend(_read_file(path))
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+def _read_file(path: str) -> Iterator[Dict[str, Any]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as handle:
+        try:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile, json.JSONDecodeError):
+            # A worker killed mid-capture leaves a truncated stream; keep what was complete
+            logger.warning("Trace file %s is truncated; using the complete records", path)
+
+
+def encode_body(record: Dict[str, Any]) -> Optional[bytes]:
+    """The request body to send when replaying `record`."""
+    if "json" in record:
+        return json.dumps(record["json"]).encode()
+    if "form" in record:
+        return urlencode([tuple(pair) for pair in record["form"]]).encode()
+    return None
+
+
+@lru_cache(maxsize=1)
+def get_trace_recorder() -> TraceRecorder:
+    return TraceRecorder()
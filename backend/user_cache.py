@@ -0,0 +1,73 @@
+"""
+Short-lived cache of authenticated users so `get_current_user` skips Firestore.
+"""
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Set, Tuple
+
+
+class UserCache:
+    """TTL + LRU cache of user docs keyed by token subject and `jti`.
+
+    Entries are also indexed by user id so profile changes, deletions and
+    preference writes can drop every cached token for that user.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_size: Optional[int] = None):
+        self.ttl = ttl_seconds if ttl_seconds is not None else float(
+            os.getenv("USER_CACHE_TTL_SECONDS", "60")
+        )
+        self.max_size = max_size or int(os.getenv("USER_CACHE_SIZE", "10000"))
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._keys_by_user: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def key(subject: str, jti: Optional[str] = None) -> str:
+        return f"{subject}:{jti}" if jti else subject
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return dict(user)
+
+    def put(self, key: str, user: Dict[str, Any]):
+        if self.ttl <= 0:
+            return
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, dict(user))
+        self._keys_by_user.setdefault(user["id"], set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate(self, user_id: str):
+        """Forget every cached token for a user after their doc changes."""
+        for key in self._keys_by_user.pop(user_id, set()):
+            self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_user.clear()
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_user.get(entry[1]["id"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                self._keys_by_user.pop(entry[1]["id"], None)
+
+
+@lru_cache(maxsize=1)
+def get_user_cache() -> UserCache:
+    """Shared instance so invalidations from any service reach `get_current_user`."""
+    return UserCache()
@@ -0,0 +1,383 @@
+"""
+Durable local queue for verified webhook payloads (Shopify, Stripe).
+
+Webhook routes verify the signature, enqueue the payload and acknowledge
+immediately; a pool of async workers drains the queue in the background.
+Jobs live in a SQLite file so a restart does not lose accepted webhooks.
+Redelivered webhooks are dropped by their delivery id, and bursts for the
+same entity (e.g. a vendor bulk-editing one product) are coalesced so only
+the newest payload inside the debounce window is processed.
+
+Several processes may share the file. A job is claimed atomically and
+leased for `WEBHOOK_QUEUE_LEASE_SECONDS`; jobs whose lease ran out (their
+worker died) go back to the queue, while jobs other workers are still
+running are left alone.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WebhookHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    last_error TEXT,
+    coalesce_key TEXT,
+    version TEXT,
+    claimed_until REAL
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_jobs_ready
+    ON webhook_jobs (status, available_at, id);
+CREATE TABLE IF NOT EXISTS webhook_seen (
+    dedup_id TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_seen_at ON webhook_seen (seen_at);
+"""
+
+_MIGRATIONS = {
+    "coalesce_key": "ALTER TABLE webhook_jobs ADD COLUMN coalesce_key TEXT",
+    "version": "ALTER TABLE webhook_jobs ADD COLUMN version TEXT",
+    "claimed_until": "ALTER TABLE webhook_jobs ADD COLUMN claimed_until REAL",
+}
+
+
+class WebhookQueue:
+    """SQLite-backed job queue with an asyncio worker pool."""
+
+    def __init__(self, path: Optional[str] = None, workers: Optional[int] = None):
+        self.path = path or os.getenv("WEBHOOK_QUEUE_PATH", "webhook_queue.sqlite3")
+        self.worker_count = workers or int(os.getenv("WEBHOOK_QUEUE_WORKERS", "4"))
+        self.max_attempts = int(os.getenv("WEBHOOK_QUEUE_MAX_ATTEMPTS", "5"))
+        self.poll_interval = float(os.getenv("WEBHOOK_QUEUE_POLL_SECONDS", "1.0"))
+        self.retry_backoff = float(os.getenv("WEBHOOK_QUEUE_RETRY_SECONDS", "5.0"))
+        # Longer than any handler runs; an expired lease means the worker died
+        self.lease_seconds = float(os.getenv("WEBHOOK_QUEUE_LEASE_SECONDS", "300"))
+        self.coalesce_window = float(os.getenv("WEBHOOK_COALESCE_SECONDS", "5.0"))
+        self.dedup_ttl = float(os.getenv("WEBHOOK_DEDUP_TTL_SECONDS", "86400"))
+        self._last_purge = 0.0
+
+        self._handlers: Dict[str, WebhookHandler] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: list = []
+
+        self._enqueued: Dict[str, int] = defaultdict(int)
+        self._processed: Dict[str, int] = defaultdict(int)
+        self._failed: Dict[str, int] = defaultdict(int)
+        self._deduplicated: Dict[str, int] = defaultdict(int)
+        self._coalesced: Dict[str, int] = defaultdict(int)
+        self._last_lag: Dict[str, float] = {}
+        self._recent: Dict[str, deque] = defaultdict(lambda: deque(maxlen=10000))
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def register(self, source: str, handler: WebhookHandler):
+        """Route jobs from `source` to `handler(topic, payload)`."""
+        self._handlers[source] = handler
+
+    async def enqueue(
+        self,
+        source: str,
+        topic: str,
+        payload: Dict[str, Any],
+        dedup_id: Optional[str] = None,
+        coalesce_key: Optional[str] = None,
+        version: Optional[str] = None,
+    ) -> Optional[int]:
+        """Persist a job and wake a worker.
+
+        Returns the job id, or None when `dedup_id` was already seen. Jobs with
+        a `coalesce_key` wait out the debounce window; a later job with the
+        same key replaces the pending payload unless its `version` is older.
+        """
+        key = self._key(source, topic)
+        job_id, outcome = await asyncio.to_thread(
+            self._insert,
+            source,
+            topic or "",
+            json.dumps(payload, default=str),
+            dedup_id,
+            coalesce_key,
+            version,
+        )
+        if outcome == "duplicate":
+            self._deduplicated[key] += 1
+            return None
+        if outcome == "coalesced":
+            self._coalesced[key] += 1
+            return job_id
+
+        self._enqueued[key] += 1
+        if self._wakeup is not None and not coalesce_key:
+            self._wakeup.set()
+        return job_id
+
+    async def start(self):
+        if self._workers:
+            return
+        await asyncio.to_thread(self._connect)
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker(index)) for index in range(self.worker_count)
+        ]
+        logger.info("Webhook queue started with %s workers (%s)", self.worker_count, self.path)
+
+    async def stop(self):
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        for task in workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    async def drain(self, timeout: float = 10.0):
+        """Wait until no runnable jobs remain (used by tests and shutdown hooks)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            depth = await asyncio.to_thread(self._depth_now)
+            if depth == 0:
+                return True
+            await asyncio.sleep(0.01)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, lag and per-topic throughput; reads SQLite, so call it off the loop."""
+        now = time.time()
+        depth, processing, dead, oldest = self._read_depth()
+        topics: Dict[str, Dict[str, Any]] = {}
+        seen_keys = set(self._enqueued) | set(self._processed) | set(self._failed)
+        for key in seen_keys | set(self._deduplicated) | set(self._coalesced):
+            recent = self._recent[key]
+            while recent and now - recent[0] > 60:
+                recent.popleft()
+            topics[key] = {
+                "enqueued": self._enqueued.get(key, 0),
+                "processed": self._processed.get(key, 0),
+                "failed": self._failed.get(key, 0),
+                "deduplicated": self._deduplicated.get(key, 0),
+                "coalesced": self._coalesced.get(key, 0),
+                "processed_last_minute": len(recent),
+                "last_lag_seconds": round(self._last_lag.get(key, 0.0), 3),
+            }
+        return {
+            "depth": depth,
+            "in_flight": processing,
+            "dead_letter": dead,
+            "oldest_pending_age_seconds": round(now - oldest, 3) if oldest else 0.0,
+            "workers": len(self._workers),
+            "topics": topics,
+        }
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+    async def _worker(self, index: int):
+        while True:
+            job = await asyncio.to_thread(self._claim)
+            if job is None:
+                if time.time() - self._last_purge > 60:
+                    self._last_purge = time.time()
+                    await asyncio.to_thread(self._purge_seen)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, source, topic, payload, enqueued_at, attempts = job
+            key = self._key(source, topic)
+            handler = self._handlers.get(source)
+            try:
+                if handler is None:
+                    raise RuntimeError(f"No webhook handler registered for {source}")
+                await handler(topic, json.loads(payload))
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self._failed[key] += 1
+                logger.exception("Webhook job %s (%s) failed: %s", job_id, key, exc)
+                await asyncio.to_thread(self._retry, job_id, attempts + 1, str(exc))
+                continue
+
+            await asyncio.to_thread(
+                self._write, "DELETE FROM webhook_jobs WHERE id = ?", (job_id,)
+            )
+            finished = time.time()
+            self._processed[key] += 1
+            self._last_lag[key] = finished - enqueued_at
+            self._recent[key].append(finished)
+
+    # ------------------------------------------------------------------
+    # SQLite helpers (run in a worker thread)
+    # ------------------------------------------------------------------
+    def _connect(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(
+                    self.path, check_same_thread=False, isolation_level=None
+                )
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.executescript(_SCHEMA)
+                columns = {
+                    row[1] for row in self._conn.execute("PRAGMA table_info(webhook_jobs)")
+                }
+                for column, statement in _MIGRATIONS.items():
+                    if column not in columns:
+                        self._conn.execute(statement)
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_webhook_jobs_coalesce "
+                    "ON webhook_jobs (coalesce_key, status)"
+                )
+
+    @contextmanager
+    def _immediate(self) -> Iterator[sqlite3.Connection]:
+        """A write transaction that holds SQLite's write lock across processes."""
+        self._connect()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _write(self, sql: str, params: Tuple) -> int:
+        self._connect()
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            return cursor.lastrowid
+
+    def _insert(
+        self,
+        source: str,
+        topic: str,
+        payload: str,
+        dedup_id: Optional[str],
+        coalesce_key: Optional[str],
+        version: Optional[str],
+    ) -> Tuple[Optional[int], str]:
+        now = time.time()
+        with self._immediate() as conn:
+            if dedup_id:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO webhook_seen (dedup_id, seen_at) VALUES (?, ?)",
+                    (f"{source}:{dedup_id}", now),
+                )
+                if cursor.rowcount == 0:
+                    return None, "duplicate"
+
+            if coalesce_key:
+                pending = conn.execute(
+                    "SELECT id, version FROM webhook_jobs "
+                    "WHERE coalesce_key = ? AND status = 'pending' ORDER BY id DESC LIMIT 1",
+                    (coalesce_key,),
+                ).fetchone()
+                if pending is not None:
+                    job_id, pending_version = pending
+                    # Out-of-order deliveries must not overwrite a newer payload
+                    if not (version and pending_version and version < pending_version):
+                        conn.execute(
+                            "UPDATE webhook_jobs SET topic = ?, payload = ?, version = ? "
+                            "WHERE id = ?",
+                            (topic, payload, version, job_id),
+                        )
+                    return job_id, "coalesced"
+
+            available_at = now + (self.coalesce_window if coalesce_key else 0)
+            cursor = conn.execute(
+                "INSERT INTO webhook_jobs "
+                "(source, topic, payload, enqueued_at, available_at, coalesce_key, version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, topic, payload, now, available_at, coalesce_key, version),
+            )
+            return cursor.lastrowid, "enqueued"
+
+    def _purge_seen(self):
+        self._write(
+            "DELETE FROM webhook_seen WHERE seen_at < ?", (time.time() - self.dedup_ttl,)
+        )
+
+    def _claim(self) -> Optional[Tuple]:
+        now = time.time()
+        with self._immediate() as conn:
+            # Jobs whose worker died mid-flight go back to the queue (or to the dead letters)
+            conn.execute(
+                "UPDATE webhook_jobs SET attempts = attempts + 1, "
+                "status = CASE WHEN attempts + 1 >= ? THEN 'dead' ELSE 'pending' END, "
+                "last_error = 'claim lease expired', claimed_until = NULL "
+                "WHERE status = 'processing' AND claimed_until < ?",
+                (self.max_attempts, now),
+            )
+            rows = conn.execute(
+                "UPDATE webhook_jobs SET status = 'processing', claimed_until = ? "
+                "WHERE id = (SELECT id FROM webhook_jobs "
+                "WHERE status = 'pending' AND available_at <= ? ORDER BY id LIMIT 1) "
+                "AND status = 'pending' "
+                "RETURNING id, source, topic, payload, enqueued_at, attempts",
+                (now + self.lease_seconds, now),
+            ).fetchall()
+            return rows[0] if rows else None
+
+    def _retry(self, job_id: int, attempts: int, error: str):
+        status = "dead" if attempts >= self.max_attempts else "pending"
+        delay = self.retry_backoff * (2 ** (attempts - 1))
+        self._write(
+            "UPDATE webhook_jobs SET status = ?, attempts = ?, last_error = ?, available_at = ?, "
+            "claimed_until = NULL WHERE id = ?",
+            (status, attempts, error[:500], time.time() + delay, job_id),
+        )
+
+    def _depth_now(self) -> int:
+        depth, processing, _, _ = self._read_depth()
+        return depth + processing
+
+    def _read_depth(self) -> Tuple[int, int, int, Optional[float]]:
+        if self._conn is None:
+            return 0, 0, 0, None
+        with self._lock:
+            counts = dict(
+                self._conn.execute(
+                    "SELECT status, COUNT(*) FROM webhook_jobs GROUP BY status"
+                ).fetchall()
+            )
+            oldest = self._conn.execute(
+                "SELECT MIN(enqueued_at) FROM webhook_jobs WHERE status = 'pending'"
+            ).fetchone()[0]
+        return (
+            counts.get("pending", 0),
+            counts.get("processing", 0),
+            counts.get("dead", 0),
+            oldest,
+        )
+
+    @staticmethod
+    def _key(source: str, topic: str) -> str:
+        return f"{source}:{topic or 'unknown'}"